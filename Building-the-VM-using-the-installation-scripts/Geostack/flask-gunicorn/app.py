@@ -13,9 +13,13 @@ Last Changes:
 
 # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
 # 0) Import the required modules or functions from modules.
-from flask import Flask, render_template
+from flask import Flask, render_template, Response, stream_with_context, request, send_file
 # Flask is used to create a WSGI application object called 'app'
 # render_template is used to serve static HTML files from the templates folder.
+# Response and stream_with_context are used to send query results to the
+# Angular applications in chunks, while they are still being read from MongoDB.
+# request is used to read the query parameters and headers of a request.
+# send_file is used to serve the data profiles from the cache on disk.
 
 '''
 The PyMongo module is used to create MongoDB queries and connections to
@@ -25,37 +29,82 @@ from flask_pymongo import PyMongo
 
 '''
 The psycopg2 package is used to create PostgreSQL queries and connections
-to our PostgreSQL databases
+to our PostgreSQL databases. The ThreadedConnectionPool keeps the connections
+open between requests. The contextmanager decorator is used to borrow a
+connection from the pool and return it afterwards. The uuid module is used to
+give every server-side cursor a unique name.
 '''
 import psycopg2
+from psycopg2.pool import ThreadedConnectionPool
+from contextlib import contextmanager
+import uuid
 
 '''
 The ObjectId module is used to transform an Id passed by the Angular application
 to a valid MongoDB id.
+The InvalidId error is raised when the Id is not a valid MongoDB id.
 The json_util module is used to convert the BSON, which is returned by MongoDB,
 into a valid JSON format
 '''
 from bson.objectid import ObjectId
+from bson.errors import InvalidId
 from bson import json_util
 
 '''
 The pandas and pandas_profiling packages are used to create data profiles of
-the datasets in our MongoDB datastore
+the datasets in our MongoDB datastore. The profiles are created in the
+background by a ProcessPoolExecutor, which connects to MongoDB with its own
+MongoClient. The time and traceback modules are used to keep track of the
+profile jobs.
 '''
 import pandas as pd
 import pandas_profiling
+from concurrent.futures import ProcessPoolExecutor
+from pymongo import MongoClient
+import time
+import traceback
+
+'''
+The NumPy package is used to pack the coordinates and times of a track into
+typed arrays, which are sent to the Angular applications in a binary format.
+'''
+import numpy as np
 
 
 '''
-The urlopen and BeautifulSoup modules are used to parse the HTML page,
-which contains our all tilestache configuration entries, from the NGINX Webserver.
+The BeautifulSoup module is used to parse the HTML page (entries.html) which
+contains our tilestache configuration entries.
 The datetime module is used to convert datetime strings to a valid datetime format.
 '''
-from urllib.request import urlopen
 from bs4 import BeautifulSoup
-from datetime import datetime
+from datetime import datetime, timedelta
 import json
 
+'''
+The base64 module is used to encode the position of the last document of a
+page into an opaque continuation token, which is passed back by the Angular
+applications to request the next page.
+'''
+import base64
+
+'''
+The mapbox_vector_tile package is used to encode the transmissions and signals
+in a map tile as a Mapbox Vector Tile. The Shapely package (installed together
+with mapbox_vector_tile) is used to clip the tracks to the tile. The os and
+shutil modules are used to store the vector tiles and heatmaps in a cache on
+disk.
+'''
+import mapbox_vector_tile
+from shapely.geometry import LineString, Point, box
+import os
+import shutil
+
+'''
+The hashlib module is used to create the ETag of the tilestache entries, which
+tells the Angular applications whether the entries have changed.
+'''
+import hashlib
+
 # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
 # 1) Create a WSGI webserver application with the script file name (__name__).
 #    Note: passing __name__ as a parameter makes it possible for the app object
@@ -81,6 +130,1266 @@ app.config.from_pyfile('config.py')
 # 3) Connect to the Crane Database
 crane_connection= PyMongo(app, uri=app.config["CRANE_DATABASE_URI"])
 
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+# 3.1) Create a generic function which streams the results of a query as a
+#      JSON array.
+#
+#      Calling list() on a PyMongo cursor loads every document in the memory
+#      of the Gunicorn worker before the first byte is sent to the browser.
+#      This function reads the cursor in batches and encodes each batch as
+#      soon as it arrives, so the memory used per request stays the same no
+#      matter how many documents the query returns.
+#
+#      The function expects the following parameter:
+#      1) The results of a PyMongo query (a cursor) or any other iterable
+#         containing documents.
+#
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+def stream_json(query_result):
+
+    # The amount of documents which are read from MongoDB and encoded at once.
+    # The value is defined in the config.py file.
+    batch_size = app.config["STREAM_BATCH_SIZE"]
+
+    # If the query result is a PyMongo cursor, we tell MongoDB to return the
+    # documents in batches of the same size.
+    if hasattr(query_result, "batch_size"):
+        query_result = query_result.batch_size(batch_size)
+
+    # Here we create a generator which yields the JSON array piece by piece.
+    def generate():
+
+        # Open the JSON array.
+        yield '['
+
+        # The batch of encoded documents which is waiting to be sent and a
+        # variable which tells us if a "," is needed before the next batch.
+        batch = []
+        first_batch = True
+
+        # Encode each document and send the batch once it is full.
+        for document in query_result:
+            batch.append(json.dumps(document, default=json_util.default))
+
+            if len(batch) == batch_size:
+                yield ('' if first_batch else ',') + ','.join(batch)
+                batch = []
+                first_batch = False
+
+        # Send the remaining documents of the last (partial) batch.
+        if batch:
+            yield ('' if first_batch else ',') + ','.join(batch)
+
+        # Close the JSON array.
+        yield ']'
+
+    # Return the generator as a chunked HTTP response. stream_with_context
+    # keeps the request context alive while the generator is running.
+    response = Response(stream_with_context(generate()),
+                        mimetype='application/json')
+
+    # If the query result can be closed (Ex.: the rows of stream_pgsql()), it
+    # is closed when the response is closed. This also happens when the
+    # client disconnects before the generator is started.
+    if hasattr(query_result, "close"):
+        response.call_on_close(query_result.close)
+
+    return response
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+# 3.2) Create the functions which encode and decode the continuation token
+#      used to page through all the documents of a tracker or trail.
+#
+#      The token contains the time and the MongoID of the last document of a
+#      page. Since the pages are sorted on (time, MongoID), the next page
+#      starts directly after this position. The token is encoded with base64
+#      so the Angular applications can treat it as an opaque string.
+#
+#      If the documents are stored in buckets, the token contains the MongoID
+#      of the bucket and the position (offset) of the last document in the
+#      bucket as well. An unknown time is stored as an empty string.
+#      A token which can't be decoded raises a ValueError.
+#
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+def datetime_to_milliseconds(time):
+
+    # Convert the datetime to the amount of milliseconds since 1970-01-01.
+    # MongoDB stores datetimes with a precision of milliseconds, so no
+    # information is lost.
+    return (time - datetime(1970, 1, 1)) // timedelta(milliseconds=1)
+
+def encode_page_token(time, document_id, offset=None):
+
+    # Join the time in milliseconds, the MongoID and the offset and encode
+    # them as an URL safe base64 string.
+    parts = ['' if time is None else str(datetime_to_milliseconds(time)),
+             str(document_id)]
+    if offset is not None:
+        parts.append(str(offset))
+
+    token = ':'.join(parts)
+    return base64.urlsafe_b64encode(token.encode('utf-8')).decode('utf-8')
+
+def decode_page_token(token):
+
+    try:
+        # Decode the base64 string and split it in the time, the MongoID and
+        # the offset, if there is one.
+        parts = base64.urlsafe_b64decode(token.encode('utf-8')).decode('utf-8').split(':')
+        milliseconds, document_id = parts[0], parts[1]
+        offset = int(parts[2]) if len(parts) > 2 else None
+
+        # Convert the values back to a datetime, an ObjectId and an integer.
+        time = None
+        if milliseconds:
+            time = datetime(1970, 1, 1) + timedelta(milliseconds=int(milliseconds))
+
+        return time, ObjectId(document_id), offset
+
+    # A token which was changed or cut off can't be decoded.
+    except (ValueError, IndexError, OverflowError, InvalidId):
+        raise ValueError("Invalid page token: " + token)
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+# 3.3) Create a generic function which returns one page of documents
+#      belonging to a tracker or trail (keyset pagination).
+#
+#      Instead of skipping the documents of the previous pages, we search for
+#      the documents which come after the position stored in the token. With
+#      the compound index on (reference, time, _id) every page is a single
+#      index seek, so the 100th page is as fast as the first one. MongoDB
+#      sorts the documents without a time before the other documents, so
+#      after such a document the page continues on the MongoID.
+#
+#      If the documents are stored in buckets, the function: "bucket_page()"
+#      seeks to the bucket of the last document of the previous page with
+#      the index on (reference, start), and unpacks the buckets from the
+#      position after that document.
+#
+#      The function expects the following parameters:
+#      1) The collection on which the query is performed
+#         Ex.: crane_connection.db.transmission
+#      2) The collection containing the buckets, or None if the documents
+#         are not stored in buckets
+#         Ex.: crane_connection.db.transmission_bucket
+#      3) The name of the field which references the tracker or trail
+#         Ex.: "tracker"
+#      4) The name of the field which contains the time of the document
+#         Ex.: "timestamp"
+#      5) The unpack function of the buckets
+#         Ex.: transmission_from_bucket
+#      6) The MongoID of the tracker or trail
+#      7) The amount of documents on the page
+#      8) The continuation token returned with the previous page, or None
+#         for the first page. An invalid token results in a 400 response.
+#
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+
+# Here we create the function which returns one page of documents which are
+# stored in buckets, and the token of the next page. The position of the
+# last document of the previous page is passed as the decoded token.
+def bucket_page(bucket_collection, reference_field, time_field, unpack,
+                id, amount, position):
+
+    query = {reference_field: ObjectId(id)}
+
+    # The bucket and the position in the bucket of the last document of the
+    # previous page, and the time after which the documents are returned if
+    # that bucket no longer exists.
+    bucket_id, offset, after = None, -1, None
+
+    if position is not None:
+        time, bucket_id, offset = position
+        bucket = bucket_collection.find_one({"_id": bucket_id}, {"start": 1})
+
+        # Start at the bucket of the token. The bucket with the documents
+        # without a time (start None) is the first bucket of a track.
+        if bucket is not None and bucket["start"] is not None:
+            query["start"] = {"$gte": bucket["start"]}
+
+        # If the bucket was removed (Ex.: the dataset was imported again), we
+        # continue after the time of the token instead.
+        elif bucket is None:
+            bucket_id, offset, after = None, -1, time
+            if time is not None:
+                query["end"] = {"$gte": time}
+
+    page = []
+    next_token = None
+
+    for bucket in bucket_collection.find(query).sort("start", 1):
+
+        first = offset + 1 if bucket["_id"] == bucket_id else 0
+
+        for i in range(first, bucket["count"]):
+
+            time = bucket[time_field][i]
+            if after is not None and (time is None or not time > after):
+                continue
+
+            page.append(unpack(bucket, i))
+
+            # If the page is full, create the token pointing to this document.
+            if len(page) == amount:
+                next_token = encode_page_token(time or bucket["start"],
+                                               bucket["_id"], i)
+                return page, next_token
+
+    return page, next_token
+
+def query_page(collection, bucket_collection, reference_field, time_field,
+               unpack, id, amount, token):
+
+    # The amount of documents on a page is limited by the value of
+    # MAX_PAGE_SIZE in the config.py file.
+    amount = min(int(amount), app.config["MAX_PAGE_SIZE"])
+
+    # The position of the last document of the previous page.
+    position = None
+    if token is not None:
+        try:
+            position = decode_page_token(token)
+        except ValueError:
+            return Response("Invalid page_token", status=400)
+
+    # If the documents are stored in buckets, the page is unpacked from the
+    # buckets.
+    if bucket_collection is not None:
+        page, next_token = [], None
+        if amount > 0:
+            page, next_token = bucket_page(bucket_collection, reference_field,
+                                           time_field, unpack, id, amount, position)
+
+        return Response(json.dumps({"data": page, "next": next_token},
+                                   default=json_util.default),
+                        mimetype='application/json')
+
+    # Without a token we start at the beginning of the track.
+    if position is None:
+        query = {reference_field: ObjectId(id)}
+
+    # If the last document has no time, we search for the other documents
+    # without a time with a higher MongoID, and all the documents with a time.
+    elif position[0] is None:
+        document_id = position[1]
+        query = {"$or": [
+            {reference_field: ObjectId(id), time_field: None,
+             "_id": {"$gt": document_id}},
+            {reference_field: ObjectId(id), time_field: {"$ne": None}}
+        ]}
+
+    # With a token we search for the documents with a later time, or with the
+    # same time and a higher MongoID. The tracker or trail is added to both
+    # parts of the "$or", so each part can use the compound index.
+    else:
+        time, document_id, offset = position
+        query = {"$or": [
+            {reference_field: ObjectId(id), time_field: {"$gt": time}},
+            {reference_field: ObjectId(id), time_field: time,
+             "_id": {"$gt": document_id}}
+        ]}
+
+    # Perform the query sorted on (time, MongoID). Since the page is bounded
+    # by the amount, we can safely convert the results to a list.
+    page = list(collection.find(query)
+                          .sort([(time_field, 1), ("_id", 1)])
+                          .limit(amount))
+
+    # If the page is full, there might be more documents. Create the token
+    # pointing to the last document of this page. Otherwise we have reached
+    # the end of the track and the token is None.
+    next_token = None
+    if len(page) == amount and amount > 0:
+        next_token = encode_page_token(page[-1][time_field], page[-1]["_id"])
+
+    # Return the page and the token as JSON.
+    return Response(json.dumps({"data": page, "next": next_token},
+                               default=json_util.default),
+                    mimetype='application/json')
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+# 3.4) Create a generic function which returns the simplified copy of a track
+#      that matches a zoom level of the map.
+#
+#      The import scripts create simplified copies of each track for a number
+#      of zoom levels (the level of detail pyramid). We return the most
+#      detailed copy which was created for a zoom level lower than or equal
+#      to the zoom level of the map. If the map is zoomed out further than
+#      the lowest level, the lowest level is returned.
+#
+#      The function expects the following parameters:
+#      1) The collection containing the simplified tracks
+#         Ex.: crane_connection.db.transmission_level
+#      2) The name of the field which references the tracker or trail
+#         Ex.: "tracker"
+#      3) The MongoID of the tracker or trail
+#      4) The zoom level of the map
+#
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+def query_level(collection, reference_field, id, zoom):
+
+    # Search for the most detailed level below or at the zoom level.
+    query_result = collection.find_one(
+        {reference_field: ObjectId(id), "zoom": {"$lte": int(zoom)}},
+        sort=[("zoom", -1)])
+
+    # If there is no such level, return the least detailed level.
+    if query_result is None:
+        query_result = collection.find_one(
+            {reference_field: ObjectId(id)}, sort=[("zoom", 1)])
+
+    # Return the simplified track as JSON.
+    return Response(json.dumps(query_result, default=json_util.default),
+                    mimetype='application/json')
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+# 3.5) Create the functions which return a track in a compact binary format.
+#
+#      Instead of a JSON object per transmission or signal, the binary format
+#      contains one typed array per column. The Angular applications can read
+#      these arrays directly with a Float64Array or BigInt64Array view,
+#      without parsing any text.
+#
+#      The binary format has the following layout (all values little-endian):
+#      - 4 bytes : the characters "GSTK"
+#      - 4 bytes : the amount of points (N) as an unsigned 32 bit integer
+#      - N x 8 bytes : the longitudes as 64 bit floats
+#      - N x 8 bytes : the latitudes as 64 bit floats
+#      - N x 8 bytes : the altitudes as 64 bit floats (NaN if unknown)
+#      - N x 8 bytes : the times in milliseconds since 1970-01-01 as 64 bit
+#                      integers
+#
+#      Since the header is 8 bytes long, every array starts at a multiple of
+#      8 bytes, which is required to create a Float64Array view on it.
+#
+#      The binary format is returned if the request contains the query
+#      parameter: "?format=binary", or if the Angular application prefers
+#      the content type: "application/octet-stream".
+#
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+def binary_requested():
+    return (request.args.get('format') == 'binary' or
+            request.accept_mimetypes.best == 'application/octet-stream')
+
+# Here we create a function which returns the projection of a track query.
+# If the binary format is requested, MongoDB only has to return the geometry
+# and the time of each document. Otherwise all the fields are returned.
+def track_projection(time_field):
+    if binary_requested():
+        return {"_id": 0, "geometry": 1, time_field: 1}
+    return None
+
+# Here we create the function which returns the results of a track query
+# in the requested format.
+#
+# The function expects the following parameters:
+# 1) The results of a PyMongo query
+# 2) The name of the field which contains the time of a document
+#    Ex.: "timestamp"
+def track_response(query_result, time_field):
+
+    # If the binary format is not requested we stream the results as JSON.
+    if not binary_requested():
+        return stream_json(query_result)
+
+    # Create a list for each column of the track.
+    lon, lat, alt, time = [], [], [], []
+
+    for document in query_result:
+        geometry = document.get("geometry", {})
+        coordinates = geometry.get("coord", {}).get("coordinates", [None, None])
+
+        lon.append(coordinates[0])
+        lat.append(coordinates[1])
+        alt.append(geometry.get("alt"))
+
+        # Unknown times are stored as the lowest possible 64 bit integer.
+        if document.get(time_field) is None:
+            time.append(np.iinfo('<i8').min)
+        else:
+            time.append(datetime_to_milliseconds(document[time_field]))
+
+    # Create the header containing the characters "GSTK" and the amount of
+    # points.
+    header = b'GSTK' + np.array([len(time)], dtype='<u4').tobytes()
+
+    # Convert the columns to little-endian typed arrays. Unknown values in
+    # the float columns (None) are converted to NaN.
+    body = b''.join([np.array(lon, dtype='<f8').tobytes(),
+                     np.array(lat, dtype='<f8').tobytes(),
+                     np.array(alt, dtype='<f8').tobytes(),
+                     np.array(time, dtype='<i8').tobytes()])
+
+    # Return the binary track.
+    return Response(header + body, mimetype='application/octet-stream')
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+# 3.6) Create the functions which unpack the buckets of transmissions and
+#      signals.
+#
+#      The import scripts can store the transmissions (or signals) of a
+#      tracker (or trail) in buckets: one document per day (or hour) which
+#      contains a list for each field. The layout which is used is defined by
+#      CRANE_STORAGE_LAYOUT and TRAIL_STORAGE_LAYOUT in the config.py file.
+#
+#      The functions below convert the buckets back to transmissions and
+#      signals, so the Angular applications receive the same JSON in both
+#      layouts.
+#
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+
+# Here we create a function which converts the value at position "i" of the
+# lists in a transmission bucket to a transmission.
+def transmission_from_bucket(bucket, i):
+    return {"event_id": bucket["event_id"][i],
+            "timestamp": bucket["timestamp"][i],
+            "geometry": {"coord": {"type": "Point",
+                                   "coordinates": bucket["coords"][i]},
+                         "alt": bucket["alt"][i]},
+            "speed": {"ground_speed": bucket["ground_speed"][i]},
+            "metadata": {"visible": bucket["visible"][i],
+                         "sensor_type": bucket["sensor_type"][i],
+                         "tag_voltage": bucket["tag_voltage"][i]},
+            "tracker": bucket["tracker"]}
+
+# Here we create a function which converts the value at position "i" of the
+# lists in a signal bucket to a signal.
+def signal_from_bucket(bucket, i):
+    return {"time": bucket["time"][i],
+            "geometry": {"coord": {"type": "Point",
+                                   "coordinates": bucket["coords"][i]},
+                         "alt": bucket["alt"][i]},
+            "trail": bucket["trail"]}
+
+# Here we create the generator which unpacks the buckets.
+#
+# The function expects the following parameters:
+# 1) The results of a query on the buckets, sorted on the field: "start"
+# 2) The function which converts a value in a bucket to a document
+#    Ex.: transmission_from_bucket
+# 3) The name of the time field
+#    Ex.: "timestamp"
+# 4) Optionally a start and an end time. Only the documents after the start
+#    and before the end are returned.
+# 5) Optionally the positions of the documents which are returned, as a
+#    dictionary with a set of positions for the MongoID of every bucket
+#    (see positions_in_polygon).
+# 6) Optionally the maximum amount of documents which are returned.
+def unpack_buckets(query_result, unpack, time_field,
+                   start=None, end=None, positions=None, limit=None):
+
+    count = 0
+
+    for bucket in query_result:
+
+        for i in range(bucket["count"]):
+
+            # Skip the values outside of the time range and the polygon.
+            time = bucket[time_field][i]
+            if start is not None and (time is None or not time > start):
+                continue
+            if end is not None and (time is None or not time < end):
+                continue
+            if positions is not None and i not in positions[bucket["_id"]]:
+                continue
+
+            # Stop when the maximum amount of documents is reached.
+            if limit is not None and count >= limit:
+                return
+
+            count += 1
+            yield unpack(bucket, i)
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+# 3.7) Create a generic function which returns the trackers or trails of
+#      which the track intersects with the viewport of a map.
+#
+#      The import scripts store the envelope (the convex hull) of every
+#      track on the tracker or trail, with a 2dsphere index. The map viewers
+#      can use this function to skip the tracks outside of the viewport,
+#      without downloading any transmissions or signals.
+#
+#      MongoDB connects the points of a polygon with great circles, which
+#      bend towards the poles. To follow the lines of latitude of the
+#      viewport, a point is added to the top and bottom edge every degree. A
+#      viewport which is wider than 90 degrees, or which crosses the
+#      antimeridian (the first longitude is bigger than the second), is split
+#      in multiple polygons.
+#
+#      The function expects the following parameters:
+#      1) The collection containing the trackers or trails
+#         Ex.: crane_connection.db.tracker
+#      2) The viewport as one string: "min_lon,min_lat,max_lon,max_lat"
+#
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+
+# Here we create a function which returns the polygon of a part of the
+# viewport, which is not wider than 90 degrees.
+def viewport_polygon(min_lon, min_lat, max_lon, max_lat):
+
+    # The longitudes of the points on the top and bottom edge.
+    steps = max(int(np.ceil(max_lon - min_lon)), 1)
+    lons = np.linspace(min_lon, max_lon, steps + 1).tolist()
+
+    ring = ([[lon, min_lat] for lon in lons] +
+            [[lon, max_lat] for lon in reversed(lons)])
+
+    # Close the ring by repeating the first point.
+    ring.append(ring[0])
+
+    return {"type": "Polygon", "coordinates": [ring]}
+
+# Here we create a function which converts the viewport to a list of
+# polygons.
+def viewport_polygons(coords):
+
+    min_lon, min_lat, max_lon, max_lat = [float(i) for i in coords.split(',')]
+
+    # The points of a polygon at the poles would all be the same point.
+    min_lat = max(min_lat, -89.99)
+    max_lat = min(max_lat, 89.99)
+
+    # A viewport without a height contains no polygons.
+    if min_lat >= max_lat:
+        return []
+
+    # A viewport which crosses the antimeridian is split in two parts.
+    if min_lon > max_lon:
+        ranges = [(min_lon, 180.0), (-180.0, max_lon)]
+    else:
+        ranges = [(max(min_lon, -180.0), min(max_lon, 180.0))]
+
+    polygons = []
+
+    for first, last in ranges:
+        for start in np.arange(first, last, 90.0):
+            polygons.append(viewport_polygon(float(start),
+                                             min_lat,
+                                             float(min(start + 90.0, last)),
+                                             max_lat))
+
+    return polygons
+
+# Here we create the function which performs the query.
+def query_viewport(collection, coords):
+
+    polygons = viewport_polygons(coords)
+
+    # A viewport without a width or height (Ex.: after it is clamped to the
+    # poles) contains no trackers or trails.
+    if not polygons:
+        return stream_json([])
+
+    # Every polygon is a separate part of the "$or", so each part can use the
+    # 2dsphere index on the envelope.
+    query_result = collection.find(
+        {"$or": [{"envelope": {"$geoIntersects": {"$geometry": polygon}}}
+                 for polygon in polygons]})
+
+    # Stream the trackers or trails in a valid JSON format.
+    return stream_json(query_result)
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+# 3.8) Create the generic functions which return a sample of a track that
+#      spans the whole period of the track.
+#
+#      A track can contain millions of transmissions or signals, while a map
+#      or a chart only needs a few thousand points. The functions below
+#      return at most MAX_SAMPLE_POINTS points (defined in the config.py
+#      file), spread over the complete track:
+#      - By stride: every n-th point of the track. The import scripts give
+#        every point a sequence number (the field: "seq"), so the points are
+#        found with a single lookup on the index on (reference, seq).
+#      - By interval: one point per interval of time (Ex.: "30m", "6h" or
+#        "1d"), calculated by MongoDB with an aggregation pipeline. With the
+#        method "first" the first point of each interval is returned, with
+#        the method "average" the average position and altitude. If the
+#        interval is too small for the period of the track, it is enlarged.
+#
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+
+# The amount of milliseconds of each unit of an interval.
+INTERVAL_UNITS = {"m": 60 * 1000, "h": 60 * 60 * 1000, "d": 24 * 60 * 60 * 1000}
+
+# Here we create a function which converts an interval (Ex.: "30m") to an
+# amount of milliseconds.
+def interval_to_milliseconds(interval):
+    return int(float(interval[:-1]) * INTERVAL_UNITS[interval[-1]])
+
+# Here we create a function which returns the sequence numbers of the points
+# which are sampled from a track. The first and the last point of the track
+# are always part of the sample.
+def stride_positions(last_seq, amount):
+
+    if amount <= 1 or last_seq <= 0:
+        return [0][:amount]
+
+    stride = max(int(np.ceil(last_seq / (amount - 1))), 1)
+
+    return list(range(0, last_seq, stride)) + [last_seq]
+
+# Here we create a function which returns the interval that is used to sample
+# a track. The interval is enlarged if the period between the first and the
+# last time would contain more than MAX_SAMPLE_POINTS intervals.
+def sample_interval(interval, first, last):
+
+    milliseconds = interval_to_milliseconds(interval)
+
+    if first is not None and last is not None:
+        period = datetime_to_milliseconds(last) - datetime_to_milliseconds(first)
+        milliseconds = max(milliseconds,
+                           int(np.ceil((period + 1) / app.config["MAX_SAMPLE_POINTS"])))
+
+    return max(milliseconds, 1)
+
+# Here we create a function which returns the first document of every
+# interval. The documents must be sorted by time. It is used to sample the
+# tracks which are stored in buckets.
+def first_per_interval(documents, time_field, milliseconds):
+
+    last_key = None
+
+    for document in documents:
+        if document[time_field] is None:
+            continue
+
+        key = datetime_to_milliseconds(document[time_field]) // milliseconds
+
+        if key != last_key:
+            last_key = key
+            yield document
+
+# Here we create a function which returns the average position and altitude
+# of the documents of every interval, in the same structure as the results of
+# the "average" method of query_interval(). The documents must be sorted by
+# time. It is used to sample the tracks which are stored in buckets.
+def average_per_interval(documents, time_field, milliseconds):
+
+    group = None
+
+    for document in documents:
+        if document[time_field] is None:
+            continue
+
+        key = datetime_to_milliseconds(document[time_field]) // milliseconds
+
+        # Return the average of the previous interval when a new one starts.
+        if group is not None and key != group["key"]:
+            yield interval_average(group, time_field)
+            group = None
+
+        if group is None:
+            group = {"key": key, "time": document[time_field],
+                     "lon": [], "lat": [], "alt": [], "count": 0}
+
+        group["count"] += 1
+
+        # Unknown values are skipped, in the same way as "$avg" does.
+        coordinates = document["geometry"]["coord"]["coordinates"] or [None, None]
+        for field, value in (("lon", coordinates[0]), ("lat", coordinates[1]),
+                             ("alt", document["geometry"]["alt"])):
+            if value is not None:
+                group[field].append(value)
+
+    if group is not None:
+        yield interval_average(group, time_field)
+
+# Here we create a function which returns the averages of an interval.
+def interval_average(group, time_field):
+
+    lon, lat, alt = [sum(group[field]) / len(group[field]) if group[field] else None
+                     for field in ("lon", "lat", "alt")]
+
+    return {time_field: group["time"],
+            "geometry": {"coord": {"type": "Point", "coordinates": [lon, lat]},
+                         "alt": alt},
+            "count": group["count"]}
+
+# The lists of the transmission and signal buckets. They are used to read a
+# part of the lists of a bucket with "$slice".
+BUCKET_LIST_FIELDS = {
+    "transmission_bucket": ["event_id", "timestamp", "coords", "alt",
+                            "ground_speed", "visible", "sensor_type",
+                            "tag_voltage", "port_id", "port_distance"],
+    "signal_bucket": ["time", "coords", "alt"],
+}
+
+# Here we create the generator which returns the documents at the positions
+# of a sample of a track which is stored in buckets. The positions are
+# counted with the amount of documents in each bucket, so buckets without a
+# position in the sample are not read at all. Of the other buckets only the
+# part of the lists between the first and the last position is read.
+#
+# The function expects the following parameters:
+# 1) The collection containing the buckets
+# 2) The MongoID and the amount of documents of every bucket of the track,
+#    sorted on the field: "start"
+# 3) The sorted positions of the documents in the whole track
+# 4) The unpack function of the buckets
+def stride_from_buckets(bucket_collection, buckets, positions, unpack):
+
+    fields = BUCKET_LIST_FIELDS[bucket_collection.name]
+
+    offset = 0
+    next_position = 0
+
+    for bucket in buckets:
+
+        # The positions inside of this bucket, relative to the bucket.
+        inside = []
+        while (next_position < len(positions) and
+               positions[next_position] < offset + bucket["count"]):
+            inside.append(positions[next_position] - offset)
+            next_position += 1
+
+        if inside:
+            first = inside[0]
+            length = inside[-1] - first + 1
+
+            part = bucket_collection.find_one(
+                {"_id": bucket["_id"]},
+                {field: {"$slice": [first, length]} for field in fields})
+
+            for position in inside:
+                yield unpack(part, position - first)
+
+        offset += bucket["count"]
+
+# Here we create the function which samples a track by stride.
+#
+# The function expects the following parameters:
+# 1) The collection containing the transmissions or signals
+#    Ex.: crane_connection.db.transmission
+# 2) The collection containing the buckets of transmissions or signals, or
+#    None if the track is not stored in buckets
+# 3) The name of the field which references the tracker or trail
+# 4) The name of the field which contains the time of a document
+# 5) The unpack function of the buckets
+#    Ex.: transmission_from_bucket
+# 6) The MongoID of the tracker or trail
+# 7) The maximum amount of points of the sample
+def query_stride(collection, bucket_collection, reference_field, time_field,
+                 unpack, id, amount):
+
+    amount = min(int(amount), app.config["MAX_SAMPLE_POINTS"])
+
+    # If the track is stored in buckets, the positions are found with the
+    # amount of documents in each bucket.
+    if bucket_collection is not None:
+        buckets = list(bucket_collection.find(
+            {reference_field: ObjectId(id)}, {"count": 1}).sort("start", 1))
+
+        total = sum(bucket["count"] for bucket in buckets)
+        positions = stride_positions(total - 1, amount) if total > 0 else []
+
+        return track_response(stride_from_buckets(bucket_collection, buckets,
+                                                  positions, unpack), time_field)
+
+    # Find the highest sequence number of the track.
+    last = collection.find_one({reference_field: ObjectId(id)},
+                               {"seq": 1}, sort=[("seq", -1)])
+
+    positions = []
+    if last is not None and last.get("seq") is not None:
+        positions = stride_positions(last["seq"], amount)
+
+    query_result = collection.find(
+        {reference_field: ObjectId(id), "seq": {"$in": positions}},
+        track_projection(time_field)).sort("seq", 1)
+
+    # Return the results as a JSON array or in the binary format
+    return track_response(query_result, time_field)
+
+# Here we create the function which samples a track by interval. It expects
+# the same parameters as query_stride(), except that the amount is replaced
+# by the interval and the method (Ex.: "first" or "average").
+def query_interval(collection, bucket_collection, reference_field, time_field,
+                   unpack, id, interval, method):
+
+    # If the track is stored in buckets, the first document or the average of
+    # each interval is calculated while the buckets are unpacked.
+    if bucket_collection is not None:
+        first = bucket_collection.find_one({reference_field: ObjectId(id)},
+                                           sort=[("start", 1)])
+        last = bucket_collection.find_one({reference_field: ObjectId(id)},
+                                          sort=[("start", -1)])
+        milliseconds = sample_interval(interval,
+                                       first and first["start"],
+                                       last and last["end"])
+
+        sample = average_per_interval if method == "average" else first_per_interval
+
+        return track_response(sample(unpack_buckets(
+            bucket_collection.find(
+                {reference_field: ObjectId(id)}).sort("start", 1),
+            unpack, time_field), time_field, milliseconds), time_field)
+
+    # Find the first and the last time of the track.
+    first = collection.find_one({reference_field: ObjectId(id)},
+                                {time_field: 1}, sort=[(time_field, 1)])
+    last = collection.find_one({reference_field: ObjectId(id)},
+                               {time_field: 1}, sort=[(time_field, -1)])
+    milliseconds = sample_interval(interval,
+                                   first and first[time_field],
+                                   last and last[time_field])
+
+    # The interval of a document is its time in milliseconds, rounded down
+    # to a multiple of the interval.
+    time_in_milliseconds = {"$subtract": ["$" + time_field, datetime(1970, 1, 1)]}
+    interval_start = {"$subtract": [time_in_milliseconds,
+                                    {"$mod": [time_in_milliseconds, milliseconds]}]}
+
+    if method == "average":
+        # Calculate the average position and altitude of each interval, and
+        # return them in the same structure as a transmission or signal.
+        stages = [
+            {"$group": {
+                "_id": interval_start,
+                "time": {"$first": "$" + time_field},
+                "lon": {"$avg": {"$arrayElemAt": ["$geometry.coord.coordinates", 0]}},
+                "lat": {"$avg": {"$arrayElemAt": ["$geometry.coord.coordinates", 1]}},
+                "alt": {"$avg": "$geometry.alt"},
+                "count": {"$sum": 1}}},
+            {"$project": {
+                "_id": 0,
+                time_field: "$time",
+                "geometry": {"coord": {"type": "Point",
+                                       "coordinates": ["$lon", "$lat"]},
+                             "alt": "$alt"},
+                "count": 1}},
+        ]
+    else:
+        # Return the first document of each interval.
+        stages = [
+            {"$group": {"_id": interval_start, "document": {"$first": "$$ROOT"}}},
+            {"$replaceRoot": {"newRoot": "$document"}},
+        ]
+
+    # The documents are sorted by time using the index on (reference, time),
+    # so "$first" returns the first document of each interval.
+    query_result = collection.aggregate(
+        [{"$match": {reference_field: ObjectId(id), time_field: {"$ne": None}}},
+         {"$sort": {time_field: 1}}] +
+        stages +
+        [{"$sort": {time_field: 1}}],
+        allowDiskUse=True)
+
+    # Return the results as a JSON array or in the binary format
+    return track_response(query_result, time_field)
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+# 3.9) Create the functions which store results in a cache on disk for each
+#      version of the data.
+#
+#      The import scripts increase the version number in the collection
+#      "dataset_version" after every import (see DatasetVersion.py). The
+#      cached results of a database are stored in a folder per version, so
+#      results of an older version are never returned. The folders of older
+#      versions are removed when the folder of a new version is created.
+#
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+
+# Here we create a function which returns the version number of the data in
+# a database, or 0 if no data was imported since versions were introduced.
+def dataset_version(database):
+    document = database.dataset_version.find_one({"_id": "version"})
+    return document["version"] if document else 0
+
+# Here we create a function which returns the folder of the cached results of
+# a dataset for a version of the data.
+#
+# The function expects the following parameters:
+# 1) The name of the cache folder in the config.py file
+#    Ex.: "TILE_CACHE_PATH"
+# 2) The name of the dataset
+#    Ex.: "crane"
+# 3) The version number of the data
+def versioned_cache_folder(cache, name, version):
+
+    dataset_folder = os.path.join(app.root_path, app.config[cache], name)
+    folder = os.path.join(dataset_folder, 'v' + str(version))
+
+    if not os.path.isdir(folder):
+        os.makedirs(folder, exist_ok=True)
+
+        # Remove the results of the older versions. The folder of a newer
+        # version, which was created by another Gunicorn worker, is kept.
+        for other in os.listdir(dataset_folder):
+            if other.startswith('v') and other[1:].isdigit() and int(other[1:]) < version:
+                try:
+                    shutil.rmtree(os.path.join(dataset_folder, other))
+                except FileNotFoundError:
+                    # Another Gunicorn worker removed the folder first.
+                    pass
+
+    return folder
+
+# Here we create a function which writes a file in the cache. The file is
+# written to a temporary file first and renamed afterwards, so other Gunicorn
+# workers never read a file which is half written.
+def write_cache_file(location, content):
+
+    os.makedirs(os.path.dirname(location), exist_ok=True)
+
+    temporary = location + '.' + str(os.getpid()) + '.tmp'
+    with open(temporary, 'wb') as cache_file:
+        cache_file.write(content)
+
+    os.replace(temporary, location)
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+# 3.10) Create a generic function which returns a heatmap of the
+#       transmissions or signals.
+#
+#       The heatmap is a grid of the world which contains the amount of
+#       transmissions or signals in each cell. The points are counted by
+#       MongoDB with an aggregation pipeline, so only the counts of the cells
+#       which contain points are sent to Flask.
+#
+#       The grid is "resolution" cells wide and has one of the following
+#       projections (the query parameter: "?projection="):
+#       - lonlat   : cells of the same amount of degrees, the grid is half as
+#                    high as it is wide (default)
+#       - mercator : the cells of a spherical mercator (Web-Mercator) map
+#                    between the latitudes -85.05 and 85.05, the grid is as
+#                    high as it is wide. Since MongoDB 3.6 has no
+#                    trigonometric operators, the points are counted per
+#                    HEATMAP_LATITUDE_STEP degrees of latitude by MongoDB,
+#                    and these counts are added to the mercator rows by NumPy.
+#
+#       The points can be filtered by tracker (or trail) and between two
+#       DTG's with the query parameters: "?tracker=", "?dtg_1=" and "?dtg_2="
+#       (Ex.: ?tracker=5e2f...&dtg_1=2018-04-01&dtg_2=2018-05-01).
+#
+#       The grid is returned as JSON, with the counts as one list of rows
+#       from north to south. With "?format=binary" it is returned as:
+#       - 4 bytes : the characters "GSHM"
+#       - 4 bytes : the width (W) as an unsigned 32 bit integer
+#       - 4 bytes : the height (H) as an unsigned 32 bit integer
+#       - 4 bytes : zero, so the counts start at a multiple of 8 bytes
+#       - W x H x 4 bytes : the counts as unsigned 32 bit integers, row by row
+#
+#       Every heatmap is cached on disk (HEATMAP_CACHE_PATH) by its filter,
+#       resolution and projection, until new data is imported.
+#
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+
+# The highest latitude of the spherical mercator projection. It is also used
+# by the vector tiles (see the end of this file).
+MAX_MERCATOR_LATITUDE = 85.0511287798
+
+# The projections in which a heatmap can be requested.
+HEATMAP_PROJECTIONS = ("lonlat", "mercator")
+
+# Here we create a function which returns the size of the grid.
+def heatmap_size(resolution, projection):
+    width = min(max(int(resolution), 1), app.config["HEATMAP_MAX_RESOLUTION"])
+    height = width if projection == "mercator" else max(width // 2, 1)
+    return width, height
+
+# Here we create a function which returns the stages of the pipeline that
+# result in one document per transmission or signal, with the fields: "lon"
+# and "lat".
+#
+# The function expects the following parameters:
+# 1) The name of the field which references the tracker or trail
+# 2) The name of the field which contains the time of a document
+# 3) True if the data is stored in buckets
+# 4) The MongoID of the tracker or trail, or None
+# 5) The DTG's between which the points are counted, or None
+def heatmap_points(reference_field, time_field, buckets, id, dtg_1, dtg_2):
+
+    query = {}
+    if id is not None:
+        query[reference_field] = ObjectId(id)
+
+    time_range = {}
+    if dtg_1 is not None:
+        time_range["$gt"] = dtg_1
+    if dtg_2 is not None:
+        time_range["$lt"] = dtg_2
+
+    # Every transmission or signal is a separate document.
+    if not buckets:
+        if time_range:
+            query[time_field] = time_range
+
+        return [{"$match": query},
+                {"$project": {
+                    "_id": 0,
+                    "lon": {"$arrayElemAt": ["$geometry.coord.coordinates", 0]},
+                    "lat": {"$arrayElemAt": ["$geometry.coord.coordinates", 1]}}}]
+
+    # The transmissions or signals are stored in buckets. We only unwind the
+    # buckets which overlap with the DTG's, and use the position in the list
+    # of coordinates to find the time of each point.
+    if dtg_1 is not None:
+        query["end"] = {"$gt": dtg_1}
+    if dtg_2 is not None:
+        query["start"] = {"$lt": dtg_2}
+
+    stages = [{"$match": query},
+              {"$unwind": {"path": "$coords", "includeArrayIndex": "i"}},
+              {"$project": {
+                  "_id": 0,
+                  "lon": {"$arrayElemAt": ["$coords", 0]},
+                  "lat": {"$arrayElemAt": ["$coords", 1]},
+                  "time": {"$arrayElemAt": ["$" + time_field, "$i"]}}}]
+
+    if time_range:
+        stages.append({"$match": {"time": time_range}})
+
+    return stages
+
+# Here we create a function which calculates the grid of a heatmap.
+def create_heatmap(collection, points, width, height, projection):
+
+    # The column of a point in the grid.
+    column = {"$floor": {"$multiply": [{"$add": ["$lon", 180]}, width / 360.0]}}
+
+    # The row of a point in the grid, or the row of HEATMAP_LATITUDE_STEP
+    # degrees for the mercator projection.
+    if projection == "mercator":
+        row = {"$floor": {"$divide": [{"$add": ["$lat", 90]},
+                                      app.config["HEATMAP_LATITUDE_STEP"]]}}
+    else:
+        row = {"$floor": {"$multiply": [{"$subtract": [90, "$lat"]}, height / 180.0]}}
+
+    query_result = list(collection.aggregate(
+        points +
+        [{"$match": {"lon": {"$type": "number"}, "lat": {"$type": "number"}}},
+         {"$group": {"_id": {"x": column, "y": row}, "count": {"$sum": 1}}}],
+        allowDiskUse=True))
+
+    grid = np.zeros((height, width), dtype='<u4')
+
+    if not query_result:
+        return grid
+
+    columns = np.array([cell["_id"]["x"] for cell in query_result], dtype=int)
+    rows = np.array([cell["_id"]["y"] for cell in query_result], dtype=int)
+    counts = np.array([cell["count"] for cell in query_result], dtype='<u4')
+
+    # Convert the rows of latitude to the rows of the mercator grid, using
+    # the latitude in the middle of each row.
+    if projection == "mercator":
+        lat = (rows + 0.5) * app.config["HEATMAP_LATITUDE_STEP"] - 90
+        inside = np.abs(lat) < MAX_MERCATOR_LATITUDE
+        columns, counts, lat = columns[inside], counts[inside], np.radians(lat[inside])
+        rows = np.floor((1 - np.log(np.tan(lat) + 1 / np.cos(lat)) / np.pi)
+                        / 2 * height).astype(int)
+
+    # Points on the edge of the world (Ex.: a longitude of 180) are added to
+    # the last column or row.
+    np.add.at(grid, (np.clip(rows, 0, height - 1), np.clip(columns, 0, width - 1)),
+              counts)
+
+    return grid
+
+# Here we create the function which returns the heatmap.
+#
+# The function expects the following parameters:
+# 1) The name of the dataset ("crane" or "trail")
+# 2) The database of the dataset
+#    Ex.: crane_connection.db
+# 3) The name of the collection containing the transmissions or signals
+# 4) The name of the field which references the tracker or trail
+# 5) The name of the field which contains the time of a document
+# 6) True if the data is stored in buckets
+# 7) The width of the grid
+def query_heatmap(name, database, collection, reference_field, time_field,
+                  buckets, resolution):
+
+    projection = request.args.get('projection', 'lonlat')
+    if projection not in HEATMAP_PROJECTIONS:
+        return Response("Unknown projection: " + projection, status=400)
+
+    width, height = heatmap_size(resolution, projection)
+
+    # The id is part of the name of the cached heatmap, so only a valid
+    # MongoID is accepted.
+    id = request.args.get(reference_field)
+    if id is not None:
+        try:
+            id = str(ObjectId(id))
+        except InvalidId:
+            return Response("Invalid " + reference_field + ": " + id, status=400)
+
+    # The DTG's have the format: 2020-01-21, like the other routes.
+    dtg_1, dtg_2 = [datetime.strptime(request.args[key], '%Y-%m-%d')
+                    if request.args.get(key) else None
+                    for key in ('dtg_1', 'dtg_2')]
+
+    # The name of the cached heatmap is the filter, resolution and projection.
+    key = '_'.join(str(value) for value in
+                   (projection, width, height, id,
+                    dtg_1 and dtg_1.date(), dtg_2 and dtg_2.date()))
+    location = os.path.join(
+        versioned_cache_folder("HEATMAP_CACHE_PATH", name, dataset_version(database)),
+        key + '.bin')
+
+    if os.path.exists(location):
+        with open(location, 'rb') as cache_file:
+            grid = np.frombuffer(cache_file.read(), dtype='<u4').reshape(height, width)
+
+    else:
+        if buckets:
+            collection = collection + "_bucket"
+
+        grid = create_heatmap(database[collection],
+                              heatmap_points(reference_field, time_field, buckets,
+                                             id, dtg_1, dtg_2),
+                              width, height, projection)
+
+        write_cache_file(location, grid.tobytes())
+
+    # Return the heatmap in the binary format.
+    if binary_requested():
+        header = b'GSHM' + np.array([width, height, 0], dtype='<u4').tobytes()
+        return Response(header + grid.tobytes(), mimetype='application/octet-stream')
+
+    # Return the heatmap as JSON.
+    return Response(json.dumps({"projection": projection,
+                                "width": width,
+                                "height": height,
+                                "max": int(grid.max()),
+                                "counts": grid.tolist()}),
+                    mimetype='application/json')
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+# 3.11) Create a generic function which returns the transmissions or signals
+#       of a tracker or trail in a polygon.
+#
+#       The Angular applications pass the coordinates of the polygon as one
+#       string: "lon,lat,lon,lat,...". The string is converted once to a
+#       closed ring of coordinate pairs, in counterclockwise order. MongoDB
+#       uses the counterclockwise order (the "strictwinding" CRS) to decide
+#       which side of the ring is the inside of the polygon, so a polygon
+#       which is drawn clockwise would otherwise select the rest of the world.
+#
+#       The query is hinted to use the compound index on (reference,
+#       geometry.coord). MongoDB then only reads the index keys of the
+#       tracker or trail in the cells which cover the polygon, which is a
+#       tighter pre-filter than the bounding box of the polygon. Only the
+#       candidates in these cells are checked with "$geoWithin". Without the
+#       hint MongoDB may choose the index on (reference, time) instead and
+#       check every point of the track. The hint is only given if the index
+#       exists, since MongoDB rejects a hint on an index which is missing
+#       (Ex.: a database which was imported by an older import script). The
+#       results are streamed.
+#
+#       In the bucket layout the coordinates of the buckets are unwound by
+#       MongoDB and checked with the same "$geoWithin" (see
+#       positions_in_polygon), so both layouts return the same points. Only
+#       the buckets which contain points in the polygon are unpacked.
+#
+#       Coordinates which can't form a polygon result in a 400 response.
+#
+#       The function expects the following parameters:
+#       1) The collection containing the transmissions or signals
+#          Ex.: crane_connection.db.transmission
+#       2) The collection containing the buckets of transmissions or signals,
+#          or None if the track is not stored in buckets
+#       3) The name of the field which references the tracker or trail
+#       4) The name of the field which contains the time of a document
+#       5) The unpack function of the buckets
+#          Ex.: transmission_from_bucket
+#       6) The MongoID of the tracker or trail
+#       7) The coordinates of the polygon as one string
+#
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+
+# Here we create a function which converts the string of coordinates to a
+# closed, counterclockwise ring of [lon, lat] pairs. A ValueError is raised if
+# the string doesn't contain at least three valid coordinate pairs.
+def parse_polygon(coords):
+
+    values = [float(i) for i in coords.split(',')]
+
+    if len(values) % 2 != 0 or not all(np.isfinite(values)):
+        raise ValueError("Invalid polygon: " + coords)
+
+    ring = [values[k:k+2] for k in range(0, len(values) - 1, 2)]
+
+    # A ring needs at least three different points.
+    if len(set(map(tuple, ring))) < 3:
+        raise ValueError("Invalid polygon: " + coords)
+
+    # Close the ring by repeating the first point.
+    if ring[0] != ring[-1]:
+        ring.append(ring[0])
+
+    # The area calculated with the shoelace formula is negative if the ring
+    # is clockwise.
+    area = sum(x1 * y2 - x2 * y1 for (x1, y1), (x2, y2) in zip(ring, ring[1:]))
+    if area < 0:
+        ring.reverse()
+
+    return ring
+
+# Here we create a function which returns the GeoJSON polygon of a ring, with
+# the "strictwinding" CRS.
+def polygon_geometry(ring):
+    return {"type": "Polygon",
+            "coordinates": [ring],
+            "crs": {"type": "name",
+                    "properties": {
+                        "name": "urn:x-mongodb:crs:strictwinding:EPSG:4326"}}}
+
+# Here we create a function which returns the positions of the points of a
+# track in buckets which lie within a polygon. The lists of coordinates are
+# unwound by MongoDB and checked with "$geoWithin", which doesn't need an
+# index. The positions are returned as a set per MongoID of a bucket.
+def positions_in_polygon(bucket_collection, reference_field, id, ring):
+
+    query_result = bucket_collection.aggregate([
+        {"$match": {reference_field: ObjectId(id)}},
+        {"$project": {"coords": 1}},
+        {"$unwind": {"path": "$coords", "includeArrayIndex": "index"}},
+        {"$match": {"coords": {"$geoWithin": {"$geometry": polygon_geometry(ring)}}}},
+        {"$group": {"_id": "$_id", "positions": {"$push": "$index"}}},
+    ], allowDiskUse=True)
+
+    return {bucket["_id"]: set(bucket["positions"]) for bucket in query_result}
+
+# Here we create a function which checks if a collection has an index on the
+# fields passed as a list of (field, type) pairs.
+def has_index(collection, keys):
+    return any(index["key"] == keys
+               for index in collection.index_information().values())
+
+# Here we create the function which performs the query.
+def query_polygon(collection, bucket_collection, reference_field, time_field,
+                  unpack, id, coords):
+
+    try:
+        ring = parse_polygon(coords)
+    except ValueError:
+        return Response("Invalid polygon: " + coords, status=400)
+
+    # If the track is stored in buckets, the points in the polygon are
+    # returned while the buckets which contain them are unpacked.
+    if bucket_collection is not None:
+        positions = positions_in_polygon(bucket_collection, reference_field, id, ring)
+
+        query_result = unpack_buckets(
+            bucket_collection.find({"_id": {"$in": list(positions)}}).sort("start", 1),
+            unpack, time_field, positions=positions)
+
+        return track_response(query_result, time_field)
+
+    query_result = collection.find(
+        {reference_field: ObjectId(id),
+         "geometry.coord": {"$geoWithin": {"$geometry": polygon_geometry(ring)}}},
+        track_projection(time_field))
+
+    index = [(reference_field, 1), ("geometry.coord", "2dsphere")]
+    if has_index(collection, index):
+        query_result = query_result.hint(index)
+
+    # Return the results as a JSON array or in the binary format
+    return track_response(query_result, time_field)
+
 # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
 #                      QUERIES RELATED TO CRANE DATA                          #
 # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
@@ -107,8 +1416,8 @@ def get_all_trackers():
     # Assign the results of the query to a variable called: "query_results"
     query_result = crane_connection.db.tracker.find()
 
-    # Return the data obtained by the query in a valid JSON format
-    return json.dumps(list(query_result), default=json_util.default)
+    # Stream the data obtained by the query in a valid JSON format
+    return stream_json(query_result)
 
 
 # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
@@ -122,16 +1431,33 @@ def get_one_tracker(id):
     # Return the data obtained by the query in a valid JSON format
     return json.dumps(query_result, default=json_util.default)
 
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+# 6.1) Create the function which retrieves the trackers of which the track
+#      intersects with the viewport of the map. The viewport is passed as:
+#      "min_lon,min_lat,max_lon,max_lat".
+@app.route('/api/trackers_in_viewport/<coords>', methods=['GET'])
+def get_trackers_in_viewport(coords):
+
+    # Call the function: "query_viewport()" and pass the tracker collection.
+    return query_viewport(crane_connection.db.tracker, coords)
+
 # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
 # 7) Create the function which returns the total amount of transmissions
 #     in the database
 @app.route('/api/transmissions_count/', methods=['GET'])
 def get_all_transmissions_count():
 
-    # The query is performed on the transmission collection
+    # If the transmissions are stored in buckets, we add up the amount of
+    # transmissions in each bucket.
+    if app.config["CRANE_STORAGE_LAYOUT"] == "buckets":
+        query_result = sum(bucket["count"] for bucket in
+            crane_connection.db.transmission_bucket.find({}, {"count": 1}))
+
+    # Otherwise the query is performed on the transmission collection
     # .count() is used to count all documents in the MongoDB
     # datastore
-    query_result = crane_connection.db.transmission.count()
+    else:
+        query_result = crane_connection.db.transmission.count()
 
     # Transform the result in a string
     return str(query_result)
@@ -147,10 +1473,18 @@ def get_all_transmissions_by_id(id):
     # id passed in the function. the [:100] is used to only return
     # the first 100 results.
     query_result = crane_connection.db.transmission.find(
-        {"tracker": ObjectId(id)})[:100]
+        {"tracker": ObjectId(id)}, track_projection("timestamp"))[:100]
 
-    # Convert the results to a list and dump the result
-    return json.dumps(list(query_result), default=json_util.default)
+    # If the transmissions are stored in buckets, we unpack the first 100
+    # transmissions from the buckets of the tracker instead.
+    if app.config["CRANE_STORAGE_LAYOUT"] == "buckets":
+        query_result = unpack_buckets(
+            crane_connection.db.transmission_bucket.find(
+                {"tracker": ObjectId(id)}).sort("start", 1),
+            transmission_from_bucket, "timestamp", limit=100)
+
+    # Return the results as a JSON array or in the binary format
+    return track_response(query_result, "timestamp")
 
 # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
 # 9) Create the function which returns a given amount of transmissions from
@@ -163,11 +1497,55 @@ def get_all_transmissions_amount(id,amount):
     # id passed in the function. the int([:amount]) is used to only return
     # the the amount passed in the function.
     query_result = crane_connection.db.transmission.find(
-        {"tracker": ObjectId(id)})[:int(amount)]
+        {"tracker": ObjectId(id)}, track_projection("timestamp"))[:int(amount)]
+
+    # If the transmissions are stored in buckets, we unpack the amount of
+    # transmissions from the buckets of the tracker instead.
+    if app.config["CRANE_STORAGE_LAYOUT"] == "buckets":
+        query_result = unpack_buckets(
+            crane_connection.db.transmission_bucket.find(
+                {"tracker": ObjectId(id)}).sort("start", 1),
+            transmission_from_bucket, "timestamp", limit=int(amount))
 
 
-    # Convert the results to a list and dump the result
-    return json.dumps(list(query_result), default=json_util.default)
+    # Return the results as a JSON array or in the binary format
+    return track_response(query_result, "timestamp")
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+# 9.1) Create the function which returns a sample of at most the given amount
+#      of transmissions, spread evenly over the whole track of a tracker.
+@app.route('/api/transmissions_by_stride/<id>/<amount>', methods=['GET'])
+def get_transmissions_stride(id,amount):
+
+    # If the transmissions are stored in buckets, the buckets are passed as
+    # well.
+    buckets = None
+    if app.config["CRANE_STORAGE_LAYOUT"] == "buckets":
+        buckets = crane_connection.db.transmission_bucket
+
+    # Call the function: "query_stride()" and pass the transmission collection.
+    return query_stride(crane_connection.db.transmission, buckets, "tracker",
+                        "timestamp", transmission_from_bucket, id, amount)
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+# 9.2) Create the function which returns one transmission per interval of
+#      time (Ex.: "30m", "6h" or "1d") of a tracker. The query parameter
+#      "?method=average" returns the average position of each interval
+#      instead of the first transmission.
+@app.route('/api/transmissions_by_interval/<id>/<interval>', methods=['GET'])
+def get_transmissions_interval(id,interval):
+
+    # If the transmissions are stored in buckets, the buckets are passed as
+    # well.
+    buckets = None
+    if app.config["CRANE_STORAGE_LAYOUT"] == "buckets":
+        buckets = crane_connection.db.transmission_bucket
+
+    # Call the function: "query_interval()" and pass the transmission
+    # collection.
+    return query_interval(crane_connection.db.transmission, buckets, "tracker",
+                          "timestamp", transmission_from_bucket, id, interval,
+                          request.args.get('method', 'first'))
 
 # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
 # 10) Create the function which retrieves all transmissions
@@ -188,10 +1566,21 @@ def get_all_transmissions_dtg(id,dtg_1,dtg_2):
     # to define that we want all the transmissions below the value of dtg_2.
     # Again, we also search on the ReferenceField: "tracker".
     query_result = crane_connection.db.transmission.find(
-        {"timestamp": { "$gt": dtg_1, "$lt": dtg_2},"tracker":ObjectId(id)})
-
-    # Convert the results to a list and dump the result
-    return json.dumps(list(query_result), default=json_util.default)
+        {"timestamp": { "$gt": dtg_1, "$lt": dtg_2},"tracker":ObjectId(id)},
+        track_projection("timestamp"))
+
+    # If the transmissions are stored in buckets, we search for the buckets
+    # which overlap with the DTG's and unpack the transmissions between them.
+    if app.config["CRANE_STORAGE_LAYOUT"] == "buckets":
+        query_result = unpack_buckets(
+            crane_connection.db.transmission_bucket.find(
+                {"tracker": ObjectId(id),
+                 "start": {"$lt": dtg_2},
+                 "end": {"$gt": dtg_1}}).sort("start", 1),
+            transmission_from_bucket, "timestamp", start=dtg_1, end=dtg_2)
+
+    # Return the results as a JSON array or in the binary format
+    return track_response(query_result, "timestamp")
 
 # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
 # 11) Create the function which retrieves all transmissions
@@ -199,44 +1588,61 @@ def get_all_transmissions_dtg(id,dtg_1,dtg_2):
 @app.route('/api/transmissions_in_polygon/<id>/<coords>', methods=['GET'])
 def get_all_transmissions_in_polygon(id,coords):
 
-    # Since the coordinates, passed by our Angular application, are passed
-    # as one string, the string needs to be transformed into a list of valid
-    # coordinate pairs.
+    # If the transmissions are stored in buckets, the buckets are passed as
+    # well.
+    buckets = None
+    if app.config["CRANE_STORAGE_LAYOUT"] == "buckets":
+        buckets = crane_connection.db.transmission_bucket
 
-    # This line splits, the string at each: “,”. Then it appends the
-    # remaining values to a variable called: “splitted_coords”.
-    splitted_coords= coords.split(',')
+    # Call the function: "query_polygon()" and pass the transmission
+    # collection and the coordinates of the polygon, which are passed by our
+    # Angular application as one string.
+    return query_polygon(crane_connection.db.transmission, buckets, "tracker",
+                         "timestamp", transmission_from_bucket, id, coords)
 
-    # Here we loop trough each value in the list and convert the values to floats.
-    float_coords = [float(i) for i in splitted_coords]
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+# 11.1) Create the function which pages through all the transmissions of a
+#       certain tracker, sorted by time. The first page is requested without
+#       a token. Each page contains the token which is used to request the
+#       next page. The token of the last page is null.
+@app.route('/api/transmissions_by_page/<id>/<amount>', methods=['GET'])
+@app.route('/api/transmissions_by_page/<id>/<amount>/<token>', methods=['GET'])
+def get_transmissions_page(id,amount,token=None):
+
+    # If the transmissions are stored in buckets, the buckets are passed as
+    # well.
+    buckets = None
+    if app.config["CRANE_STORAGE_LAYOUT"] == "buckets":
+        buckets = crane_connection.db.transmission_bucket
+
+    # Call the function: "query_page()" and pass the transmission collection,
+    # the name of the reference field and the name of the time field.
+    return query_page(crane_connection.db.transmission, buckets, "tracker",
+                      "timestamp", transmission_from_bucket, id, amount, token)
 
-    # This line alternately appends coordinates to a set of 2 coordinates
-    final_coords = [float_coords[k:k+2] for k in range(0, len(float_coords), 2)]
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+# 11.2) Create the function which retrieves the simplified track of a certain
+#       tracker for the zoom level of the map.
+@app.route('/api/transmissions_by_zoom/<id>/<zoom>', methods=['GET'])
+def get_transmissions_zoom(id,zoom):
 
-    # Below, a query is created wich searches for all transmissions in a polygon
-    # defines by the coordinates passed by our angular application.
-    query_result = crane_connection.db.transmission.find(
-        {
-        "geometry.coord":{
-            "$geoWithin":{
-                "$geometry":{
-                    "type":"Polygon",
-                    "coordinates":[final_coords],
-                    "crs":{
-                    "type":"name",
-                    "properties":{
-                        "name":"urn:x-mongodb:crs:strictwinding:EPSG:4326"
-                        }
-                    }
-                }
-            }
-        },
-        "tracker":ObjectId(id)
-        })
-
-    # Convert the results to a list and dump the result
-    return json.dumps(list(query_result), default=json_util.default)
+    # Call the function: "query_level()" and pass the collection containing
+    # the simplified tracks of the trackers.
+    return query_level(crane_connection.db.transmission_level, "tracker",
+                       id, zoom)
 
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+# 11.3) Create the function which returns a heatmap of the transmissions of
+#       all trackers, or of one tracker with "?tracker=<MongoID>". The other
+#       query parameters are described at 3.10.
+@app.route('/api/transmissions_heatmap/<resolution>', methods=['GET'])
+def get_transmissions_heatmap(resolution):
+
+    # Call the function: "query_heatmap()" and pass the Crane database.
+    return query_heatmap("crane", crane_connection.db, "transmission",
+                         "tracker", "timestamp",
+                         app.config["CRANE_STORAGE_LAYOUT"] == "buckets",
+                         resolution)
 
 # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
 #                          PANDAS PROFILING RELATED                           #
@@ -265,40 +1671,277 @@ def create_profile(data,title,output):
     # as parameter in the function: “.to_file()”.
     profile.to_file(output_file=output)
 
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+# 12.1) Create the functions which run the profile jobs in the background.
+#
+#       Creating a profile takes a long time, so it is not done while the
+#       request is waiting. Instead a job is started in a separate process
+#       (PROFILE_WORKERS processes per Gunicorn worker) and the request
+#       returns immediately.
+#
+#       Every profile is cached on disk (PROFILE_CACHE_PATH) for the version
+#       of the data (see 3.9). A cached profile is served immediately, until
+#       new data is imported. The state of a job is kept in files next to the
+#       profile, so every Gunicorn worker sees the same state:
+#       - profile.html         : the profile is done
+#       - profile.html.running : a job is creating the profile. The file is
+#                                created exclusively, so only one job per
+#                                profile is started. A job which is running
+#                                longer than PROFILE_JOB_TIMEOUT seconds is
+#                                assumed to have crashed.
+#       - profile.html.error   : the job failed, the file contains the error
+#
+#       The profile is written to a temporary file and renamed afterwards,
+#       so a profile is never served while it is half written.
+#
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+
+# The datasets which can be profiled, with the name of the database
+# connection, the collection and the title of the profile.
+PROFILE_DATASETS = {
+    "trackers": ("crane", "tracker", "Trackers profile"),
+    "trails": ("trail", "trail", "Trails profile"),
+}
+
+# The process pools which run the profile jobs, one for every Gunicorn worker.
+profile_executors = {}
+
+# Here we create a function which returns the process pool of the current
+# Gunicorn worker, and creates it the first time it is used.
+def profile_executor():
+
+    if os.getpid() not in profile_executors:
+        profile_executors[os.getpid()] = ProcessPoolExecutor(
+            max_workers=app.config["PROFILE_WORKERS"])
+
+    return profile_executors[os.getpid()]
+
+# Here we create the function which runs in the background process. It
+# connects to MongoDB, creates the profile and removes the ".running" file
+# when it is done.
+#
+# The function expects the following parameters:
+# 1) The URI of the database, Ex.: app.config["CRANE_DATABASE_URI"]
+# 2) The name of the collection, Ex.: "tracker"
+# 3) The title of the profile
+# 4) The location of the profile in the cache
+def profile_job(uri, collection, title, location):
+
+    try:
+        client = MongoClient(uri)
+
+        try:
+            # The MongoID isn't seen as a valid variable by Pandas_Profiling.
+            query_result = client.get_database()[collection].find({}, {"_id": 0})
+
+            # The temporary file has to end with ".html", since pandas_profiling
+            # uses the extension to choose the format of the file.
+            temporary = location + '.' + str(os.getpid()) + '.tmp.html'
+            create_profile(query_result, title, temporary)
+            os.replace(temporary, location)
+
+        finally:
+            client.close()
+
+    except Exception:
+        write_cache_file(location + '.error',
+                         traceback.format_exc().encode('utf-8'))
+
+    finally:
+        try:
+            os.remove(location + '.running')
+        except OSError:
+            pass
+
+# Here we create a function which returns the database, the location of the
+# cached profile and the version of the data of a dataset.
+def profile_location(dataset):
+
+    connection_name, collection, title = PROFILE_DATASETS[dataset]
+    connection = crane_connection if connection_name == "crane" else trail_connection
+
+    version = dataset_version(connection.db)
+    folder = versioned_cache_folder("PROFILE_CACHE_PATH", dataset, version)
+
+    return os.path.join(folder, 'profile.html'), version
+
+# Here we create a function which returns the state of the profile job of a
+# dataset: "done", "running", "failed" or "missing".
+def profile_status(location):
+
+    if os.path.exists(location):
+        return "done"
+
+    if os.path.exists(location + '.running'):
+
+        # A job which is running too long has crashed (Ex.: the process was
+        # killed), the profile can be created again. The file may already be
+        # removed by the job or by another Gunicorn worker.
+        try:
+            started = os.path.getmtime(location + '.running')
+            if time.time() - started < app.config["PROFILE_JOB_TIMEOUT"]:
+                return "running"
+
+            os.remove(location + '.running')
+        except FileNotFoundError:
+            # The job may have finished in the meantime.
+            if os.path.exists(location):
+                return "done"
+
+        return "missing"
+
+    if os.path.exists(location + '.error'):
+        return "failed"
+
+    return "missing"
+
+# Here we create a function which starts the profile job of a dataset, if the
+# profile isn't done or running yet. It returns the state of the job. The
+# location of the profile is passed as parameter (see profile_location).
+def start_profile_job(dataset, location, retry=False):
+
+    connection_name, collection, title = PROFILE_DATASETS[dataset]
+
+    status = profile_status(location)
+
+    if status == "done" or status == "running":
+        return status
+    if status == "failed" and not retry:
+        return status
+
+    # Create the ".running" file. If another Gunicorn worker created it
+    # first, that worker is already running the job.
+    try:
+        os.close(os.open(location + '.running', os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+    except FileExistsError:
+        return "running"
+
+    # Remove the error of the previous job, if another Gunicorn worker didn't
+    # remove it already.
+    try:
+        os.remove(location + '.error')
+    except FileNotFoundError:
+        pass
+
+    uri = app.config[connection_name.upper() + "_DATABASE_URI"]
+    profile_executor().submit(profile_job, uri, collection, title, location)
+
+    return "running"
+
+# Here we create a function which returns the state of the profile job of a
+# dataset as JSON.
+def profile_job_response(dataset, location, version, status, http_status=200):
+
+    result = {"dataset": dataset, "version": version, "status": status}
+
+    if status == "done":
+        result["url"] = "/api/profiles/" + dataset
+    if status == "failed":
+        # The last line of the traceback contains the error message.
+        with open(location + '.error') as error_file:
+            lines = error_file.read().strip().splitlines()
+        result["error"] = lines[-1] if lines else None
+
+    return Response(json.dumps(result), status=http_status,
+                    mimetype='application/json')
+
+# Here we create a function which returns the profile of a dataset as an HTML
+# page. If the profile isn't done yet, the job is started and a page is
+# returned which reloads itself every PROFILE_REFRESH seconds, until the
+# profile is done. This page is opened in a new window by the Angular
+# dataset-dashboard application.
+def profile_page(dataset):
+
+    location, version = profile_location(dataset)
+    status = start_profile_job(dataset, location)
+
+    if status == "done":
+        return send_file(location, mimetype='text/html')
+
+    if status == "failed":
+        return Response("<p>Creating the " + PROFILE_DATASETS[dataset][2] +
+                        " failed. Retry with: POST /api/profile_jobs/" +
+                        dataset + "</p>", status=500, mimetype='text/html')
+
+    return Response('<html><head><meta http-equiv="refresh" content="' +
+                    str(app.config["PROFILE_REFRESH"]) + '"></head><body><p>' +
+                    'The ' + PROFILE_DATASETS[dataset][2] + ' is being created, ' +
+                    'this page will reload when it is done.</p></body></html>',
+                    status=202, mimetype='text/html')
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+# 12.2) Create the functions which start a profile job and return the state
+#       of the job. POST starts the job (or starts it again after it failed),
+#       GET only returns the state. The finished profile is returned by the
+#       route: "/api/profiles/<dataset>".
+@app.route('/api/profile_jobs/<dataset>', methods=['GET', 'POST'])
+def get_profile_job(dataset):
+
+    if dataset not in PROFILE_DATASETS:
+        return Response(json.dumps({"error": "Unknown dataset: " + dataset}),
+                        status=404, mimetype='application/json')
+
+    location, version = profile_location(dataset)
+
+    if request.method == 'POST':
+        status = start_profile_job(dataset, location, retry=True)
+        return profile_job_response(dataset, location, version, status,
+                                    200 if status == "done" else 202)
+
+    return profile_job_response(dataset, location, version, profile_status(location))
+
+@app.route('/api/profiles/<dataset>', methods=['GET'])
+def get_profile(dataset):
+
+    if dataset not in PROFILE_DATASETS:
+        return Response("Unknown dataset: " + dataset, status=404)
+
+    location, version = profile_location(dataset)
+
+    if profile_status(location) != "done":
+        return Response("The profile is not done yet", status=404)
+
+    return send_file(location, mimetype='text/html')
+
 # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
 # 13) Create a function which creates a dataprofile for the trackers in the
-#     MongoDB datastore
+#     MongoDB datastore. The profile is created in the background by the
+#     function: "profile_page()" (see 12.1).
 @app.route('/api/generate-trackers-profile', methods=['GET'])
 def generate_trackers_profile():
+    return profile_page("trackers")
 
-    # Retrieve all the trackers in the database (Blue), and make sure the
-    # MongoID is not retrieved from the database (Green).
-    # We do this because the MongoID isn't seen as a valid variable by
-    # Pandas_Profiling.  To skip a certain variable we use the syntax:
-    # .find({},{fieldname : 0}, where “fieldname” is the variable you want to skip.
-    query_result = crane_connection.db.tracker.find({},{"_id":0})
-
-    # Call the function: “create_profile()” (Orange), and pas the following parameters:
-    #  1) The variable: “query_result”, which contains the data returned by the query.
-    #
-    #  2) “Trackers profile”, which will be the title at the top of the data profile.
-    #
-    #  3) The location where the tracker profile will be generated. In this case an HTML
-    #     file called: “tracker.html”, will be generated in the templates folder.
-    create_profile(query_result,"Trackers profile","templates/tracker.html")
-
-    # The function: “generate_profile”, will then return a rendered HTML file containing
-    # our tracker data profile.
-    return render_template('tracker.html')
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+# 13.1) Create a function which creates a dataprofile for the trails in the
+#       MongoDB datastore.
+@app.route('/api/generate-trails-profile', methods=['GET'])
+def generate_trails_profile():
+    return profile_page("trails")
 
 
 # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
 #            CODE BELOW IS RELATED TO OUR POSTGRESQL DATASTORES               #
 # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
 # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
-# 14) Create a generic function which performs queries on a PostgreSQL datastore
+# 14) Create the generic functions which perform queries on a PostgreSQL
+#     datastore.
+#
+#     Opening a connection to PostgreSQL (including the authentication) takes
+#     longer than most of our queries. Instead of opening a new connection
+#     for every request, every Gunicorn worker keeps a pool of open
+#     connections per database. The amount of connections in a pool is
+#     limited by PGSQL_POOL_MIN and PGSQL_POOL_MAX in the config.py file, so
+#     the amount of connections to PostgreSQL is bounded per worker.
+#
+#     The values in a query are passed separately as "parameters" and are
+#     filled in by psycopg2 (Ex.: "SELECT * FROM wpi WHERE country = %s;"),
+#     so they never have to be added to the query string.
 #
-#     The function expects the following paramaters:
+#     Errors are no longer hidden: they are raised, logged and returned to
+#     the Angular applications as a JSON error with an HTTP error code by
+#     the function: "pgsql_error()".
+#
+#     The functions expect the following paramaters:
 #     1) The name of the database
 #        Ex.: World_Port_Index
 #     2) The host on which the database is running
@@ -309,42 +1952,136 @@ def generate_trackers_profile():
 #        Ex.: postgres
 #     5) The query which you want to execute on the database.
 #        Ex.: "SELECT COUNT(*) FROM wpi;"
+#     6) Optionally the parameters of the query.
 #
 #     The parameters 1 till 4, should come from the config.py file.
 #
 # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
 
-def query_pgsql(_database, _host, _user, _password, query):
+# The connection pools of this worker, per (process id, database, host, user).
+# The process id is part of the key since a connection can't be shared with
+# the worker processes which are forked by Gunicorn.
+pgsql_pools = {}
+
+# Here we create a function which returns the connection pool of a database,
+# and creates it the first time it is used.
+def pgsql_pool(_database, _host, _user, _password):
+
+    key = (os.getpid(), _database, _host, _user)
+
+    if key not in pgsql_pools:
+        pgsql_pools[key] = ThreadedConnectionPool(app.config["PGSQL_POOL_MIN"],
+                                                  app.config["PGSQL_POOL_MAX"],
+                                                  database=_database,
+                                                  host=_host,
+                                                  user=_user,
+                                                  password=_password)
+
+    return pgsql_pools[key]
+
+# Here we create a function which borrows a connection from the pool. The
+# transaction is committed if the code in the "with" statement succeeds and
+# rolled back otherwise. Connections which were closed (Ex.: because
+# PostgreSQL was restarted) are removed from the pool.
+@contextmanager
+def pgsql_connection(_database, _host, _user, _password):
+
+    pool = pgsql_pool(_database, _host, _user, _password)
+    conn = pool.getconn()
 
-    # Use an try/except statement which will print: "failed to connect",
-    # if the connection failed.
     try:
-        # Connect to the PostgreSQL database using the values passed
-        # in the function: "query_psql"
-        conn = psycopg2.connect(database=_database,
-                                    host=_host,
-                                    user=_user,
-                                    password=_password)
+        yield conn
+        conn.commit()
+
+    except Exception:
+        if not conn.closed:
+            conn.rollback()
+        raise
+
+    finally:
+        pool.putconn(conn, close=bool(conn.closed))
+
+# Here we create the function which executes a query and returns all the
+# results. It is used for queries which return a small amount of rows.
+def query_pgsql(_database, _host, _user, _password, query, parameters=None):
+
+    with pgsql_connection(_database, _host, _user, _password) as conn:
+        with conn.cursor() as curs:
+            curs.execute(query, parameters)
+            return curs.fetchall()
+
+# Here we create the class which contains the results of a query on a named
+# (server-side) cursor. The rows are read from PostgreSQL in batches while
+# they are iterated. The connection is returned to the pool by close(), which
+# is called when the response is closed (see stream_json()), also if the rows
+# were never read.
+class PgsqlRows:
+
+    def __init__(self, pool, conn, curs):
+        self.pool = pool
+        self.conn = conn
+        self.curs = curs
+        self.closed = False
+
+    def __iter__(self):
+        return iter(self.curs)
+
+    def close(self):
+
+        # The connection is only returned to the pool once.
+        if self.closed:
+            return
+        self.closed = True
+
+        try:
+            if not self.conn.closed:
+                self.curs.close()
+                self.conn.rollback()
+        except psycopg2.Error:
+            app.logger.exception("Closing a PostgreSQL cursor failed")
+
+        self.pool.putconn(self.conn, close=bool(self.conn.closed))
+
+# Here we create the function which executes a query and returns its results
+# as PgsqlRows. It uses a named (server-side) cursor, so PostgreSQL sends the
+# rows in batches of STREAM_BATCH_SIZE instead of all at once. It is used
+# together with stream_json() for queries which return a lot of rows.
+#
+# The query is executed before the rows are returned, so an invalid query
+# raises an error before the response is started. Every cursor gets a unique
+# name, so a connection never contains two cursors with the same name.
+def stream_pgsql(_database, _host, _user, _password, query, parameters=None):
+
+    pool = pgsql_pool(_database, _host, _user, _password)
+    conn = pool.getconn()
 
-        # Assing the connection cursor to a variable called: "curs".
-        curs = conn.cursor()
+    try:
+        curs = conn.cursor(name='stream_' + uuid.uuid4().hex)
+        curs.itersize = app.config["STREAM_BATCH_SIZE"]
+        curs.execute(query, parameters)
 
-        # Execute the query passed in the function.
-        curs.execute(query)
+    except Exception:
+        if not conn.closed:
+            conn.rollback()
+        pool.putconn(conn, close=bool(conn.closed))
+        raise
 
-        # Fetch all the results and assign them to a variable called: "res".
-        res = curs.fetchall()
+    return PgsqlRows(pool, conn, curs)
 
-        # Close the connection.
-        conn.close()
+# Here we create the function which returns a JSON error if a query on
+# PostgreSQL fails. A database which can't be reached returns a "503 Service
+# Unavailable", other errors a "500 Internal Server Error".
+@app.errorhandler(psycopg2.Error)
+def pgsql_error(error):
 
-        # Return all the results.
-        return res
+    app.logger.exception("PostgreSQL query failed")
 
-    except:
+    status = 500
+    if isinstance(error, (psycopg2.OperationalError, psycopg2.pool.PoolError)):
+        status = 503
 
-        # Print failed to connect if connection failed
-        print("Failed to connect to:" + _database)
+    return Response(json.dumps({"error": str(error).strip()}),
+                    status=status, mimetype='application/json')
 
 # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
 # 15) Create the function which retrieve the amount of Ports in the
@@ -378,16 +2115,216 @@ def get_all_ports():
     query = "SELECT longitude, latitude, PORT_NAME, COUNTRY FROM wpi;"
 
 
-    # Call the function: "query_pgsql()" and pass the connection
+    # Call the function: "stream_pgsql()" and pass the connection
     # paramaters of the WPI database. Also pass the query defined
     # above.
-    query_result = query_pgsql(app.config["WPI_DATABASE"],
-                               app.config["WPI_HOST"],
-                               app.config["WPI_USER"],
-                               app.config["WPI_PASS"],
-                               query)
-    # Return the results as valid JSON.
-    return json.dumps(query_result)
+    query_result = stream_pgsql(app.config["WPI_DATABASE"],
+                                app.config["WPI_HOST"],
+                                app.config["WPI_USER"],
+                                app.config["WPI_PASS"],
+                                query)
+
+    # Stream the results in a valid JSON format.
+    return stream_json(query_result)
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+# 16.1) Create the function which retrieves the Ports in the viewport of the
+#       map as a GeoJSON FeatureCollection. The viewport is passed as:
+#       "min_lon,min_lat,max_lon,max_lat". If no viewport is passed, all the
+#       Ports are returned.
+#
+#       Each Feature is created by PostgreSQL (ST_AsGeoJSON and
+#       json_build_object) and sent to Flask as text, so no Python objects
+#       are created for the Ports. The "&&" operator compares the bounding
+#       boxes of the geometries with the viewport, using the GiST index
+#       which was created by shp2pgsql (the "-I" option in the
+#       world-port-index-import.py file).
+#
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+
+# The query which creates a GeoJSON Feature of every Port. The WHERE clause
+# is added by the function: "ports_geojson()".
+PORTS_GEOJSON_QUERY = """
+    SELECT json_build_object(
+               'type', 'Feature',
+               'geometry', ST_AsGeoJSON(geom, 6)::json,
+               'properties', json_build_object('port_name', port_name,
+                                               'country', country))::text
+    FROM wpi
+"""
+
+# Here we create a function which converts the viewport to a list of
+# envelopes (min_lon, min_lat, max_lon, max_lat). A viewport which crosses
+# the antimeridian (the first longitude is bigger than the second) is split in
+# two envelopes.
+def viewport_envelopes(coords):
+
+    min_lon, min_lat, max_lon, max_lat = [float(i) for i in coords.split(',')]
+
+    if min_lon > max_lon:
+        return [(min_lon, min_lat, 180.0, max_lat),
+                (-180.0, min_lat, max_lon, max_lat)]
+
+    return [(min_lon, min_lat, max_lon, max_lat)]
+
+# Here we create the generator which yields the GeoJSON FeatureCollection
+# piece by piece. The rows contain the Features as text, which are sent in
+# batches of STREAM_BATCH_SIZE. The rows (see stream_pgsql()) are closed when
+# the response is closed, so the connection is returned to the pool when the
+# client disconnects early as well.
+def stream_feature_collection(rows):
+
+    batch_size = app.config["STREAM_BATCH_SIZE"]
+
+    def generate():
+
+        yield '{"type": "FeatureCollection", "features": ['
+
+        batch = []
+        first_batch = True
+
+        for row in rows:
+            batch.append(row[0])
+
+            if len(batch) == batch_size:
+                yield ('' if first_batch else ',') + ','.join(batch)
+                batch = []
+                first_batch = False
+
+        if batch:
+            yield ('' if first_batch else ',') + ','.join(batch)
+
+        yield ']}'
+
+    response = Response(stream_with_context(generate()),
+                        mimetype='application/geo+json')
+    response.call_on_close(rows.close)
+
+    return response
+
+# Here we create the function which performs the query.
+def ports_geojson(coords=None):
+
+    query = PORTS_GEOJSON_QUERY
+    parameters = []
+
+    if coords is not None:
+        envelopes = viewport_envelopes(coords)
+
+        query += "WHERE " + " OR ".join(
+            ["geom && ST_MakeEnvelope(%s, %s, %s, %s, 4326)"] * len(envelopes))
+
+        for envelope in envelopes:
+            parameters.extend(envelope)
+
+    query_result = stream_pgsql(app.config["WPI_DATABASE"],
+                                app.config["WPI_HOST"],
+                                app.config["WPI_USER"],
+                                app.config["WPI_PASS"],
+                                query,
+                                parameters)
+
+    return stream_feature_collection(query_result)
+
+@app.route('/api/ports_geojson/', methods=['GET'])
+def get_all_ports_geojson():
+
+    # Call the function: "ports_geojson()" without a viewport.
+    return ports_geojson()
+
+@app.route('/api/ports_in_viewport/<coords>', methods=['GET'])
+def get_ports_in_viewport(coords):
+
+    # Call the function: "ports_geojson()" and pass the viewport.
+    return ports_geojson(coords)
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+# 16.2) Create the function which retrieves the Ports visited by a tracker.
+#       The nearest port of every transmission is stored in MongoDB by the
+#       nearest-port-join.py file. A port is visited when a transmission is
+#       closer to the port than PORT_VISIT_DISTANCE meters, which can be
+#       changed with the parameter: "?max_distance=10000".
+#
+#       MongoDB counts the transmissions per port, and the names of the
+#       ports are retrieved from PostgreSQL afterwards.
+@app.route('/api/ports_visited/<id>', methods=['GET'])
+def get_ports_visited(id):
+
+    # The distance has to be a positive number of meters.
+    try:
+        max_distance = float(request.args.get('max_distance',
+                                              app.config["PORT_VISIT_DISTANCE"]))
+    except ValueError:
+        max_distance = None
+
+    if max_distance is None or not np.isfinite(max_distance) or max_distance < 0:
+        return Response("Invalid max_distance: " + str(request.args.get('max_distance')),
+                        status=400)
+
+    # If the transmissions are stored in buckets, the nearest ports are
+    # stored in lists. We unwind the lists so every transmission becomes a
+    # separate document.
+    if app.config["CRANE_STORAGE_LAYOUT"] == "buckets":
+        collection = crane_connection.db.transmission_bucket
+        pipeline = [
+            {"$match": {"tracker": ObjectId(id)}},
+            {"$project": {"timestamp": 1, "port_id": 1, "port_distance": 1}},
+            {"$unwind": {"path": "$port_id", "includeArrayIndex": "i"}},
+            {"$project": {"port_id": 1,
+                          "distance": {"$arrayElemAt": ["$port_distance", "$i"]},
+                          "timestamp": {"$arrayElemAt": ["$timestamp", "$i"]}}}]
+
+    else:
+        collection = crane_connection.db.transmission
+        pipeline = [
+            {"$match": {"tracker": ObjectId(id),
+                        "nearest_port.distance": {"$lte": max_distance}}},
+            {"$project": {"port_id": "$nearest_port.id",
+                          "distance": "$nearest_port.distance",
+                          "timestamp": 1}}]
+
+    # Count the transmissions near each port, and the first and last time
+    # the crane was near the port.
+    pipeline += [
+        {"$match": {"port_id": {"$ne": None},
+                    "distance": {"$lte": max_distance}}},
+        {"$group": {"_id": "$port_id",
+                    "transmissions": {"$sum": 1},
+                    "min_distance": {"$min": "$distance"},
+                    "first": {"$min": "$timestamp"},
+                    "last": {"$max": "$timestamp"}}},
+        {"$sort": {"first": 1}}]
+
+    visits = list(collection.aggregate(pipeline))
+
+    # Retrieve the name, country and coordinates of the visited ports.
+    ports = {}
+
+    if visits:
+        query = """SELECT gid, port_name, country, ST_X(geom), ST_Y(geom)
+                   FROM wpi WHERE gid = ANY(%s);"""
+
+        for gid, port_name, country, lon, lat in query_pgsql(
+                app.config["WPI_DATABASE"],
+                app.config["WPI_HOST"],
+                app.config["WPI_USER"],
+                app.config["WPI_PASS"],
+                query,
+                ([visit["_id"] for visit in visits],)):
+            ports[gid] = {"port_name": port_name,
+                          "country": country,
+                          "coordinates": [lon, lat]}
+
+    query_result = []
+
+    for visit in visits:
+        port = {"port_id": visit.pop("_id")}
+        port.update(ports.get(port["port_id"], {}))
+        port.update(visit)
+        query_result.append(port)
+
+    # Return the results in a valid JSON format.
+    return json.dumps(query_result, default=json_util.default)
 
 
 # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
@@ -400,32 +2337,93 @@ def get_all_ports():
 #        • The route which is bound to the function is:
 #          “ http://localhost/api/get_all_tilestache_entries/”
 #        • The name of the function is: “get_all_tilestache_entries()”
-#        • This function scrapes all the <p> tags from the HTML file located
-#           at: “http:localhost/tiles/”
+#        • The entries are the <p> tags of the index file (entries.html)
+#          which is defined in the tilestache configuration file
+#          (TILESTACHE_CONFIG). If the configuration file has no index file,
+#          the names of all the layers in the configuration file are used.
+#        • The entries are read from disk once, and kept in memory. They are
+#          only read again when the modification time of the configuration
+#          file or the index file changes, so the Tilestache Tileserver is
+#          not contacted at all.
+#        • The response contains an ETag. If the Angular applications send
+#          the same ETag back (If-None-Match), an empty "304 Not Modified"
+#          response is returned.
 #
 # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
-@app.route('/api/get_tilestache_entries/')
-def get_all_tilestache_entries():
 
-    # Scrape the HTML page located at: "http://localhost/tiles/"
-    scraped_entries = BeautifulSoup(
-        urlopen(app.config["TILESTACHE_INDEX"]),features="html.parser")
+# The entries which are kept in memory, together with the modification times
+# of the files they were read from.
+tilestache_entries = {"index_path": None, "mtimes": None, "body": None, "etag": None}
+
+# Here we create a function which returns the location of the index file
+# defined in the tilestache configuration, or None if there is no index file.
+# A relative location is relative to the folder of the configuration file.
+def tilestache_index_path(config_path, config):
+
+    if "index" not in config:
+        return None
+
+    return os.path.join(os.path.dirname(config_path), config["index"])
+
+# Here we create a function which returns the modification time of a file,
+# or None if the file does not exist.
+def modification_time(path):
+    try:
+        return os.stat(path).st_mtime_ns
+    except (OSError, TypeError):
+        return None
+
+# Here we create a function which reads the entries from the configuration
+# file and the index file.
+def read_tilestache_entries(config_path):
+
+    with open(config_path) as config_file:
+        config = json.load(config_file)
+
+    index_path = tilestache_index_path(config_path, config)
+
+    if index_path is not None and os.path.exists(index_path):
+        with open(index_path) as index_file:
+            scraped_entries = BeautifulSoup(index_file, features="html.parser")
+
+        return index_path, [tag.text for tag in scraped_entries.find_all('p')]
+
+    return index_path, list(config.get("layers", {}))
+
+# Here we create a function which returns the entries from memory, and reads
+# them again if one of the files was changed.
+def cached_tilestache_entries():
 
-    # Create an empty list called: "entries"
-    entries = []
+    config_path = app.config["TILESTACHE_CONFIG"]
+    index_path = tilestache_entries["index_path"]
 
-    # Loop trough all the HTML elements on the page.
-    # Execute the code in the FOR loop if the HTML elememt tag
-    # matches 'p'.
-    for tag in scraped_entries.find_all('p'):
+    mtimes = (modification_time(config_path), modification_time(index_path))
+
+    if mtimes != tilestache_entries["mtimes"]:
+        index_path, entries = read_tilestache_entries(config_path)
+        body = json.dumps(entries)
+
+        tilestache_entries.update({
+            "index_path": index_path,
+            "mtimes": (modification_time(config_path), modification_time(index_path)),
+            "body": body,
+            "etag": hashlib.md5(body.encode('utf-8')).hexdigest()})
+
+    return tilestache_entries
+
+@app.route('/api/get_tilestache_entries/')
+def get_all_tilestache_entries():
 
-        # If an HTML elements matches with the <p> tag, the content
-        # of the <p> tag will be encoded en decoded. Then we append
-        # it to the list of entries.
-        entries.append(tag.text.encode('utf-8').decode('utf-8'))
+    entries = cached_tilestache_entries()
+
+    # Create the response and add the ETag. make_conditional() replaces the
+    # response by a "304 Not Modified" if the ETag matches the request.
+    response = Response(entries["body"], mimetype='application/json')
+    response.set_etag(entries["etag"])
+    response.headers["Cache-Control"] = "no-cache"
 
     # Return the entries in JSON format
-    return json.dumps(entries, default=json_util.default)
+    return response.make_conditional(request)
 
 
 # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
@@ -450,10 +2448,10 @@ def get_all_trails():
 
     # We transform the query result into a list and assign the result to a
     # variable called: "query_result".
-    query_result = list(trail_connection.db.trail.find())
+    query_result = trail_connection.db.trail.find()
 
-    # We return the query_result as json.
-    return json.dumps(query_result, default=json_util.default)
+    # We stream the query_result as json.
+    return stream_json(query_result)
 
 # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
 # 19) Create the function which retrieves a trail, stored in our
@@ -467,15 +2465,32 @@ def get_one_trail(id):
     # We return the query_result as JSON.
     return json.dumps(query_result, default=json_util.default)
 
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+# 19.1) Create the function which retrieves the trails of which the route
+#       intersects with the viewport of the map. The viewport is passed as:
+#       "min_lon,min_lat,max_lon,max_lat".
+@app.route('/api/trails_in_viewport/<coords>', methods=['GET'])
+def get_trails_in_viewport(coords):
+
+    # Call the function: "query_viewport()" and pass the trail collection.
+    return query_viewport(trail_connection.db.trail, coords)
+
 # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
 # 20) Create the function which retrieves the total amount of signals in the
 #     Trail database.
 @app.route('/api/signals_count/', methods=['GET'])
 def get_all_signals_count():
 
-    # we assign transform the result of the query to a string and assign it to
-    # a variable called: "query_result".
-    query_result = str(trail_connection.db.signal.count())
+    # If the signals are stored in buckets, we add up the amount of signals in
+    # each bucket.
+    if app.config["TRAIL_STORAGE_LAYOUT"] == "buckets":
+        query_result = str(sum(bucket["count"] for bucket in
+            trail_connection.db.signal_bucket.find({}, {"count": 1})))
+
+    # Otherwise we assign transform the result of the query to a string and
+    # assign it to a variable called: "query_result".
+    else:
+        query_result = str(trail_connection.db.signal.count())
 
     # We return the query_result which is a string.
     return query_result
@@ -491,11 +2506,19 @@ def get_all_signals_by_id(id):
     # id passed in the function. the [:3000] is used to only return
     # the first 3000 results which are assigned to a variable called:
     # "query_result"
-    query_result = list(trail_connection.db.signal.find(
-    {"trail": ObjectId(id)})[:3000])
+    query_result = trail_connection.db.signal.find(
+    {"trail": ObjectId(id)}, track_projection("time"))[:3000]
 
-    # The result of the query is returned as JSON.
-    return json.dumps(query_result, default=json_util.default)
+    # If the signals are stored in buckets, we unpack the first 3000 signals
+    # from the buckets of the trail instead.
+    if app.config["TRAIL_STORAGE_LAYOUT"] == "buckets":
+        query_result = unpack_buckets(
+            trail_connection.db.signal_bucket.find(
+                {"trail": ObjectId(id)}).sort("start", 1),
+            signal_from_bucket, "time", limit=3000)
+
+    # The result of the query is returned as JSON or in the binary format.
+    return track_response(query_result, "time")
 
 # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
 # 22) Create the function which retrieves a certain amount of signals from a
@@ -506,14 +2529,53 @@ def get_all_signals_amount(id,amount):
 
     # Here we create a query which obtains a certain amounf ot signals belonging
     # end date which were passed as input paramaters and transformed above.
-    # We transform the result to a list and assign the result to a variable
-    # called:"query_result".
-    query_result = list(trail_connection.db.signal.find(
-        {"trail": ObjectId(id)})[:int(amount)]
-    )
+    # We assign the result to a variable called:"query_result".
+    query_result = trail_connection.db.signal.find(
+        {"trail": ObjectId(id)}, track_projection("time"))[:int(amount)]
 
-    # Here we return the query_result as JSON.
-    return json.dumps(query_result, default=json_util.default)
+    # If the signals are stored in buckets, we unpack the amount of signals
+    # from the buckets of the trail instead.
+    if app.config["TRAIL_STORAGE_LAYOUT"] == "buckets":
+        query_result = unpack_buckets(
+            trail_connection.db.signal_bucket.find(
+                {"trail": ObjectId(id)}).sort("start", 1),
+            signal_from_bucket, "time", limit=int(amount))
+
+    # Here we return the query_result as JSON or in the binary format.
+    return track_response(query_result, "time")
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+# 22.1) Create the function which returns a sample of at most the given
+#       amount of signals, spread evenly over the whole route of a trail.
+@app.route('/api/signals_by_stride/<id>/<amount>', methods=['GET'])
+def get_signals_stride(id,amount):
+
+    # If the signals are stored in buckets, the buckets are passed as well.
+    buckets = None
+    if app.config["TRAIL_STORAGE_LAYOUT"] == "buckets":
+        buckets = trail_connection.db.signal_bucket
+
+    # Call the function: "query_stride()" and pass the signal collection.
+    return query_stride(trail_connection.db.signal, buckets, "trail", "time",
+                        signal_from_bucket, id, amount)
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+# 22.2) Create the function which returns one signal per interval of time
+#       (Ex.: "30m", "6h" or "1d") of a trail. The query parameter
+#       "?method=average" returns the average position of each interval
+#       instead of the first signal.
+@app.route('/api/signals_by_interval/<id>/<interval>', methods=['GET'])
+def get_signals_interval(id,interval):
+
+    # If the signals are stored in buckets, the buckets are passed as well.
+    buckets = None
+    if app.config["TRAIL_STORAGE_LAYOUT"] == "buckets":
+        buckets = trail_connection.db.signal_bucket
+
+    # Call the function: "query_interval()" and pass the signal collection.
+    return query_interval(trail_connection.db.signal, buckets, "trail", "time",
+                          signal_from_bucket, id, interval,
+                          request.args.get('method', 'first'))
 
 # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
 # 23) Create the function which retrieves all signals between a timeframe from
@@ -529,14 +2591,298 @@ def get_all_signals_dtg(id,dtg_1,dtg_2):
 
     # Here we create a query which obtains the signals between the start and
     # end date which were passed as input paramaters and transformed above.
-    # We transform the result to a list and assign the result to a variable
-    # called:"query_result".
-    query_result = list(trail_connection.db.signal.find(
-        {"time": { "$gt": dtg_1, "$lt": dtg_2},"trail":ObjectId(id)})
-    )
+    # We assign the result to a variable called:"query_result".
+    query_result = trail_connection.db.signal.find(
+        {"time": { "$gt": dtg_1, "$lt": dtg_2},"trail":ObjectId(id)},
+        track_projection("time"))
+
+    # If the signals are stored in buckets, we search for the buckets which
+    # overlap with the DTG's and unpack the signals between them.
+    if app.config["TRAIL_STORAGE_LAYOUT"] == "buckets":
+        query_result = unpack_buckets(
+            trail_connection.db.signal_bucket.find(
+                {"trail": ObjectId(id),
+                 "start": {"$lt": dtg_2},
+                 "end": {"$gt": dtg_1}}).sort("start", 1),
+            signal_from_bucket, "time", start=dtg_1, end=dtg_2)
+
+    # Here we return the query_result as JSON or in the binary format.
+    return track_response(query_result, "time")
 
-    # Here we return the query_result as JSON.
-    return json.dumps(query_result, default=json_util.default)
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+# 23.0) Create the function which retrieves all the signals of a certain trail
+#       in a given polygon. This works the same as the function which
+#       retrieves the transmissions of a tracker in a polygon.
+@app.route('/api/signals_in_polygon/<id>/<coords>', methods=['GET'])
+def get_all_signals_in_polygon(id,coords):
+
+    # If the signals are stored in buckets, the buckets are passed as well.
+    buckets = None
+    if app.config["TRAIL_STORAGE_LAYOUT"] == "buckets":
+        buckets = trail_connection.db.signal_bucket
+
+    # Call the function: "query_polygon()" and pass the signal collection.
+    return query_polygon(trail_connection.db.signal, buckets, "trail", "time",
+                         signal_from_bucket, id, coords)
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+# 23.1) Create the function which pages through all the signals of a certain
+#       trail, sorted by time. This works the same as the function which pages
+#       through the transmissions of a tracker.
+@app.route('/api/signals_by_page/<id>/<amount>', methods=['GET'])
+@app.route('/api/signals_by_page/<id>/<amount>/<token>', methods=['GET'])
+def get_signals_page(id,amount,token=None):
+
+    # If the signals are stored in buckets, the buckets are passed as well.
+    buckets = None
+    if app.config["TRAIL_STORAGE_LAYOUT"] == "buckets":
+        buckets = trail_connection.db.signal_bucket
+
+    # Call the function: "query_page()" and pass the signal collection,
+    # the name of the reference field and the name of the time field.
+    return query_page(trail_connection.db.signal, buckets, "trail", "time",
+                      signal_from_bucket, id, amount, token)
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+# 23.2) Create the function which retrieves the simplified track of a certain
+#       trail for the zoom level of the map.
+@app.route('/api/signals_by_zoom/<id>/<zoom>', methods=['GET'])
+def get_signals_zoom(id,zoom):
+
+    # Call the function: "query_level()" and pass the collection containing
+    # the simplified tracks of the trails.
+    return query_level(trail_connection.db.signal_level, "trail", id, zoom)
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+# 23.3) Create the function which returns a heatmap of the signals of all
+#       trails, or of one trail with "?trail=<MongoID>". The other query
+#       parameters are described at 3.10.
+@app.route('/api/signals_heatmap/<resolution>', methods=['GET'])
+def get_signals_heatmap(resolution):
+
+    # Call the function: "query_heatmap()" and pass the Trail database.
+    return query_heatmap("trail", trail_connection.db, "signal", "trail", "time",
+                         app.config["TRAIL_STORAGE_LAYOUT"] == "buckets",
+                         resolution)
+
+
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+#                                                                             #
+#                 VECTOR TILES OF THE CRANE AND TRAIL DATA                    #
+#                                                                             #
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+# Instead of sending all the transmissions or signals of a track as JSON and
+# drawing them in the browser, the 2D map viewer can request them as Mapbox
+# Vector Tiles, in the same way as it requests the raster tiles of TileStache.
+# A tile only contains the data which is visible in that tile:
+# - When the map is zoomed in further than TILE_LINE_MAX_ZOOM (defined in the
+#   config.py file), every transmission or signal in the tile is a point,
+#   unless the tile contains more than TILE_MAX_FEATURES points.
+# - Otherwise every track in the tile is a line, using the simplified copy of
+#   the track for the zoom level (the level of detail pyramid). The tracks in
+#   the tile are found with the envelope which is stored on every tracker and
+#   trail.
+#
+# Creating a tile takes a few queries, so every tile is stored in a cache on
+# disk (TILE_CACHE_PATH), in the same way as the "Disk" cache of TileStache.
+# The cache is kept per version of the data (see 3.9), so the tiles are
+# created again after new data is imported.
+
+# The size of a vector tile, in tile coordinates.
+TILE_EXTENT = 4096
+
+# The part of the size of a tile which is added around the tile, so points and
+# lines on the edge of a tile are drawn completely.
+TILE_BUFFER = 1.0 / 64
+
+# The datasets of which vector tiles can be requested. For each dataset we
+# define the collections and the names of the fields which are used.
+TILE_DATASETS = {
+    "crane": {"connection": crane_connection,
+              "layout": "CRANE_STORAGE_LAYOUT",
+              "tracks": "tracker",
+              "points": "transmission",
+              "levels": "transmission_level",
+              "reference": "tracker",
+              "time": "timestamp"},
+    "trail": {"connection": trail_connection,
+              "layout": "TRAIL_STORAGE_LAYOUT",
+              "tracks": "trail",
+              "points": "signal",
+              "levels": "signal_level",
+              "reference": "trail",
+              "time": "time"},
+}
+
+# Here we create a function which returns the longitude of the left edge of
+# tile column "x" and the latitude of the top edge of tile row "y".
+def tile_to_lon_lat(z, x, y):
+    n = 2.0 ** z
+    lon = x / n * 360.0 - 180.0
+    lat = np.degrees(np.arctan(np.sinh(np.pi * (1 - 2 * y / n))))
+    return lon, lat
+
+# Here we create a function which returns the bounds of a tile, including the
+# buffer, as (min_lon, min_lat, max_lon, max_lat).
+def tile_bounds(z, x, y):
+    min_lon, max_lat = tile_to_lon_lat(z, x - TILE_BUFFER, y - TILE_BUFFER)
+    max_lon, min_lat = tile_to_lon_lat(z, x + 1 + TILE_BUFFER, y + 1 + TILE_BUFFER)
+    return (max(min_lon, -180.0), max(min_lat, -MAX_MERCATOR_LATITUDE),
+            min(max_lon, 180.0), min(max_lat, MAX_MERCATOR_LATITUDE))
+
+# Here we create a function which converts arrays of longitudes and latitudes
+# to the coordinates of a tile (0 to TILE_EXTENT). The y coordinate goes up,
+# which is what mapbox_vector_tile expects by default.
+def lon_lat_to_tile(z, x, y, lon, lat):
+    n = 2.0 ** z
+    lat = np.radians(np.clip(np.asarray(lat, dtype=float),
+                             -MAX_MERCATOR_LATITUDE, MAX_MERCATOR_LATITUDE))
+
+    column = (np.asarray(lon, dtype=float) + 180.0) / 360.0 * n - x
+    row = (1 - np.log(np.tan(lat) + 1 / np.cos(lat)) / np.pi) / 2 * n - y
+
+    return column * TILE_EXTENT, (1 - row) * TILE_EXTENT
+
+# Here we create a function which returns the GeoJSON polygon of the bounds
+# of a tile.
+def bounds_polygon(min_lon, min_lat, max_lon, max_lat):
+    return {"type": "Polygon",
+            "coordinates": [[[min_lon, min_lat], [max_lon, min_lat],
+                             [max_lon, max_lat], [min_lon, max_lat],
+                             [min_lon, min_lat]]]}
+
+# Here we create the function which returns the features of the points in a
+# tile: every transmission or signal is a point with the MongoID of its
+# tracker or trail and its time (in milliseconds since 1970-01-01). If the
+# tile contains more than TILE_MAX_FEATURES points, None is returned, so the
+# tile contains the lines instead of an arbitrary part of the points.
+def point_features(dataset, z, x, y):
+
+    collection = dataset["connection"].db[dataset["points"]]
+
+    query_result = collection.find(
+        {"geometry.coord": {"$geoWithin": {
+            "$geometry": bounds_polygon(*tile_bounds(z, x, y))}}},
+        {"_id": 0, "geometry.coord": 1, dataset["reference"]: 1,
+         dataset["time"]: 1}).limit(app.config["TILE_MAX_FEATURES"] + 1)
+
+    features = []
+
+    for document in query_result:
+
+        if len(features) == app.config["TILE_MAX_FEATURES"]:
+            return None
+
+        lon, lat = document["geometry"]["coord"]["coordinates"]
+        column, row = lon_lat_to_tile(z, x, y, [lon], [lat])
+
+        properties = {dataset["reference"]: str(document[dataset["reference"]])}
+        if document.get(dataset["time"]) is not None:
+            properties["time"] = datetime_to_milliseconds(document[dataset["time"]])
+
+        features.append({"geometry": Point(column[0], row[0]),
+                         "properties": properties})
+
+    return features
+
+# Here we create the function which returns the features of the lines in a
+# tile: every track in the tile is a line with the MongoID and name of its
+# tracker or trail.
+def line_features(dataset, z, x, y):
+
+    database = dataset["connection"].db
+    reference = dataset["reference"]
+
+    # Find the trackers or trails of which the envelope intersects the tile.
+    tracks = {track["_id"]: track for track in database[dataset["tracks"]].find(
+        {"envelope": {"$geoIntersects": {
+            "$geometry": bounds_polygon(*tile_bounds(z, x, y))}}},
+        {"name": 1})}
+
+    # Choose the simplified copy of each track: the most detailed level at or
+    # below the zoom level of the tile, or the least detailed level if there
+    # is no such level.
+    chosen = {}
+    for level in database[dataset["levels"]].find(
+            {reference: {"$in": list(tracks)}}, {reference: 1, "zoom": 1}):
+
+        current = chosen.get(level[reference])
+        if current is None or \
+           (current["zoom"] > z and level["zoom"] < current["zoom"]) or \
+           (z >= level["zoom"] > current["zoom"]):
+            chosen[level[reference]] = level
+
+    # The lines are clipped to the tile, including the buffer.
+    edge = TILE_BUFFER * TILE_EXTENT
+    clip = box(-edge, -edge, TILE_EXTENT + edge, TILE_EXTENT + edge)
+
+    features = []
+
+    for level in database[dataset["levels"]].find(
+            {"_id": {"$in": [level["_id"] for level in chosen.values()]}},
+            {reference: 1, "coords": 1}):
+
+        if len(level["coords"]) < 2:
+            continue
+
+        coords = np.asarray(level["coords"], dtype=float)
+        column, row = lon_lat_to_tile(z, x, y, coords[:, 0], coords[:, 1])
+        line = LineString(np.column_stack((column, row))).intersection(clip)
+
+        if line.is_empty:
+            continue
+
+        track = tracks[level[reference]]
+        features.append({"geometry": line,
+                         "properties": {reference: str(track["_id"]),
+                                        "name": str(track.get("name"))}})
+
+    return features
+
+# Here we create the function which creates a vector tile. The layer of the
+# tile has the same name as the dataset.
+def create_tile(name, z, x, y):
+
+    dataset = TILE_DATASETS[name]
+
+    # The transmissions and signals in buckets have no spatial index, so
+    # tiles of data in the bucket layout always contain lines.
+    points = (z > app.config["TILE_LINE_MAX_ZOOM"] and
+              app.config[dataset["layout"]] != "buckets")
+
+    features = point_features(dataset, z, x, y) if points else None
+
+    # Tiles with too many points contain the lines as well.
+    if features is None:
+        features = line_features(dataset, z, x, y)
+
+    return mapbox_vector_tile.encode([{"name": name, "features": features}])
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+# 24) Create the function which returns a vector tile of a dataset ("crane"
+#     or "trail"). The tile is read from the cache on disk if it was created
+#     before.
+@app.route('/api/tiles/<dataset>/<int:z>/<int:x>/<int:y>.pbf', methods=['GET'])
+def get_vector_tile(dataset,z,x,y):
+
+    # Return a "404 Not Found" for unknown datasets and tiles.
+    if dataset not in TILE_DATASETS or not (0 <= x < 2 ** z and 0 <= y < 2 ** z):
+        return Response(status=404)
+
+    version = dataset_version(TILE_DATASETS[dataset]["connection"].db)
+    location = os.path.join(
+        versioned_cache_folder("TILE_CACHE_PATH", dataset, version),
+        str(z), str(x), str(y) + '.pbf')
+
+    if os.path.exists(location):
+        with open(location, 'rb') as tile_file:
+            tile = tile_file.read()
+
+    else:
+        tile = create_tile(dataset, z, x, y)
+        write_cache_file(location, tile)
+
+    return Response(tile, mimetype='application/x-protobuf')
 
 
 if __name__ == '__main__':
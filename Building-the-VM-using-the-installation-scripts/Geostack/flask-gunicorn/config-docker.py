@@ -15,16 +15,20 @@ CRANE_DATABASE_URI = "mongodb://mongodb-datastore:27017/Crane_Database"
 # Uncomment this line if you are going to run the MongoDB instance in Docker.
 TRAIL_DATABASE_URI = "mongodb://mongodb-datastore:27017/Trail_Database"
 
-# Here we define the Local URI of our Tilestache Server Index file.
+# Here we define the Local location of our Tilestache Server configuration
+# file. The names of the layers are read from this file and from the index
+# file (entries.html) which is defined in it.
 # Uncomment this line if you are going to run the Tilestache Tileserver
 # instance locally.
-#TILESTACHE_INDEX = 'http://localhost/tiles/'
+#TILESTACHE_CONFIG = '/home/geostack/Geostack/tilestache-server/tilestache-configuration.cfg'
 
-# Here we define the Docker URI of our Tilestache Server Index file
+# Here we define the Docker location of our Tilestache Server configuration
+# file. The Geostack folder is mounted in the Flask-API container at:
+# "/downloads" (see the docker-compose.yml file).
 # Uncomment this line if you are going to run the Tilestache Tileserver
 # instance in Docker.
 
-TILESTACHE_INDEX = 'http://nginx-webserver/tiles/'
+TILESTACHE_CONFIG = '/downloads/tilestache-server/tilestache-configuration.cfg'
 
 
 # Here we define the Local URI of our World Port Index database.
@@ -38,3 +42,73 @@ WPI_HOST = "postgresql-datastore"
 WPI_DATABASE = "World_Port_Index_Database"
 WPI_USER = "postgres"
 WPI_PASS = "geostack"
+
+# Here we define the minimum and maximum amount of connections to a
+# PostgreSQL database which are kept open by every Gunicorn worker.
+PGSQL_POOL_MIN = 1
+PGSQL_POOL_MAX = 4
+
+# Here we define the distance, in meters, between a transmission and its
+# nearest port below which the port counts as visited by the crane.
+PORT_VISIT_DISTANCE = 5000
+
+# Here we define the amount of documents which are read from MongoDB and
+# encoded as JSON at once when the results of a query are streamed to the
+# Angular applications.
+STREAM_BATCH_SIZE = 1000
+
+# Here we define the maximum amount of documents which can be requested in
+# one page when paging through the transmissions of a tracker or the signals
+# of a trail.
+MAX_PAGE_SIZE = 5000
+
+# Here we define the maximum amount of points which are returned when a track
+# is sampled by stride or by interval of time.
+MAX_SAMPLE_POINTS = 5000
+
+# Here we define the folder (relative to this file) in which the vector tiles
+# of the crane and trail data are cached.
+TILE_CACHE_PATH = "tile-cache"
+
+# Here we define the highest zoom level at which the vector tiles contain the
+# simplified tracks as lines. At higher zoom levels the tiles contain every
+# transmission or signal as a point.
+TILE_LINE_MAX_ZOOM = 10
+
+# Here we define the maximum amount of points in one vector tile. A tile with
+# more points contains the simplified tracks as lines instead.
+TILE_MAX_FEATURES = 50000
+
+# Here we define the folder (relative to this file) in which the heatmaps of
+# the crane and trail data are cached.
+HEATMAP_CACHE_PATH = "heatmap-cache"
+
+# Here we define the maximum width, in cells, of a heatmap.
+HEATMAP_MAX_RESOLUTION = 2048
+
+# Here we define the amount of degrees of latitude in which the points are
+# counted by MongoDB, before they are added to the rows of a mercator heatmap.
+HEATMAP_LATITUDE_STEP = 0.01
+
+# Here we define the folder in which the data profiles are cached, relative to
+# the folder of the Flask-API.
+PROFILE_CACHE_PATH = "profile-cache"
+
+# Here we define the amount of processes, per Gunicorn worker, which create
+# the data profiles in the background.
+PROFILE_WORKERS = 1
+
+# Here we define the amount of seconds after which a profile job which is
+# still running is assumed to have crashed, so it can be started again.
+PROFILE_JOB_TIMEOUT = 3600
+
+# Here we define the amount of seconds after which the page which is shown
+# while a profile is being created reloads itself.
+PROFILE_REFRESH = 5
+
+# Here we define the layout in which the transmissions and signals are stored
+# by the import scripts. Use "documents" if every transmission or signal is
+# stored as a separate document, or "buckets" if they are stored in one
+# document per day (Crane) or hour (Trail).
+CRANE_STORAGE_LAYOUT = "documents"
+TRAIL_STORAGE_LAYOUT = "documents"
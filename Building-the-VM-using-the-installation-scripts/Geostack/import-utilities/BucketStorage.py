@@ -0,0 +1,161 @@
+# Pandas is used to group the transmissions and signals of a track per hour
+# or per day.
+import pandas as pd
+
+# The UpdateOne operation of PyMongo is used to add the values of a chunk to
+# the buckets which are already in the database.
+from pymongo import UpdateOne
+
+# Here we import the CraneModel and TrailModel Python files.
+import CraneModel
+import TrailModel
+
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+#                                                                             #
+#           STORING TRANSMISSIONS AND SIGNALS IN TIME BUCKETS                 #
+#                                                                             #
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+# Instead of storing every transmission or signal as a separate document, the
+# bucket layout stores one document per tracker (or trail) per day (or hour).
+# The values of the transmissions or signals are stored in lists, in which the
+# values at the same position belong to the same transmission or signal.
+#
+# This saves the _id, the reference and the field names of every transmission,
+# and reduces the amount of index entries to one per bucket. The Flask-API
+# unpacks the buckets to transmissions and signals when they are requested.
+#
+# A track can be inserted in parts (see the chunked and incremental import),
+# of which the first and the last day (or hour) can be the same bucket. The
+# values of a part are therefore added to the end of the bucket of their day,
+# which is created if it doesn't exist yet. There is a unique index on
+# (reference, start), see DatabaseIndexes.py. The parts have to be inserted in
+# the order of time.
+#
+# Values without a valid time are not dropped. They are stored in one bucket
+# per track with the start None, so the amount of values in the buckets is
+# the same as the amount of rows of the dataset.
+
+# The size of a bucket, as a Pandas frequency string.
+# The cranes send a transmission every few minutes, so we use a bucket per day.
+# The GPS-Routes contain a signal every second, so we use a bucket per hour.
+TRANSMISSION_BUCKET_SIZE = 'D'
+SIGNAL_BUCKET_SIZE = 'H'
+
+# Here we create a function called: "column_values".
+# The function converts a column of a group to a list of values which can be
+# stored in MongoDB. Unknown values (NaN) are stored as None, and datetimes
+# are converted to Python datetimes.
+def column_values(column):
+
+    if pd.api.types.is_datetime64_any_dtype(column):
+        return [None if pd.isnull(time) else time
+                for time in column.dt.to_pydatetime()]
+
+    return column.astype(object).where(column.notna(), None).tolist()
+
+# Here we create a function called: "bucket_update".
+# The function returns the update which adds the values of a group to the
+# bucket of the group, and creates the bucket if it doesn't exist yet. The
+# lists passed as "clear" are removed from the bucket, since they no longer
+# have a value for every element of the bucket.
+def bucket_update(reference_field, reference, time_field, start, group, clear=()):
+
+    # Create the lists of the bucket. The longitude and latitude columns
+    # are combined into a list of coordinates.
+    lists = {field: column_values(group[field]) for field in group.columns
+             if field not in ('lon', 'lat')}
+    lists['coords'] = group[['lon', 'lat']].values.tolist()
+
+    update = {"$push": {field: {"$each": values} for field, values in lists.items()},
+              "$inc": {"count": len(group)}}
+
+    if clear:
+        update["$unset"] = {field: "" for field in clear}
+
+    # The bucket of the values without a valid time has no end.
+    end = group[time_field].max()
+    if not pd.isnull(end):
+        update["$max"] = {"end": end.to_pydatetime()}
+
+    return UpdateOne({reference_field: reference, "start": start}, update,
+                     upsert=True)
+
+# Here we create a function called: "create_buckets".
+# The function groups the values of a track per bucket and adds each group to
+# its bucket document.
+#
+# The function expects the following parameters:
+# 1) The Document class of the buckets (Ex.: CraneModel.TransmissionBucket)
+# 2) The name of the field which references the tracker or trail
+# 3) The tracker or trail document the track belongs to
+# 4) The name of the time field
+# 5) The size of the buckets (Ex.: 'D')
+# 6) A dictionary containing the name of each list in the bucket and the
+#    values of the track. The coordinates are passed as "lon" and "lat".
+# 7) Optionally the lists which are removed from the buckets to which values
+#    are added (see bucket_update)
+def create_buckets(bucket_document, reference_field, reference, time_field,
+                   bucket_size, columns, clear=()):
+
+    # Create a dataframe from the columns and convert the time column to
+    # datetimes.
+    df = pd.DataFrame(columns)
+    df[time_field] = pd.to_datetime(df[time_field])
+
+    starts = df[time_field].dt.floor(bucket_size)
+
+    updates = []
+
+    # Group the dataframe by the start of the bucket each row belongs to.
+    for start, group in df.groupby(starts):
+        updates.append(bucket_update(reference_field, reference.id, time_field,
+                                     start.to_pydatetime(), group, clear))
+
+    # The rows without a valid time are skipped by groupby(), so they are
+    # added to the bucket without a start.
+    missing = df[starts.isnull()]
+
+    if not missing.empty:
+        print("Storing " + str(len(missing.index)) + " values without a valid "
+              + time_field + " in a separate bucket")
+        updates.append(bucket_update(reference_field, reference.id, time_field,
+                                     None, missing, clear))
+
+    # Add the values to the buckets in bulk.
+    if updates:
+        bucket_document._get_collection().bulk_write(updates, ordered=True)
+
+    print("Updated " + str(len(updates)) + " buckets")
+
+# Here we create a function called: "create_transmission_buckets".
+# The function creates the buckets of the transmissions of a tracker. The
+# nearest ports of the transmissions (see nearest-port-join.py) are removed
+# from the buckets to which transmissions are added, so the lists of the
+# ports never belong to other transmissions. The join has to be run again
+# after new transmissions are imported.
+def create_transmission_buckets(tracker, event_id, timestamp, lon, lat, alt,
+                                ground_speed, visible, sensor_type, tag_voltage):
+
+    create_buckets(CraneModel.TransmissionBucket, "tracker", tracker,
+                   "timestamp", TRANSMISSION_BUCKET_SIZE,
+                   {"event_id": list(event_id),
+                    "timestamp": list(timestamp),
+                    "lon": list(lon),
+                    "lat": list(lat),
+                    "alt": list(alt),
+                    "ground_speed": list(ground_speed),
+                    "visible": list(visible),
+                    "sensor_type": list(sensor_type),
+                    "tag_voltage": list(tag_voltage)},
+                   clear=("port_id", "port_distance"))
+
+# Here we create a function called: "create_signal_buckets".
+# The function creates the buckets of the signals of a trail.
+def create_signal_buckets(trail, time, lon, lat, alt):
+
+    create_buckets(TrailModel.SignalBucket, "trail", trail,
+                   "time", SIGNAL_BUCKET_SIZE,
+                   {"time": list(time),
+                    "lon": list(lon),
+                    "lat": list(lat),
+                    "alt": list(alt)})
@@ -0,0 +1,312 @@
+# NumPy and Pandas are used to convert the columns of a dataset to the
+# correct types at once, instead of converting every row separately.
+import numpy as np
+import pandas as pd
+
+# The BulkWriteError is raised by insert_many() when one or more documents
+# could not be inserted, for example because they already exist.
+from pymongo.errors import BulkWriteError
+
+# The partial function is used to pass the tracker or trail to the function
+# which creates the documents of a chunk.
+from functools import partial
+
+# The tzlocal function is used to convert times to the local timezone, in the
+# same way as datetime.fromtimestamp() does.
+from dateutil.tz import tzlocal
+
+# Here we import the CraneModel and TrailModel Python files.
+import CraneModel
+import TrailModel
+
+# Here we import the MotionMetrics Python file, which defines the names of
+# the motion metrics.
+import MotionMetrics
+
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+#                                                                             #
+#              LOADING TRANSMISSIONS AND SIGNALS IN BULK                      #
+#                                                                             #
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+# Creating a MongoEngine Document (and its EmbeddedDocuments) for every row of
+# a dataset is slow, and keeping all of them in a list uses a lot of memory.
+# The functions below convert the columns of a dataset to the correct types at
+# once, create plain dictionaries with the same structure as the documents in
+# CraneModel.py and TrailModel.py, and insert them in chunks using PyMongo.
+#
+# Every transmission or signal gets a sequence number: its position in the
+# track, starting at 0. The Flask-API uses it to sample every n-th point of a
+# track with a single index lookup. When a track is inserted in parts (see
+# the chunked and incremental import), the sequence number of the first
+# point of a part is passed as "first_seq".
+
+# The amount of documents which are created and inserted at once.
+CHUNK_SIZE = 10000
+
+# Here we create a function called: "float_values".
+# The function converts a column to an array of floats. Values which can't be
+# converted are stored as NaN.
+#
+# Columns which are stored as float32 (see SourceProfiles.py) are converted
+# through their text value. A float32 of 3.72 would otherwise be stored as
+# 3.7200000286102295 in MongoDB.
+def float_values(column):
+
+    column = pd.Series(column)
+
+    if column.dtype == np.float32:
+        return column.to_numpy().astype(str).astype(float)
+
+    return pd.to_numeric(column, errors='coerce').to_numpy(dtype=float)
+
+# Here we create a function called: "bool_values".
+# The function converts a column to an array of booleans. Text values such as
+# "true" and "false" are converted to True and False.
+def bool_values(column):
+    column = pd.Series(column)
+
+    if column.dtype == object:
+        column = column.astype(str).str.lower().isin(['true', '1'])
+
+    return column.to_numpy(dtype=bool)
+
+# Here we create a function called: "datetime_values".
+# The function converts a column to an array of Python datetimes. Unknown
+# times are stored as None.
+def datetime_values(column):
+    times = pd.to_datetime(pd.Series(column))
+    return np.array([None if pd.isnull(time) else time
+                     for time in times.dt.to_pydatetime()], dtype=object)
+
+# Here we create a function called: "milliseconds_to_datetimes".
+# The function converts a column with the amount of milliseconds since
+# 1970-01-01 to local Python datetimes. This gives the same result as calling
+# datetime.fromtimestamp(value/1000) on every value.
+def milliseconds_to_datetimes(column):
+    times = pd.to_datetime(float_values(column), unit='ms', utc=True)
+    return datetime_values(times.tz_convert(tzlocal()).tz_localize(None))
+
+# Here we create a function called: "without_none".
+# MongoEngine does not store fields which are None, so we remove them from the
+# dictionaries as well.
+def without_none(document):
+    return {key: value for key, value in document.items() if value is not None}
+
+# Here we create a function called: "none_if_nan".
+# The function converts NaN values of an integer column to None.
+def none_if_nan(value):
+    return None if np.isnan(value) else int(value)
+
+# Here we create a function called: "existing_values".
+# The function returns the values of a field which are already stored in a
+# collection, out of the values passed as parameter. The field can also be a
+# list of values (Ex.: the event ids in a bucket). Unknown values (NaN) are
+# not searched for.
+def existing_values(collection, field, values):
+
+    values = [value for value in values if not pd.isnull(value)]
+    found = set()
+
+    for start in range(0, len(values), CHUNK_SIZE):
+        for document in collection.find({field: {"$in": values[start:start + CHUNK_SIZE]}},
+                                        {field: 1, "_id": 0}):
+            value = document[field]
+            found.update(value if isinstance(value, list) else [value])
+
+    return found
+
+# Here we create a function called: "duplicate_rows".
+# The function returns a boolean array which is True for every row of which
+# the event id is already stored in a collection, or occurs earlier in the
+# column. It is used to skip transmissions which are already in the database
+# before they are inserted (as documents or in buckets), so the sequence
+# numbers have no gaps and buckets contain every transmission once.
+def duplicate_rows(collection, field, column):
+
+    existing = existing_values(collection, field, column.tolist())
+
+    return (column.isin(existing) | (column.duplicated() & column.notna())).to_numpy()
+
+# Here we create a function called: "sequence_numbers".
+# The function returns the sequence numbers of a part of a track.
+def sequence_numbers(first_seq, length):
+    return np.arange(first_seq, first_seq + length)
+
+# Here we create a function called: "next_seq".
+# The function returns the sequence number of the first point which is added
+# to a track, from the last point of the track which is already in the
+# database. Points which were imported without a sequence number are counted
+# by the amount passed as parameter.
+def next_seq(last_document, count):
+
+    if last_document is not None and last_document.seq is not None:
+        return last_document.seq + 1
+
+    return count or 0
+
+# Here we create a function called: "motion_documents".
+# The function creates the motion dictionaries of a chunk, from the arrays of
+# the motion metrics (see MotionMetrics.py). Unknown metrics are not stored.
+# If no metrics are passed, a list of None values is returned.
+def motion_documents(motion, length):
+
+    if not motion:
+        return [None] * length
+
+    columns = [motion[field].tolist() for field in MotionMetrics.MOTION_FIELDS]
+
+    return [without_none({field: None if np.isnan(value) else value
+                          for field, value in zip(MotionMetrics.MOTION_FIELDS, values)})
+            or None for values in zip(*columns)]
+
+# Here we create a function called: "insert_chunks".
+# The function creates the documents of a track chunk by chunk and inserts
+# each chunk with an unordered insert_many(). Since only one chunk of documents
+# exists at a time, the memory usage doesn't depend on the size of the track.
+#
+# The function expects the following parameters:
+# 1) The PyMongo collection in which the documents are inserted
+# 2) The function which creates the documents of a chunk
+# 3) A dictionary with the arrays of the track. The part of each array which
+#    belongs to a chunk is passed to the function above.
+#
+# Documents which violate a unique index (see DatabaseIndexes.py) already
+# exist in the database and are skipped. The function returns the amount of
+# documents which were inserted.
+def insert_chunks(collection, create_documents, columns):
+
+    total = len(next(iter(columns.values())))
+    inserted = 0
+
+    for start in range(0, total, CHUNK_SIZE):
+
+        # Get the part of each array which belongs to this chunk.
+        chunk = {name: values[start:start + CHUNK_SIZE]
+                 for name, values in columns.items()}
+
+        # Unordered inserts can be spread over multiple threads by MongoDB.
+        # An unordered insert continues after a duplicate document, so the
+        # other documents of the chunk are still inserted.
+        try:
+            result = collection.insert_many(create_documents(**chunk), ordered=False)
+            inserted += len(result.inserted_ids)
+
+        except BulkWriteError as error:
+
+            # Only duplicate key errors (code 11000) are expected.
+            if any(write_error["code"] != 11000
+                   for write_error in error.details["writeErrors"]):
+                raise
+
+            inserted += error.details["nInserted"]
+
+    return inserted
+
+# Here we create a function called: "transmission_documents".
+# The function creates the dictionaries of a chunk of transmissions. They have
+# the same structure as the Transmission documents in CraneModel.py. The
+# arrays of the motion metrics are passed as keyword parameters.
+def transmission_documents(tracker, seq, event_id, timestamp, lon, lat, alt,
+                           ground_speed, visible, sensor_type, tag_voltage,
+                           **motion):
+
+    documents = []
+
+    for values in zip(seq.tolist(), event_id.tolist(), timestamp.tolist(),
+                      lon.tolist(), lat.tolist(), alt.tolist(),
+                      ground_speed.tolist(), visible.tolist(),
+                      sensor_type.tolist(), tag_voltage.tolist(),
+                      motion_documents(motion, len(event_id))):
+
+        (number, event, time, x, y, z, speed, is_visible, sensor, voltage,
+         moving) = values
+
+        # The heading of the Speed document is the calculated heading,
+        # rounded to whole degrees.
+        heading = None
+        if moving is not None and "heading" in moving:
+            heading = int(round(moving["heading"])) % 360
+
+        documents.append(without_none({
+            "event_id": none_if_nan(event),
+            "seq": number,
+            "timestamp": time,
+            "geometry": without_none({
+                "coord": {"type": "Point", "coordinates": [x, y]},
+                "alt": z}),
+            "speed": without_none({"ground_speed": speed, "heading": heading}),
+            "metadata": without_none({
+                "visible": is_visible,
+                "sensor_type": sensor,
+                "tag_voltage": voltage}),
+            "motion": moving,
+            "tracker": tracker}))
+
+    return documents
+
+# Here we create a function called: "signal_documents".
+# The function creates the dictionaries of a chunk of signals. They have the
+# same structure as the Signal documents in TrailModel.py.
+def signal_documents(trail, seq, time, lon, lat, alt, **motion):
+
+    documents = []
+
+    for number, t, x, y, z, moving in zip(seq.tolist(), time.tolist(),
+                                          lon.tolist(), lat.tolist(), alt.tolist(),
+                                          motion_documents(motion, len(time))):
+        documents.append(without_none({
+            "seq": number,
+            "time": t,
+            "geometry": without_none({
+                "coord": {"type": "Point", "coordinates": [x, y]},
+                "alt": z}),
+            "motion": moving,
+            "trail": trail}))
+
+    return documents
+
+# Here we create a function called: "insert_transmissions".
+# The function converts the columns of the transmissions of a tracker to the
+# correct types and inserts them in chunks. The motion metrics of the
+# transmissions (created by MotionMetrics.compute_metrics) can be passed as
+# "motion".
+def insert_transmissions(tracker, event_id, timestamp, lon, lat, alt,
+                         ground_speed, visible, sensor_type, tag_voltage,
+                         motion=None, first_seq=0):
+
+    total = insert_chunks(CraneModel.Transmission._get_collection(),
+                          partial(transmission_documents, tracker.id),
+                          {"seq": sequence_numbers(first_seq, len(event_id)),
+                           "event_id": float_values(event_id),
+                           "timestamp": datetime_values(timestamp),
+                           "lon": float_values(lon),
+                           "lat": float_values(lat),
+                           "alt": float_values(alt),
+                           "ground_speed": float_values(ground_speed),
+                           "visible": bool_values(visible),
+                           "sensor_type": np.asarray(sensor_type, dtype=object),
+                           "tag_voltage": float_values(tag_voltage),
+                           **(motion or {})})
+
+    print("Inserted " + str(total) + " transmissions")
+
+    return total
+
+# Here we create a function called: "insert_signals".
+# The function converts the columns of the signals of a trail to the correct
+# types and inserts them in chunks. The times must already be datetimes.
+# The motion metrics of the signals can be passed as "motion".
+def insert_signals(trail, time, lon, lat, alt, motion=None, first_seq=0):
+
+    total = insert_chunks(TrailModel.Signal._get_collection(),
+                          partial(signal_documents, trail.id),
+                          {"seq": sequence_numbers(first_seq, len(time)),
+                           "time": np.asarray(time, dtype=object),
+                           "lon": float_values(lon),
+                           "lat": float_values(lat),
+                           "alt": float_values(alt),
+                           **(motion or {})})
+
+    print("Inserted " + str(total) + " signals")
+
+    return total
@@ -0,0 +1,207 @@
+# The json module is used to read the records of a JSON array one by one.
+import json
+
+# The os module is used to expand the "~" in the location of a dataset.
+import os
+
+# Pandas is used to read CSV files in chunks and to create a dataframe from
+# each chunk of records.
+import pandas as pd
+
+# Here we import the ParquetStorage Python file, which is used to read Parquet
+# files in chunks.
+import ParquetStorage
+
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+#                                                                             #
+#                   READING LARGE DATASETS IN CHUNKS                          #
+#                                                                             #
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+# A complete Movebank export can contain tens of millions of rows, which does
+# not fit in memory when the whole file is read with pd.read_csv() or
+# pd.read_json(). The functions below read a CSV file or a JSON array in
+# chunks of rows, so only one chunk is in memory at a time. The chunks can be
+# passed to the BulkLoader one after the other.
+
+# The amount of rows in a chunk.
+READ_CHUNK_ROWS = 100000
+
+# The amount of characters which are read from a JSON file at once.
+READ_BLOCK_SIZE = 1024 * 1024
+
+# Here we create a function called: "iter_json_records".
+# The function reads a JSON file containing an array of records, as created by
+# DataFrame.to_json(orient='records'), and returns the records one by one.
+# Blocks of the file are read when they are needed, so the file is never
+# loaded in memory completely.
+def iter_json_records(location, block_size=READ_BLOCK_SIZE):
+
+    decoder = json.JSONDecoder()
+
+    with open(os.path.expanduser(location), 'r') as input_file:
+
+        # The file has to start with the opening bracket of the array.
+        buffer = input_file.read(block_size).lstrip()
+
+        if not buffer.startswith('['):
+            raise ValueError("The file: " + location + " does not contain a JSON array")
+
+        position = 1
+        end_of_file = False
+
+        while True:
+
+            # Skip the whitespace and the commas between the records.
+            while position < len(buffer) and buffer[position] in ' \t\r\n,':
+                position += 1
+
+            # The closing bracket is the end of the array.
+            if position < len(buffer) and buffer[position] == ']':
+                return
+
+            try:
+                # Decode the record which starts at the current position.
+                record, position = decoder.raw_decode(buffer, position)
+
+            except json.JSONDecodeError:
+
+                # The record is not complete yet. If the end of the file was
+                # already reached, the file is invalid.
+                if end_of_file:
+                    raise
+
+                # Read the next block of the file. The part of the buffer
+                # which has already been decoded is dropped.
+                block = input_file.read(block_size)
+                end_of_file = block == ''
+                buffer = buffer[position:] + block
+                position = 0
+                continue
+
+            yield record
+
+# Here we create a function called: "read_json_chunks".
+# The function reads a JSON array of records and returns a dataframe for each
+# chunk of records.
+def read_json_chunks(location, chunk_rows=READ_CHUNK_ROWS):
+
+    records = []
+
+    for record in iter_json_records(location):
+        records.append(record)
+
+        if len(records) == chunk_rows:
+            yield pd.DataFrame.from_records(records)
+            records = []
+
+    # Return the last (incomplete) chunk.
+    if records:
+        yield pd.DataFrame.from_records(records)
+
+# Here we create a function called: "read_csv_chunks".
+# The function reads a CSV file and returns a dataframe for each chunk of rows.
+# Only the columns passed as "usecols" are read. All values are read as text,
+# in the same way as the dataset-convert Python file does.
+def read_csv_chunks(location, usecols=None, chunk_rows=READ_CHUNK_ROWS):
+    return pd.read_csv(os.path.expanduser(location), usecols=usecols,
+                       dtype='unicode', chunksize=chunk_rows)
+
+# Here we create a function called: "is_parquet".
+# The function returns True if the location is a Parquet file, and False if it
+# is a JSON file.
+def is_parquet(location):
+    return location.endswith('.parquet')
+
+# Here we create a function called: "read_chunks".
+# The function reads a Parquet file or a JSON array in chunks. Only the columns
+# passed as parameter are read from a Parquet file. All the columns are read
+# from a JSON file, since the records have to be parsed completely anyway.
+def read_chunks(location, columns=None):
+
+    if is_parquet(location):
+        return ParquetStorage.read_parquet_chunks(location, columns)
+
+    return read_json_chunks(location)
+
+# Here we create a function called: "read_first_record".
+# The function returns the first record of a Parquet file or a JSON array as
+# a dictionary, or None if there are no records.
+def read_first_record(location):
+
+    if is_parquet(location):
+        return ParquetStorage.read_first_record(location)
+
+    return next(iter_json_records(location), None)
+
+# Here we create a function called: "write_json_chunks".
+# The function writes the dataframes of the chunks to one JSON array of
+# records. The result is the same as calling DataFrame.to_json(orient='records')
+# on the complete dataset, except that datetimes are written as text in the
+# ISO8601 format (Ex.: 2018-04-01T00:00:05.000), like in the CSV files. The
+# function returns the amount of rows written.
+def write_json_chunks(chunks, location):
+
+    total = 0
+
+    with open(os.path.expanduser(location), 'w') as output_file:
+
+        output_file.write('[')
+
+        for chunk in chunks:
+
+            if chunk.empty:
+                continue
+
+            # Remove the brackets of the array of this chunk, and separate it
+            # from the previous chunk with a comma.
+            if total > 0:
+                output_file.write(',')
+            output_file.write(chunk.to_json(orient='records', date_format='iso')[1:-1])
+
+            total += len(chunk.index)
+            print("Written " + str(total) + " rows to: " + location)
+
+        output_file.write(']')
+
+    return total
+
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+#                                                                             #
+#                 CALCULATING THE METADATA OF A TRACK IN CHUNKS               #
+#                                                                             #
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+# The Tracker and Trail documents contain the start date, end date and the
+# amount of transmissions or signals of a track. When a track is read in
+# chunks, these values are updated after every chunk.
+
+# Here we create a function called: "new_summary".
+# The function returns the summary of a track of which no rows are read yet.
+def new_summary():
+    return {"start": None, "end": None, "count": 0}
+
+# Here we create a function called: "update_summary".
+# The function updates the summary of a track with the times of a chunk.
+# The times have to be a Pandas Series of datetimes.
+def update_summary(summary, times):
+
+    summary["count"] += len(times)
+
+    times = times.dropna()
+
+    if times.empty:
+        return summary
+
+    start, end = times.min().to_pydatetime(), times.max().to_pydatetime()
+
+    if summary["start"] is None or start < summary["start"]:
+        summary["start"] = start
+    if summary["end"] is None or end > summary["end"]:
+        summary["end"] = end
+
+    return summary
+
+# Here we create a function called: "print_progress".
+# The function prints the progress of the import after a chunk is inserted.
+def print_progress(name, chunk_number, chunk_rows, summary):
+    print("Chunk " + str(chunk_number + 1) + " of: " + str(name) + ": inserted "
+          + str(chunk_rows) + " rows (" + str(summary["count"]) + " in total)")
@@ -10,6 +10,9 @@ from mongoengine import *
 
 class Tracker(Document):
 
+    # The index on the envelope is defined in DatabaseIndexes.py.
+    meta = {'auto_create_index': False}
+
     # Name of the study
     study_name = StringField()
 
@@ -31,6 +34,29 @@ class Tracker(Document):
     #Amount of the transmissions related to the tracker
     transmission_Count= IntField()
 
+    # Total distance of the track in meters
+    total_distance = FloatField()
+
+    # Total time, in seconds, between the transmissions of which the speed is
+    # known
+    moving_time = FloatField()
+
+    # Highest speed between two transmissions, in meters per second
+    max_speed = FloatField()
+
+    # Average speed of the track, in meters per second
+    average_speed = FloatField()
+
+    # Bounding box of the track [min_lon, min_lat, max_lon, max_lat]
+    bbox = ListField(FloatField())
+
+    # Convex hull of the track, used to find the trackers in a map viewport
+    envelope = PolygonField()
+
+    # Lowest and highest altitude of the track
+    min_alt = FloatField()
+    max_alt = FloatField()
+
 class TransmissionMetadata(EmbeddedDocument):
 
     #Is the tracker still visible or not?
@@ -59,11 +85,51 @@ class Speed(EmbeddedDocument):
     # Heading of the Crane in degrees
     heading = IntField()
 
+class Motion(EmbeddedDocument):
+
+    # The values below are calculated from the previous transmission of the
+    # tracker by MotionMetrics.py.
+
+    # Heading from the previous transmission, in degrees (0 = north)
+    heading = FloatField()
+
+    # Distance from the previous transmission, in meters
+    step_distance = FloatField()
+
+    # Time since the previous transmission, in seconds
+    time_delta = FloatField()
+
+    # Speed since the previous transmission, in meters per second
+    speed = FloatField()
+
+    # Distance from the first transmission, in meters
+    cumulative_distance = FloatField()
+
+    # Change of the heading compared to the previous step, in degrees
+    turning_angle = FloatField()
+
+class NearestPort(EmbeddedDocument):
+
+    # The values below are calculated by the nearest-port-join.py file.
+
+    # Id of the nearest port (the "gid" of the World Port Index)
+    id = IntField()
+
+    # Distance to the nearest port, in meters
+    distance = FloatField()
+
 class Transmission(Document):
 
+    # The indexes of this collection are defined in DatabaseIndexes.py.
+    # MongoEngine should not create its own index on the PointField.
+    meta = {'auto_create_index': False}
+
     # Identifier of the transmission
     event_id = IntField()
 
+    # Position of the transmission in the track of the tracker, starting at 0
+    seq = IntField()
+
     # Timestamp of when transmission was send
     timestamp = DateTimeField()
 
@@ -76,5 +142,64 @@ class Transmission(Document):
     # Embedded metadata of transmission
     metadata = EmbeddedDocumentField(TransmissionMetadata)
 
+    # Embedded motion metrics of transmission
+    motion = EmbeddedDocumentField(Motion)
+
+    # Embedded nearest port of transmission
+    nearest_port = EmbeddedDocumentField(NearestPort)
+
     # Reference to the tracker the transmission belongs to
     tracker = ReferenceField(Tracker)
+
+class TransmissionLevel(Document):
+
+    # Reference to the tracker the simplified track belongs to
+    tracker = ReferenceField(Tracker)
+
+    # Zoom level for which the track is simplified
+    zoom = IntField()
+
+    # Tolerance, in degrees, used to simplify the track
+    tolerance = FloatField()
+
+    # Coordinates of the simplified track coords=[[1,2],[3,4]]
+    coords = ListField(ListField(FloatField()))
+
+    # Altitudes of the points in the simplified track
+    alt = ListField(FloatField())
+
+    # Timestamps of the points in the simplified track
+    time = ListField(DateTimeField())
+
+    # Amount of points in the simplified track
+    points = IntField()
+
+class TransmissionBucket(Document):
+
+    # Reference to the tracker the transmissions belong to
+    tracker = ReferenceField(Tracker)
+
+    # Start of the period (day) of the bucket
+    start = DateTimeField()
+
+    # Timestamp of the last transmission in the bucket
+    end = DateTimeField()
+
+    # Amount of transmissions in the bucket
+    count = IntField()
+
+    # The values of the transmissions in the bucket. The values at the same
+    # position in the lists belong to the same transmission.
+    event_id = ListField(IntField())
+    timestamp = ListField(DateTimeField())
+    coords = ListField(ListField(FloatField()))
+    alt = ListField(FloatField())
+    ground_speed = ListField(FloatField())
+    visible = ListField(BooleanField())
+    sensor_type = ListField(StringField())
+    tag_voltage = ListField(FloatField())
+
+    # The nearest port of the transmissions in the bucket, calculated by the
+    # nearest-port-join.py file.
+    port_id = ListField(IntField())
+    port_distance = ListField(FloatField())
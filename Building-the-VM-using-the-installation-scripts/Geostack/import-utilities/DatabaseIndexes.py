@@ -0,0 +1,355 @@
+# The get_db function of MongoEngine is used to obtain the PyMongo database
+# of the connection which was created by the import scripts.
+from mongoengine.connection import get_db
+
+# The pymongo module is used to connect to the databases when this file is
+# run as a script, to create the explain() report.
+import pymongo
+
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+#                                                                             #
+#               DEFINING THE INDEXES OF THE CRANE AND TRAIL DATABASES         #
+#                                                                             #
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+# Every query of the Flask-API searches on the tracker (or trail) together with
+# a time range or a polygon. Below we define compound indexes which match these
+# queries, so MongoDB can answer them with a single index scan instead of
+# combining multiple single field indexes.
+#
+# The indexes are defined per collection. Each index has a name and a list of
+# (field, direction) pairs, in the same format as PyMongo's create_index().
+# Extra options of create_index() (Ex.: unique) can be passed as "options".
+# A unique index is only created if the collection contains no duplicates,
+# otherwise the duplicates are reported and the import is stopped (see
+# check_duplicates). The duplicates have to be removed by the user, since the
+# trackers and trails refer to the documents.
+
+CRANE_INDEXES = {
+    "tracker": [
+        # Used to retrieve the trackers of which the track intersects with
+        # the viewport of a map.
+        {"name": "envelope",
+         "keys": [("envelope", "2dsphere")]},
+    ],
+    "transmission": [
+        # Used to retrieve the transmissions of a tracker, between two DTG's
+        # and to page through them sorted by (timestamp, _id).
+        {"name": "tracker_timestamp",
+         "keys": [("tracker", 1), ("timestamp", 1), ("_id", 1)]},
+
+        # Used to sample every n-th transmission of a tracker by its sequence
+        # number.
+        {"name": "tracker_seq",
+         "keys": [("tracker", 1), ("seq", 1)]},
+
+        # Used to retrieve the transmissions of a tracker in a polygon.
+        {"name": "tracker_coord",
+         "keys": [("tracker", 1), ("geometry.coord", "2dsphere")]},
+
+        # Used to retrieve the transmissions of all trackers in a vector tile
+        # of the Flask-API.
+        {"name": "coord",
+         "keys": [("geometry.coord", "2dsphere")]},
+
+        # Used to skip transmissions which are already in the database when
+        # a dataset is imported again. Transmissions without an event id are
+        # not part of the index.
+        {"name": "event_id_unique",
+         "keys": [("event_id", 1)],
+         "options": {"unique": True,
+                     "partialFilterExpression": {"event_id": {"$exists": True}}}},
+    ],
+    "transmission_level": [
+        # Used to retrieve the simplified track of a tracker for a zoom level.
+        {"name": "tracker_zoom",
+         "keys": [("tracker", 1), ("zoom", 1)]},
+    ],
+    "transmission_bucket": [
+        # Used to retrieve the buckets of a tracker sorted by time. The index
+        # is unique, since the values of a day are always added to the same
+        # bucket (see BucketStorage.py).
+        {"name": "tracker_start",
+         "keys": [("tracker", 1), ("start", 1)],
+         "options": {"unique": True}},
+    ],
+}
+
+TRAIL_INDEXES = {
+    "trail": [
+        # Used to retrieve the trails of which the route intersects with the
+        # viewport of a map.
+        {"name": "envelope",
+         "keys": [("envelope", "2dsphere")]},
+    ],
+    "signal": [
+        # Used to retrieve the signals of a trail, between two DTG's and to
+        # page through them sorted by (time, _id).
+        {"name": "trail_time",
+         "keys": [("trail", 1), ("time", 1), ("_id", 1)]},
+
+        # Used to sample every n-th signal of a trail by its sequence number.
+        {"name": "trail_seq",
+         "keys": [("trail", 1), ("seq", 1)]},
+
+        # Used to retrieve the signals of a trail in a polygon.
+        {"name": "trail_coord",
+         "keys": [("trail", 1), ("geometry.coord", "2dsphere")]},
+
+        # Used to retrieve the signals of all trails in a vector tile of the
+        # Flask-API.
+        {"name": "coord",
+         "keys": [("geometry.coord", "2dsphere")]},
+    ],
+    "signal_level": [
+        # Used to retrieve the simplified track of a trail for a zoom level.
+        {"name": "trail_zoom",
+         "keys": [("trail", 1), ("zoom", 1)]},
+    ],
+    "signal_bucket": [
+        # Used to retrieve the buckets of a trail sorted by time. The index
+        # is unique, since the values of an hour are always added to the same
+        # bucket (see BucketStorage.py).
+        {"name": "trail_start",
+         "keys": [("trail", 1), ("start", 1)],
+         "options": {"unique": True}},
+    ],
+}
+
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+#                                                                             #
+#                     CREATING AND DROPPING THE INDEXES                       #
+#                                                                             #
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+
+# Here we create a function called: "build_indexes".
+# The function creates the indexes which are defined for each collection.
+# Indexes which already exist (with the same fields) are skipped, so the
+# function can be run after every import. An index with the same fields which
+# is not unique, while it should be, is created again.
+#
+# The function expects the following parameters:
+# 1) The PyMongo database
+# 2) The dictionary with the indexes of the database (Ex.: CRANE_INDEXES)
+# 3) Optionally True to only create the unique indexes
+def build_indexes(db, indexes, unique_only=False):
+
+    for collection_name, collection_indexes in indexes.items():
+
+        # Get the fields and the unique option of the indexes that already
+        # exist on the collection.
+        existing = {name: (index["key"], index.get("unique", False)) for name, index
+                    in db[collection_name].index_information().items()}
+
+        for index in collection_indexes:
+
+            unique = index.get("options", {}).get("unique", False)
+
+            if unique_only and not unique:
+                continue
+
+            # Skip the index if it already exists.
+            if (index["keys"], unique) in existing.values():
+                continue
+
+            # Drop the index with the same fields, but another unique option.
+            for name, (keys, _) in existing.items():
+                if keys == index["keys"]:
+                    print("Dropping index: " + name + " on: " + collection_name)
+                    db[collection_name].drop_index(name)
+
+            if unique:
+                check_duplicates(db[collection_name], index)
+
+            print("Creating index: " + index["name"] + " on: " + collection_name)
+
+            # Create the index in the background, so the database can still be
+            # used while the index is being built.
+            db[collection_name].create_index(index["keys"],
+                                             name=index["name"],
+                                             background=True,
+                                             **index.get("options", {}))
+
+# Here we create a function called: "check_duplicates".
+# The function checks if a collection contains documents with the same values
+# for the fields of a unique index, before the index is created. The
+# duplicates are printed and a ValueError is raised, so the import stops
+# before any data is inserted. No documents are removed.
+def check_duplicates(collection, index, examples=10):
+
+    fields = [field for field, _ in index["keys"]]
+
+    # Only the documents which are part of a partial index are compared.
+    pipeline = []
+    partial = index.get("options", {}).get("partialFilterExpression")
+    if partial:
+        pipeline.append({"$match": partial})
+
+    pipeline += [
+        {"$group": {"_id": {field.replace(".", "_"): "$" + field for field in fields},
+                    "ids": {"$push": "$_id"},
+                    "count": {"$sum": 1}}},
+        {"$match": {"count": {"$gt": 1}}},
+    ]
+
+    duplicates = list(collection.aggregate(pipeline, allowDiskUse=True))
+
+    if not duplicates:
+        return
+
+    for group in duplicates[:examples]:
+        print("Duplicate " + str(group["_id"]) + " in: " + collection.name +
+              " (MongoIDs: " + ", ".join(str(id) for id in group["ids"]) + ")")
+
+    raise ValueError("The index: " + index["name"] + " can't be created, " +
+                     str(len(duplicates)) + " values occur more than once in: " +
+                     collection.name + ". Remove the duplicates and run the import again.")
+
+# Here we create a function called: "drop_redundant_indexes".
+# The function drops every index of the collections which is not defined in
+# the dictionary of indexes, for example the single field indexes created by
+# earlier versions of the import scripts. The index on _id is always kept.
+def drop_redundant_indexes(db, indexes):
+
+    for collection_name, collection_indexes in indexes.items():
+
+        # The fields of the indexes we want to keep.
+        wanted = [index["keys"] for index in collection_indexes]
+
+        for name, index in db[collection_name].index_information().items():
+
+            if name == "_id_" or index["key"] in wanted:
+                continue
+
+            print("Dropping redundant index: " + name + " on: " + collection_name)
+            db[collection_name].drop_index(name)
+
+# Here we create a function called: "prepare_indexes".
+# This function is called by the import scripts before any data is inserted.
+# It builds the unique indexes, which are needed while the data is inserted,
+# on the database to which MongoEngine is connected.
+def prepare_indexes(indexes):
+
+    db = get_db()
+
+    print("Creating unique indexes on database: " + db.name)
+
+    build_indexes(db, indexes, unique_only=True)
+
+# Here we create a function called: "update_indexes".
+# This function is called by the import scripts after all the data is
+# inserted. It builds the defined indexes and drops the redundant ones on the
+# database to which MongoEngine is connected.
+def update_indexes(indexes):
+
+    db = get_db()
+
+    print("Creating indexes on database: " + db.name)
+
+    build_indexes(db, indexes)
+    drop_redundant_indexes(db, indexes)
+
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+#                                                                             #
+#                  REPORTING WHICH INDEX IS USED BY EACH ROUTE                #
+#                                                                             #
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+
+# Here we create a function called: "winning_index".
+# The function walks through the winning plan of an explain() result and
+# returns the name of the index which is scanned, or "COLLSCAN" if MongoDB has
+# to read the whole collection.
+def winning_index(explain_result):
+
+    stages = [explain_result["queryPlanner"]["winningPlan"]]
+    names = []
+
+    while stages:
+        stage = stages.pop()
+
+        if stage.get("stage") == "COLLSCAN":
+            names.append("COLLSCAN")
+        if "indexName" in stage:
+            names.append(stage["indexName"])
+
+        # A stage has one input stage, or multiple input stages in the case
+        # of an $or query.
+        if "inputStage" in stage:
+            stages.append(stage["inputStage"])
+        stages.extend(stage.get("inputStages", []))
+
+    return ", ".join(sorted(set(names))) or "unknown"
+
+# Here we create a function called: "route_queries".
+# The function returns the queries performed by the Flask-API routes on a
+# database, using the first tracker or trail in the database as example.
+#
+# The function expects the following parameters:
+# 1) The PyMongo database
+# 2) The name of the collection which contains the transmissions or signals
+# 3) The name of the field which references the tracker or trail
+# 4) The name of the field which contains the time
+def route_queries(db, collection, reference_field, time_field):
+
+    # Get an example document from the collection.
+    example = db[collection].find_one({}, sort=[(time_field, 1)])
+
+    if example is None:
+        return []
+
+    reference = example[reference_field]
+    start = example[time_field]
+    lon, lat = example["geometry"]["coord"]["coordinates"]
+
+    # A small square around the example document.
+    polygon = {"type": "Polygon",
+               "coordinates": [[[lon - 1, lat - 1], [lon + 1, lat - 1],
+                                [lon + 1, lat + 1], [lon - 1, lat + 1],
+                                [lon - 1, lat - 1]]]}
+
+    return [
+        (collection + "_by_id", collection,
+         {reference_field: reference}, None),
+        (collection + "_by_dtg", collection,
+         {reference_field: reference, time_field: {"$gt": start}}, None),
+        (collection + "_by_page", collection,
+         {reference_field: reference, time_field: {"$gt": start}},
+         [(time_field, 1), ("_id", 1)]),
+        (collection + "_by_stride", collection,
+         {reference_field: reference, "seq": {"$in": [0, 10, 20]}}, None),
+        (collection + "_in_polygon", collection,
+         {reference_field: reference,
+          "geometry.coord": {"$geoWithin": {"$geometry": polygon}}}, None),
+        (collection + "_by_zoom", collection + "_level",
+         {reference_field: reference, "zoom": {"$lte": 10}}, [("zoom", -1)]),
+    ]
+
+# Here we create a function called: "explain_routes".
+# The function prints which index is used by each query of the Flask-API.
+def explain_routes(db, queries):
+
+    for route, collection, query, sort in queries:
+
+        cursor = db[collection].find(query)
+
+        if sort is not None:
+            cursor = cursor.sort(sort)
+
+        print(route.ljust(30) + winning_index(cursor.explain()))
+
+# When this file is run as a script, the indexes of both databases are
+# updated and the explain() report is printed.
+if __name__ == '__main__':
+
+    client = pymongo.MongoClient('localhost', 27017)
+
+    crane_db = client['Crane_Database']
+    build_indexes(crane_db, CRANE_INDEXES)
+    drop_redundant_indexes(crane_db, CRANE_INDEXES)
+    explain_routes(crane_db, route_queries(crane_db, "transmission",
+                                           "tracker", "timestamp"))
+
+    trail_db = client['Trail_Database']
+    build_indexes(trail_db, TRAIL_INDEXES)
+    drop_redundant_indexes(trail_db, TRAIL_INDEXES)
+    explain_routes(trail_db, route_queries(trail_db, "signal",
+                                           "trail", "time"))
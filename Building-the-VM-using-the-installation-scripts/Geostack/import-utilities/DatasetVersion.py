@@ -0,0 +1,41 @@
+# The get_db function of MongoEngine is used to obtain the PyMongo database
+# of the connection which was created by the import scripts.
+from mongoengine.connection import get_db
+
+# The datetime module is used to store when the data was last imported.
+from datetime import datetime
+
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+#                                                                             #
+#                  KEEPING TRACK OF THE VERSION OF THE DATA                   #
+#                                                                             #
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+# The Flask-API caches results which are expensive to calculate, such as the
+# heatmaps and the vector tiles of the crane and trail data. These results
+# have to be calculated again when new data is imported.
+#
+# Every database contains a document with a version number in the collection
+# "dataset_version". The import scripts increase the version number after
+# every import, and the Flask-API adds the version number to the key of every
+# cached result. Results of an older version are no longer used.
+
+# The name of the collection and the MongoID of the version document.
+VERSION_COLLECTION = "dataset_version"
+VERSION_ID = "version"
+
+# Here we create a function called: "bump_version".
+# This function is called by the import scripts after data is imported. It
+# increases the version number of the database to which MongoEngine is
+# connected, and returns the new version number.
+def bump_version():
+
+    db = get_db()
+
+    result = db[VERSION_COLLECTION].find_one_and_update(
+        {"_id": VERSION_ID},
+        {"$inc": {"version": 1}, "$set": {"updated": datetime.utcnow()}},
+        upsert=True, return_document=True)
+
+    print("Database: " + db.name + " is now at version " + str(result["version"]))
+
+    return result["version"]
@@ -0,0 +1,112 @@
+# The ElementTree module is used to read the GPX (XML) file element by element,
+# instead of loading the whole file in memory.
+import xml.etree.ElementTree as ET
+
+# The array module is used to store the values of the trackpoints in compact
+# arrays while the file is being read.
+from array import array
+
+# NumPy and Pandas are used to create the dataframe containing all the
+# trackpoints.
+import numpy as np
+import pandas as pd
+
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+#                                                                             #
+#                        READING GPX FILES                                    #
+#                                                                             #
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+# A GPX file can contain multiple tracks (<trk>), which can contain multiple
+# segments (<trkseg>), which contain the trackpoints (<trkpt>). The function
+# below reads the trackpoints of all tracks and segments, and stores the
+# number of the track and segment of each trackpoint.
+
+# Here we create a function called: "local_name".
+# The tags in a GPX file contain the GPX namespace, for example:
+# "{http://www.topografix.com/GPX/1/1}trkpt". The function returns the tag
+# without the namespace, for example: "trkpt".
+def local_name(tag):
+    return tag.rsplit('}', 1)[-1]
+
+# Here we create a function called: "read_gpx".
+# The function takes the location of a GPX file, or an opened GPX file, as
+# input and returns a dataframe with the following columns:
+# - lon, lat, alt : the coordinates and the elevation of the trackpoint
+# - time          : the time of the trackpoint in UTC
+# - track         : the number of the track the trackpoint belongs to
+# - segment       : the number of the segment (in the track) the trackpoint
+#                   belongs to
+def read_gpx(source):
+
+    # Create an array for each column. Arrays of type 'd' contain floats and
+    # arrays of type 'l' contain integers.
+    lon, lat, alt = array('d'), array('d'), array('d')
+    track, segment = array('l'), array('l')
+    time = []
+
+    # The number of the current track and segment.
+    track_number = -1
+    segment_number = -1
+
+    # The element of the current segment.
+    segment_element = None
+
+    # Read the file element by element. The "start" event is triggered when
+    # an element is opened and the "end" event when an element is closed.
+    for event, element in ET.iterparse(source, events=('start', 'end')):
+
+        tag = local_name(element.tag)
+
+        if event == 'start':
+
+            # A new track starts, so the segments are counted from 0 again.
+            if tag == 'trk':
+                track_number += 1
+                segment_number = -1
+
+            # A new segment starts.
+            elif tag == 'trkseg':
+                segment_number += 1
+                segment_element = element
+
+        elif tag == 'trkpt':
+
+            # Read the coordinates of the trackpoint.
+            lon.append(float(element.get('lon')))
+            lat.append(float(element.get('lat')))
+
+            # Read the elevation and time of the trackpoint, if they exist.
+            elevation = float('nan')
+            timestamp = None
+            for child in element:
+                if local_name(child.tag) == 'ele':
+                    elevation = float(child.text)
+                elif local_name(child.tag) == 'time':
+                    timestamp = child.text
+
+            alt.append(elevation)
+            time.append(timestamp)
+            track.append(max(track_number, 0))
+            segment.append(max(segment_number, 0))
+
+            # Remove the trackpoint from the segment, so the elements which
+            # have been read don't stay in memory.
+            element.clear()
+            if segment_element is not None:
+                segment_element.remove(element)
+
+    # Create the dataframe once, after all the trackpoints are read. The times
+    # are converted to datetimes in one step.
+    return pd.DataFrame({'lon': np.asarray(lon),
+                         'lat': np.asarray(lat),
+                         'alt': np.asarray(alt),
+                         'time': pd.to_datetime(time, utc=True, errors='coerce'),
+                         'track': np.asarray(track),
+                         'segment': np.asarray(segment)})
+
+# Here we create a function called: "time_in_milliseconds".
+# The function converts the time column of a dataframe created by read_gpx to
+# the amount of milliseconds since 1970-01-01.
+def time_in_milliseconds(df):
+    epoch = pd.Timestamp('1970-01-01', tz='UTC')
+    return (df['time'] - epoch) // pd.Timedelta(milliseconds=1)
@@ -0,0 +1,239 @@
+# NumPy is used to perform the distance calculations on whole arrays of
+# coordinates at once.
+import numpy as np
+
+# Here we import the CraneModel and TrailModel Python files.
+import CraneModel
+import TrailModel
+
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+#                                                                             #
+#              CREATING THE LEVEL OF DETAIL PYRAMID OF A TRACK                #
+#                                                                             #
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+# The 2D and 3D map viewers do not need every transmission or signal of a track
+# when the map is zoomed out. Here we create simplified copies of a track for a
+# number of zoom levels using the Douglas-Peucker algorithm. The tolerance of
+# each level is the size of one map pixel (in degrees) at that zoom level, so
+# the points which are removed would not have been visible anyway.
+
+# The zoom levels for which a simplified copy of a track is created.
+ZOOM_LEVELS = [2, 4, 6, 8, 10, 12, 14]
+
+# Here we create a function called: "zoom_tolerance".
+# The function returns the size of one pixel, in degrees, of a 256x256 map tile
+# at the zoom level passed as parameter.
+def zoom_tolerance(zoom):
+    return 360.0 / (256 * 2 ** zoom)
+
+# Here we create a function called: "compute_significance".
+# The function runs the Douglas-Peucker algorithm once on the whole track and
+# stores, for each point, the largest tolerance at which the point is still
+# kept. A simplified track for any tolerance then contains the points of which
+# the significance is bigger than that tolerance.
+#
+# The function expects the following parameters:
+# 1) A NumPy array with the longitudes of the track
+# 2) A NumPy array with the latitudes of the track
+# 3) The smallest tolerance we are interested in. Parts of the track which are
+#    straighter than this tolerance are not split any further.
+def compute_significance(lon, lat, min_tolerance):
+
+    # Create an array with a significance of 0 for every point.
+    significance = np.zeros(len(lon))
+
+    # A track without points has nothing to simplify.
+    if len(lon) == 0:
+        return significance
+
+    # The first and the last point of the track are always kept.
+    significance[0] = np.inf
+    significance[-1] = np.inf
+
+    # Instead of calling the function recursively, we keep a stack of the
+    # parts (first point, last point) of the track which still have to be
+    # split. We also store the significance of the point that created the
+    # part, since a point can never be more significant than its parent.
+    stack = [(0, len(lon) - 1, np.inf)]
+
+    while stack:
+        first, last, parent = stack.pop()
+
+        # A part without points between the first and the last point can't
+        # be split.
+        if last - first < 2:
+            continue
+
+        # Calculate the distance of all the points between the first and the
+        # last point to the line through the first and the last point.
+        dx = lon[last] - lon[first]
+        dy = lat[last] - lat[first]
+        xs = lon[first + 1:last] - lon[first]
+        ys = lat[first + 1:last] - lat[first]
+        length = np.hypot(dx, dy)
+
+        if length == 0:
+            distances = np.hypot(xs, ys)
+        else:
+            distances = np.abs(dy * xs - dx * ys) / length
+
+        # The point which is the furthest away from the line is the point
+        # at which the part is split.
+        index = int(np.argmax(distances))
+        distance = distances[index]
+
+        # If that point is within the smallest tolerance, all the points of
+        # this part are removed in every level.
+        if distance <= min_tolerance:
+            continue
+
+        split = first + 1 + index
+        significance[split] = min(distance, parent)
+
+        # Add both halves of the part to the stack.
+        stack.append((first, split, significance[split]))
+        stack.append((split, last, significance[split]))
+
+    return significance
+
+# Here we create a function called: "build_levels".
+# The function returns a list containing the zoom level, tolerance and the
+# indexes of the points that are kept, for each of the ZOOM_LEVELS.
+def build_levels(lon, lat):
+
+    # Convert the coordinates to NumPy arrays of floats.
+    lon = np.asarray(lon, dtype=float)
+    lat = np.asarray(lat, dtype=float)
+
+    # Run the Douglas-Peucker algorithm once for the smallest tolerance.
+    significance = compute_significance(
+        lon, lat, zoom_tolerance(max(ZOOM_LEVELS)))
+
+    levels = []
+
+    for zoom in ZOOM_LEVELS:
+        tolerance = zoom_tolerance(zoom)
+        levels.append((zoom, tolerance, np.flatnonzero(significance > tolerance)))
+
+    return levels
+
+# Here we create a function called: "reduce_chunk".
+# When a track is imported in chunks, the complete track is never in memory.
+# This function runs the Douglas-Peucker algorithm on one chunk for the
+# smallest tolerance and returns the longitudes, latitudes, altitudes and times
+# of the points which are kept. The reduced chunks are much smaller than the
+# track and can be combined and passed to create_levels() after the import.
+# Since the first and the last point of every chunk are kept, the combined
+# track is connected.
+def reduce_chunk(lon, lat, alt, time):
+
+    lon = np.asarray(lon, dtype=float)
+    lat = np.asarray(lat, dtype=float)
+    alt = np.asarray(alt, dtype=float)
+    time = np.asarray(time, dtype=object)
+
+    # Points without valid coordinates can't be drawn, so we skip them.
+    valid = ~(np.isnan(lon) | np.isnan(lat))
+    lon, lat, alt, time = lon[valid], lat[valid], alt[valid], time[valid]
+
+    tolerance = zoom_tolerance(max(ZOOM_LEVELS))
+    indexes = np.flatnonzero(compute_significance(lon, lat, tolerance) > tolerance)
+
+    return lon[indexes], lat[indexes], alt[indexes], time[indexes]
+
+# Here we create a function called: "combine_chunks".
+# The function combines a list of reduced chunks (created by reduce_chunk)
+# into the longitudes, latitudes, altitudes and times of one track.
+def combine_chunks(chunks):
+
+    if not chunks:
+        return [], [], [], []
+
+    return [np.concatenate(column) for column in zip(*chunks)]
+
+# Here we create a function called: "create_levels".
+# The function creates the level documents of one track.
+#
+# The function expects the following parameters:
+# 1) The Document class of the levels (CraneModel.TransmissionLevel or
+#    TrailModel.SignalLevel)
+# 2) The name of the field which references the tracker or trail
+# 3) The tracker or trail document the track belongs to
+# 4) Lists with the longitudes, latitudes, altitudes and times of the track,
+#    sorted by time.
+def create_levels(level_document, reference_field, reference, lon, lat, alt, time):
+
+    # Convert the columns to NumPy arrays.
+    lon = np.asarray(lon, dtype=float)
+    lat = np.asarray(lat, dtype=float)
+    alt = np.asarray(alt, dtype=float)
+    time = np.asarray(time, dtype=object)
+
+    # Points without valid coordinates can't be drawn, so we skip them.
+    valid = ~(np.isnan(lon) | np.isnan(lat))
+    lon, lat, alt, time = lon[valid], lat[valid], alt[valid], time[valid]
+
+    levels = []
+
+    for zoom, tolerance, indexes in build_levels(lon, lat):
+
+        # Replace unknown altitudes by None, so they are stored as null.
+        level_alt = [None if np.isnan(a) else float(a) for a in alt[indexes]]
+
+        levels.append(level_document(**{reference_field: reference},
+                                     zoom = zoom,
+                                     tolerance = tolerance,
+                                     coords = np.column_stack(
+                                         (lon[indexes], lat[indexes])).tolist(),
+                                     alt = level_alt,
+                                     time = list(time[indexes]),
+                                     points = len(indexes)))
+
+    # Remove the levels which were created by an earlier import of the track,
+    # and bulk insert the new levels in the database.
+    level_document.objects(**{reference_field: reference}).delete()
+    level_document.objects.insert(levels, load_bulk=False)
+
+    print("Created " + str(len(levels)) + " levels of detail")
+
+# Here we create a function called: "stored_track".
+# The function returns the most detailed level of a track which is already in
+# the database, in the same format as reduce_chunk(). When new points are
+# added to the track, this level and the new reduced points are combined to
+# create the levels again, without reading the complete track. An empty list
+# is returned if the track has no levels yet.
+def stored_track(level_document, reference_field, reference):
+
+    level = level_document.objects(**{reference_field: reference}) \
+                          .order_by('-zoom').first()
+
+    if level is None or not level.coords:
+        return []
+
+    coords = np.asarray(level.coords, dtype=float)
+
+    return [(coords[:, 0], coords[:, 1],
+             np.asarray(level.alt, dtype=float),
+             np.asarray(level.time, dtype=object))]
+
+# Here we create a function called: "create_transmission_levels".
+# The function creates the level documents of the track of a tracker.
+def create_transmission_levels(tracker, lon, lat, alt, time):
+    create_levels(CraneModel.TransmissionLevel, "tracker", tracker,
+                  lon, lat, alt, time)
+
+# Here we create a function called: "stored_transmission_track".
+# The function returns the most detailed level of the track of a tracker.
+def stored_transmission_track(tracker):
+    return stored_track(CraneModel.TransmissionLevel, "tracker", tracker)
+
+# Here we create a function called: "stored_signal_track".
+# The function returns the most detailed level of the track of a trail.
+def stored_signal_track(trail):
+    return stored_track(TrailModel.SignalLevel, "trail", trail)
+
+# Here we create a function called: "create_signal_levels".
+# The function creates the level documents of the track of a trail.
+def create_signal_levels(trail, lon, lat, alt, time):
+    create_levels(TrailModel.SignalLevel, "trail", trail,
+                  lon, lat, alt, time)
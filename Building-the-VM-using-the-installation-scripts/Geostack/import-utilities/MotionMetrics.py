@@ -0,0 +1,269 @@
+# NumPy is used to calculate the metrics of a whole track at once, instead of
+# looping through the transmissions or signals.
+import numpy as np
+
+# Pandas is used to convert the times of a track to seconds.
+import pandas as pd
+
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+#                                                                             #
+#               CALCULATING THE MOTION METRICS OF A TRACK                     #
+#                                                                             #
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+# For every transmission or signal we calculate the following metrics, using
+# the previous transmission or signal of the track:
+# - step_distance       : the distance in meters (haversine formula)
+# - heading             : the direction in degrees (0 = north, 90 = east)
+# - time_delta          : the time in seconds
+# - speed               : the speed in meters per second
+# - cumulative_distance : the distance in meters from the start of the track
+# - turning_angle       : the change of the heading in degrees, between -180
+#                         and 180 (a positive angle is a turn to the right)
+#
+# The metrics of the first point of a track are unknown (NaN), except for the
+# cumulative distance, which is 0. The same holds for the first point of
+# every part of a track (Ex.: a track or segment of a GPX file), so the
+# distance between two parts isn't added to the total distance and doesn't
+# result in an unrealistic speed.
+#
+# When a track is imported in chunks, the last point of a chunk is passed as
+# "previous" point to the next chunk, so the metrics are the same as when the
+# whole track is imported at once.
+
+# The mean radius of the earth in meters.
+EARTH_RADIUS = 6371008.8
+
+# The amount of segments a track of a GPX file can have, used to give every
+# segment of a file a unique part number (see part_numbers).
+SEGMENTS_PER_TRACK = 1000000
+
+# The names of the metrics, in the same order as in CraneModel.Motion and
+# TrailModel.Motion.
+MOTION_FIELDS = ['heading', 'step_distance', 'time_delta', 'speed',
+                 'cumulative_distance', 'turning_angle']
+
+# Here we create a function called: "to_seconds".
+# The function converts an array of times to the amount of seconds since
+# 1970-01-01. Unknown times are converted to NaN.
+def to_seconds(time):
+    times = pd.to_datetime(pd.Series(time))
+    return (times - pd.Timestamp('1970-01-01')).dt.total_seconds().to_numpy()
+
+# Here we create a function called: "haversine".
+# The function returns the distance in meters between the points of two
+# arrays of coordinates.
+def haversine(lon_1, lat_1, lon_2, lat_2):
+
+    lon_1, lat_1, lon_2, lat_2 = map(np.radians, (lon_1, lat_1, lon_2, lat_2))
+
+    a = (np.sin((lat_2 - lat_1) / 2) ** 2 +
+         np.cos(lat_1) * np.cos(lat_2) * np.sin((lon_2 - lon_1) / 2) ** 2)
+
+    return 2 * EARTH_RADIUS * np.arcsin(np.sqrt(a))
+
+# Here we create a function called: "bearing".
+# The function returns the direction in degrees (0 to 360) from the points of
+# the first array of coordinates to the points of the second array.
+def bearing(lon_1, lat_1, lon_2, lat_2):
+
+    lon_1, lat_1, lon_2, lat_2 = map(np.radians, (lon_1, lat_1, lon_2, lat_2))
+
+    x = np.sin(lon_2 - lon_1) * np.cos(lat_2)
+    y = (np.cos(lat_1) * np.sin(lat_2) -
+         np.sin(lat_1) * np.cos(lat_2) * np.cos(lon_2 - lon_1))
+
+    return np.degrees(np.arctan2(x, y)) % 360
+
+# Here we create a function called: "shifted".
+# The function returns the values of an array shifted one position to the
+# right. The first position gets the value passed as parameter, which is the
+# value of the previous point.
+def shifted(values, first):
+    return np.concatenate(([first], values[:-1]))
+
+# Here we create a function called: "part_numbers".
+# The function returns the part of the track of every point, from the number
+# of the track and segment of a GPX file (see GpxReader.py). None is returned
+# if the dataset has no track and segment columns.
+def part_numbers(track, segment):
+
+    if track is None or segment is None:
+        return None
+
+    return (np.asarray(track, dtype=float) * SEGMENTS_PER_TRACK +
+            np.asarray(segment, dtype=float))
+
+# Here we create a function called: "compute_metrics".
+# The function returns a dictionary with an array for each of the
+# MOTION_FIELDS.
+#
+# The function expects the following parameters:
+# 1) The longitudes, latitudes and times of the track, sorted by time
+# 2) The state of the previous point (see next_state), or None if the first
+#    point is the start of the track
+# 3) Optionally the part of the track of every point (see part_numbers). The
+#    metrics are not calculated between points of different parts.
+def compute_metrics(lon, lat, time, previous=None, part=None):
+
+    lon = np.asarray(lon, dtype=float)
+    lat = np.asarray(lat, dtype=float)
+    seconds = to_seconds(time)
+
+    if len(lon) == 0:
+        return {field: np.array([], dtype=float) for field in MOTION_FIELDS}
+
+    if previous is None:
+        previous = {"lon": np.nan, "lat": np.nan, "seconds": np.nan,
+                    "heading": np.nan, "distance": 0.0}
+
+    # The coordinates and times of the previous point of every point.
+    previous_lon = shifted(lon, previous["lon"])
+    previous_lat = shifted(lat, previous["lat"])
+    previous_seconds = shifted(seconds, previous["seconds"])
+
+    step_distance = haversine(previous_lon, previous_lat, lon, lat)
+    time_delta = seconds - previous_seconds
+
+    # The distance to the previous part of the track is unknown, which also
+    # makes the speed and heading of the first point of a part unknown. If
+    # the part of the previous point is not known (Ex.: a point which is
+    # already in the database), the first point continues the track.
+    if part is not None:
+        part = np.asarray(part, dtype=float)
+        previous_part = previous.get("part")
+        new_part = part != shifted(part, part[0] if previous_part is None
+                                         else previous_part)
+        step_distance = np.where(new_part, np.nan, step_distance)
+
+    # The speed is unknown if the time didn't increase, and the heading is
+    # unknown if the position didn't change.
+    with np.errstate(divide='ignore', invalid='ignore'):
+        speed = np.where(time_delta > 0, step_distance / time_delta, np.nan)
+        heading = np.where(step_distance > 0,
+                           bearing(previous_lon, previous_lat, lon, lat), np.nan)
+
+    # The turning angle is the difference with the heading of the previous
+    # step, between -180 and 180 degrees.
+    turning_angle = (heading - shifted(heading, previous["heading"]) + 180) % 360 - 180
+
+    # Unknown distances (Ex.: a point without coordinates) are not counted.
+    cumulative_distance = previous["distance"] + np.nancumsum(step_distance)
+
+    return {"heading": heading,
+            "step_distance": step_distance,
+            "time_delta": time_delta,
+            "speed": speed,
+            "cumulative_distance": cumulative_distance,
+            "turning_angle": turning_angle}
+
+# Here we create a function called: "next_state".
+# The function returns the state of the last point of a chunk, which is
+# passed as "previous" to compute_metrics() for the next chunk.
+def next_state(lon, lat, time, metrics, previous=None, part=None):
+
+    if len(metrics["step_distance"]) == 0:
+        return previous
+
+    return {"lon": float(np.asarray(lon, dtype=float)[-1]),
+            "lat": float(np.asarray(lat, dtype=float)[-1]),
+            "seconds": float(to_seconds(time)[-1]),
+            "heading": float(metrics["heading"][-1]),
+            "distance": float(metrics["cumulative_distance"][-1]),
+            "part": None if part is None else float(np.asarray(part, dtype=float)[-1])}
+
+# Here we create a function called: "stored_state".
+# The function returns the state of a transmission or signal which is already
+# in the database, so new points can be added to the track (see the
+# incremental import). None is returned if the track has no points yet.
+def stored_state(document, time_field):
+
+    if document is None or document.geometry is None:
+        return None
+
+    # A PointField is returned as a GeoJSON dictionary when it is loaded from
+    # the database, and as a list when it is created in Python.
+    coord = document.geometry.coord
+    if isinstance(coord, dict):
+        coord = coord['coordinates']
+
+    motion = document.motion
+
+    return {"lon": coord[0],
+            "lat": coord[1],
+            "seconds": float(to_seconds([document[time_field]])[0]),
+            "heading": np.nan if motion is None or motion.heading is None else motion.heading,
+            "distance": 0.0 if motion is None or motion.cumulative_distance is None
+                        else motion.cumulative_distance}
+
+# Here we create a function called: "bucket_state".
+# The function returns the state of the newest transmission or signal in a
+# bucket (see BucketStorage.py), so new points can be added to a track which
+# is stored in buckets. The heading is not stored in the buckets, so it is
+# unknown, and the distance is the total distance of the track. None is
+# returned if the bucket contains no points with a time and coordinates.
+def bucket_state(bucket, time_field, distance=None):
+
+    if bucket is None:
+        return None
+
+    points = [(time, coord) for time, coord in zip(bucket[time_field], bucket.coords)
+              if time is not None and coord]
+
+    if not points:
+        return None
+
+    time, coord = max(points, key=lambda point: point[0])
+
+    return {"lon": coord[0],
+            "lat": coord[1],
+            "seconds": float(to_seconds([time])[0]),
+            "heading": np.nan,
+            "distance": 0.0 if distance is None else distance}
+
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+#                                                                             #
+#             ROLLING UP THE METRICS ON THE TRACKER AND THE TRAIL             #
+#                                                                             #
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+# The totals of a track are stored on the Tracker or Trail document. When a
+# track is imported in chunks, the totals are updated after every chunk.
+
+# Here we create a function called: "new_totals".
+# The function returns the totals of a track. The totals of a track which is
+# already in the database can be passed, to add new points to the track.
+def new_totals(total_distance=None, moving_time=None, max_speed=None):
+    return {"distance": total_distance or 0.0,
+            "moving_time": moving_time or 0.0,
+            "max_speed": np.nan if max_speed is None else max_speed}
+
+# Here we create a function called: "update_totals".
+# The function updates the totals with the metrics of a chunk.
+def update_totals(totals, metrics):
+
+    if len(metrics["speed"]) == 0:
+        return totals
+
+    known = ~np.isnan(metrics["speed"])
+
+    totals["distance"] = float(metrics["cumulative_distance"][-1])
+    totals["moving_time"] += float(np.sum(metrics["time_delta"][known]))
+
+    if known.any():
+        totals["max_speed"] = float(np.nanmax([totals["max_speed"],
+                                               np.max(metrics["speed"][known])]))
+
+    return totals
+
+# Here we create a function called: "rollup_fields".
+# The function returns the fields of the Tracker or Trail document which
+# contain the totals of the track.
+def rollup_fields(totals):
+
+    average_speed = None
+    if totals["moving_time"] > 0:
+        average_speed = totals["distance"] / totals["moving_time"]
+
+    return {"total_distance": totals["distance"],
+            "moving_time": totals["moving_time"],
+            "max_speed": None if np.isnan(totals["max_speed"]) else totals["max_speed"],
+            "average_speed": average_speed}
@@ -0,0 +1,93 @@
+# MongoEngine is used to create a database connection in every worker process.
+from mongoengine import connect
+
+# The ProcessPoolExecutor is used to run the imports in multiple processes.
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+# The time module is used to measure how long the import of a dataset takes.
+import time
+
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+#                                                                             #
+#                  IMPORTING MULTIPLE DATASETS IN PARALLEL                    #
+#                                                                             #
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+# Converting the rows of a dataset to documents uses one CPU core. Instead of
+# importing the datasets one after another, the functions below import
+# multiple datasets at the same time, each in a separate worker process.
+#
+# Every worker process creates its own connection to MongoDB, since a
+# connection can't be shared between processes. The indexes should be built
+# once, after all the workers are done.
+
+# Here we create a function called: "connect_worker".
+# This function is called once in every worker process, before the worker
+# imports its first dataset.
+def connect_worker(database):
+    connect(database)
+
+# Here we create a function called: "timed_import".
+# The function imports one dataset and returns the name of the dataset, the
+# amount of rows which were imported and the amount of seconds it took.
+#
+# The function expects the following parameters:
+# 1) The function which imports one dataset. It has to return the amount of
+#    rows which were imported.
+# 2) The parameters of that function, the second parameter is the name of the
+#    dataset.
+def timed_import(load_dataset, dataset):
+
+    start = time.perf_counter()
+    rows = load_dataset(*dataset)
+
+    return dataset[1], rows or 0, time.perf_counter() - start
+
+# Here we create a function called: "print_throughput".
+# The function prints how many rows per second were imported.
+def print_throughput(name, rows, seconds):
+    print("Imported " + str(rows) + " rows from: " + str(name) + " in "
+          + str(round(seconds, 1)) + " seconds ("
+          + str(int(rows / seconds) if seconds > 0 else rows) + " rows/s)")
+
+# Here we create a function called: "import_datasets".
+# The function imports a list of datasets using the amount of worker processes
+# passed as parameter. With one worker the datasets are imported one after
+# another in the current process, which is easier to debug.
+#
+# The function expects the following parameters:
+# 1) The name of the database the datasets are imported in
+# 2) The function which imports one dataset (Ex.: load_dataset)
+# 3) A list with the parameters of that function for every dataset
+# 4) The amount of worker processes
+def import_datasets(database, load_dataset, datasets, workers):
+
+    start = time.perf_counter()
+    results = []
+
+    if workers <= 1:
+        connect_worker(database)
+
+        for dataset in datasets:
+            results.append(timed_import(load_dataset, dataset))
+            print_throughput(*results[-1])
+    else:
+        # The database connection is created in the workers only. A connection
+        # created before the processes are started can't be used in them.
+        with ProcessPoolExecutor(max_workers=workers,
+                                 initializer=connect_worker,
+                                 initargs=(database,)) as executor:
+
+            futures = [executor.submit(timed_import, load_dataset, dataset)
+                       for dataset in datasets]
+
+            # Print the throughput of every dataset as soon as it is done.
+            for future in as_completed(futures):
+                results.append(future.result())
+                print_throughput(*results[-1])
+
+    total_rows = sum(rows for name, rows, seconds in results)
+
+    print_throughput(str(len(results)) + " datasets", total_rows,
+                     time.perf_counter() - start)
+
+    return results
@@ -0,0 +1,87 @@
+# The os module is used to expand the "~" in the location of a dataset.
+import os
+
+# PyArrow is used to convert the dataframes to Arrow tables and back, and to
+# read and write Parquet files.
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+#                                                                             #
+#                 STORING THE CONVERTED DATASETS AS PARQUET                   #
+#                                                                             #
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+# A JSON file stores every row as text, including the names of all the columns.
+# A Parquet file stores the values of each column together, in a compressed
+# binary format. This makes the converted datasets much smaller, and they can
+# be read without parsing text. The import scripts only read the columns they
+# need and read the file through memory mapping.
+
+# The amount of rows which are read at once when a Parquet file is read in
+# chunks.
+PARQUET_BATCH_ROWS = 100000
+
+# Here we create a function called: "write_parquet".
+# The function writes a dataframe to a Parquet file.
+def write_parquet(df, location):
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    pq.write_table(table, os.path.expanduser(location))
+    return len(df.index)
+
+# Here we create a function called: "write_parquet_chunks".
+# The function writes the dataframes of the chunks to one Parquet file. Every
+# chunk must have the same columns. The types of the columns are taken from
+# the schema passed as parameter, or from the first chunk if no schema is
+# passed. The function returns the amount of rows written.
+def write_parquet_chunks(chunks, location, schema=None):
+
+    writer = None
+    total = 0
+
+    try:
+        for chunk in chunks:
+
+            table = pa.Table.from_pandas(chunk, schema=schema, preserve_index=False)
+
+            if writer is None:
+                schema = table.schema
+                writer = pq.ParquetWriter(os.path.expanduser(location), schema)
+
+            writer.write_table(table)
+
+            total += len(chunk.index)
+            print("Written " + str(total) + " rows to: " + location)
+    finally:
+        if writer is not None:
+            writer.close()
+
+    return total
+
+# Here we create a function called: "read_parquet".
+# The function reads the columns passed as parameter from a Parquet file into
+# a dataframe. If no columns are passed, all the columns are read.
+def read_parquet(location, columns=None):
+    table = pq.read_table(os.path.expanduser(location), columns=columns,
+                          memory_map=True)
+    return table.to_pandas()
+
+# Here we create a function called: "read_parquet_chunks".
+# The function reads a Parquet file and returns a dataframe for each chunk of
+# rows, so the file doesn't have to fit in memory.
+def read_parquet_chunks(location, columns=None, chunk_rows=PARQUET_BATCH_ROWS):
+
+    parquet_file = pq.ParquetFile(os.path.expanduser(location), memory_map=True)
+
+    for batch in parquet_file.iter_batches(batch_size=chunk_rows, columns=columns):
+        yield batch.to_pandas()
+
+# Here we create a function called: "read_first_record".
+# The function returns the first row of a Parquet file as a dictionary, or
+# None if the file is empty.
+def read_first_record(location, columns=None):
+
+    for chunk in read_parquet_chunks(location, columns, chunk_rows=1):
+        if not chunk.empty:
+            return chunk.iloc[0].to_dict()
+
+    return None
@@ -0,0 +1,137 @@
+# The os module is used to expand the "~" in the location of a dataset.
+import os
+
+# Pandas is used to read the CSV files and PyArrow is used to describe the
+# types of the columns in a Parquet file.
+import pandas as pd
+import pyarrow as pa
+
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+#                                                                             #
+#                  DESCRIBING THE CSV FILES OF EACH DATA SOURCE               #
+#                                                                             #
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+# The CSV files of each data source contain different columns. Instead of
+# reading every column as text and selecting the required columns afterwards,
+# each data source has a profile which describes:
+# - usecols          : the columns which are read from the CSV file
+# - dtypes           : the type of each numeric column. Columns which don't
+#                      need the precision of a float64 are read as float32,
+#                      which uses half the memory.
+# - categories       : the text columns which contain only a few different
+#                      values. Pandas stores each value once and uses a number
+#                      for every row.
+# - timestamp        : the name of the timestamp column
+# - timestamp_format : the format of the timestamps, so Pandas doesn't have to
+#                      guess the format of every timestamp
+# - altitude         : the name of the altitude column
+#
+# A new data source is added by adding a profile to PROFILES.
+
+# The format of the timestamps in a Movebank CSV file
+# (Ex.: 2018-04-01 00:00:05.000).
+MOVEBANK_TIMESTAMP_FORMAT = '%Y-%m-%d %H:%M:%S.%f'
+
+# Here we create a function called: "movebank_profile".
+# The Movebank datasets of all the countries contain the same columns, except
+# for the altitude column. The function returns the profile of a Movebank
+# dataset with the altitude column passed as parameter.
+def movebank_profile(altitude_column):
+    return {
+        "usecols": ['event-id', 'study-name',
+                    'timestamp', 'visible',
+                    'ground-speed', 'heading',
+                    'location-long', 'location-lat',
+                    altitude_column,
+                    'individual-taxon-canonical-name',
+                    'sensor-type', 'tag-voltage',
+                    'individual-local-identifier'],
+        "dtypes": {'event-id': 'float64',
+                   'ground-speed': 'float32',
+                   'heading': 'float32',
+                   'location-long': 'float64',
+                   'location-lat': 'float64',
+                   altitude_column: 'float64',
+                   'tag-voltage': 'float32',
+                   'individual-local-identifier': 'float64'},
+        "categories": ['study-name', 'visible',
+                       'individual-taxon-canonical-name', 'sensor-type'],
+        "timestamp": 'timestamp',
+        "timestamp_format": MOVEBANK_TIMESTAMP_FORMAT,
+        "altitude": altitude_column,
+    }
+
+# The profiles of the data sources. The Swedish datasets contain the height
+# above the ellipsoid, the German and Lithuanian datasets contain the height
+# above mean sea level.
+PROFILES = {
+    "sw": movebank_profile('height-above-ellipsoid'),
+    "ge": movebank_profile('height-above-msl'),
+    "lt": movebank_profile('height-above-msl'),
+}
+
+# Here we create a function called: "get_profile".
+# The function returns the profile of the data source passed as parameter.
+def get_profile(source):
+
+    if source not in PROFILES:
+        raise ValueError("Unknown data source: " + str(source) +
+                         ", add a profile for it to SourceProfiles.py")
+
+    return PROFILES[source]
+
+# Here we create a function called: "read_csv_chunks".
+# The function reads a CSV file using a profile, and returns a dataframe for
+# each chunk of rows. Only the columns of the profile are read, with the types
+# defined in the profile, and the timestamps are converted to datetimes.
+def read_csv_chunks(location, profile, chunk_rows):
+
+    dtypes = dict(profile["dtypes"])
+    dtypes.update({column: 'category' for column in profile["categories"]})
+
+    chunks = pd.read_csv(os.path.expanduser(location),
+                         usecols=profile["usecols"],
+                         dtype=dtypes,
+                         chunksize=chunk_rows)
+
+    for chunk in chunks:
+
+        timestamp = profile["timestamp"]
+        chunk[timestamp] = pd.to_datetime(chunk[timestamp],
+                                          format=profile["timestamp_format"],
+                                          errors='coerce')
+
+        # Return the columns in the order of the profile.
+        yield chunk[profile["usecols"]]
+
+# Here we create a function called: "without_categories".
+# Every chunk of a CSV file has its own categories, so the categorical
+# columns are converted back to text before the chunks are stored in one file.
+# Unknown values are stored as None.
+def without_categories(chunk, profile):
+
+    chunk = chunk.copy()
+
+    for column in profile["categories"]:
+        chunk[column] = chunk[column].astype(object).where(chunk[column].notna(), None)
+
+    return chunk
+
+# Here we create a function called: "parquet_schema".
+# The function returns the types of the columns of a profile, which are used
+# to store the columns in a Parquet file.
+def parquet_schema(profile):
+
+    fields = []
+
+    for column in profile["usecols"]:
+        if column in profile["categories"]:
+            fields.append((column, pa.string()))
+        elif column == profile["timestamp"]:
+            fields.append((column, pa.timestamp('ms')))
+        elif profile["dtypes"].get(column) == 'float32':
+            fields.append((column, pa.float32()))
+        else:
+            fields.append((column, pa.float64()))
+
+    return pa.schema(fields)
@@ -0,0 +1,143 @@
+# NumPy is used to calculate the extent of a whole track at once, instead of
+# looping through the transmissions or signals.
+import numpy as np
+
+# SciPy is used to calculate the convex hull of the points of a track.
+from scipy.spatial import ConvexHull
+
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+#                                                                             #
+#                 CALCULATING THE EXTENT OF A TRACK                           #
+#                                                                             #
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+# The Tracker and Trail documents contain a summary of the extent of their
+# track, so the map viewers can decide which tracks are in the viewport without
+# downloading the transmissions or signals:
+# - bbox     : the bounding box [min_lon, min_lat, max_lon, max_lat]
+# - envelope : the convex hull of the track as a GeoJSON polygon, which has a
+#              2dsphere index (see DatabaseIndexes.py)
+# - min_alt  : the lowest altitude of the track
+# - max_alt  : the highest altitude of the track
+#
+# The convex hull of a track is the same as the convex hull of the hulls of its
+# chunks. When a track is imported in chunks, only the points of the hull are
+# kept between the chunks, so the complete track is never in memory.
+#
+# Note: the hull is calculated on the longitudes and latitudes, while MongoDB
+# connects the points of a polygon with great circles. For the tracks of a
+# crane or a trail the difference is a lot smaller than a map viewport.
+
+# The amount of degrees which is added around the envelope of a track of which
+# all the points are on a line (Ex.: a track with one point), since a polygon
+# without an area is not valid in MongoDB.
+ENVELOPE_PADDING = 0.00001
+
+# Here we create a function called: "new_extent".
+# The function returns the extent of a track of which no points are read yet.
+def new_extent():
+    return {"points": np.empty((0, 2)), "min_alt": np.nan, "max_alt": np.nan}
+
+# Here we create a function called: "hull_points".
+# The function returns the points of the convex hull of the points passed as
+# parameter, counterclockwise. If all the points are on one line, the two
+# outermost points are returned.
+def hull_points(points):
+
+    points = np.unique(points, axis=0)
+
+    if len(points) < 3:
+        return points
+
+    try:
+        return points[ConvexHull(points).vertices]
+
+    # Qhull can't create a hull of points which are all on one line. The
+    # points are sorted by longitude and latitude, so the first and the last
+    # point are the ends of the line.
+    except RuntimeError:
+        return points[[0, -1]]
+
+# Here we create a function called: "update_extent".
+# The function updates the extent of a track with the points of a chunk.
+# Points without valid coordinates are skipped.
+def update_extent(extent, lon, lat, alt):
+
+    lon = np.asarray(lon, dtype=float)
+    lat = np.asarray(lat, dtype=float)
+    alt = np.asarray(alt, dtype=float)
+
+    valid = ~(np.isnan(lon) | np.isnan(lat))
+    points = np.column_stack((lon[valid], lat[valid]))
+
+    if len(points) > 0:
+        extent["points"] = hull_points(np.concatenate((extent["points"], points)))
+
+    known = alt[~np.isnan(alt)]
+
+    if len(known) > 0:
+        extent["min_alt"] = float(np.nanmin([extent["min_alt"], known.min()]))
+        extent["max_alt"] = float(np.nanmax([extent["max_alt"], known.max()]))
+
+    return extent
+
+# Here we create a function called: "stored_extent".
+# The function returns the extent of a tracker or trail which is already in
+# the database, so new points can be added to the track (see the incremental
+# import).
+def stored_extent(document):
+
+    extent = new_extent()
+
+    envelope = document.envelope
+
+    # A PolygonField is returned as a GeoJSON dictionary when it is loaded
+    # from the database.
+    if isinstance(envelope, dict):
+        envelope = envelope['coordinates']
+
+    if envelope:
+        # The last point of the ring is the same as the first point.
+        extent["points"] = hull_points(np.asarray(envelope[0][:-1], dtype=float))
+
+    if document.min_alt is not None:
+        extent["min_alt"] = document.min_alt
+    if document.max_alt is not None:
+        extent["max_alt"] = document.max_alt
+
+    return extent
+
+# Here we create a function called: "envelope_polygon".
+# The function returns the GeoJSON polygon of the hull points of a track. If
+# the hull has no area, the bounding box with some padding is returned.
+def envelope_polygon(points):
+
+    if len(points) >= 3:
+        ring = points.tolist()
+    else:
+        min_lon, min_lat = points.min(axis=0) - ENVELOPE_PADDING
+        max_lon, max_lat = points.max(axis=0) + ENVELOPE_PADDING
+        ring = [[min_lon, min_lat], [max_lon, min_lat],
+                [max_lon, max_lat], [min_lon, max_lat]]
+
+    # Close the ring by repeating the first point.
+    ring.append(ring[0])
+
+    return {"type": "Polygon", "coordinates": [ring]}
+
+# Here we create a function called: "summary_fields".
+# The function returns the fields of the Tracker or Trail document which
+# contain the extent of the track.
+def summary_fields(extent):
+
+    points = extent["points"]
+
+    fields = {"min_alt": None if np.isnan(extent["min_alt"]) else extent["min_alt"],
+              "max_alt": None if np.isnan(extent["max_alt"]) else extent["max_alt"],
+              "bbox": None,
+              "envelope": None}
+
+    if len(points) > 0:
+        fields["bbox"] = points.min(axis=0).tolist() + points.max(axis=0).tolist()
+        fields["envelope"] = envelope_polygon(points)
+
+    return fields
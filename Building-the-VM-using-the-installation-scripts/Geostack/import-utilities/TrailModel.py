@@ -9,6 +9,9 @@ from mongoengine import *
 # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
 class Trail(Document):
 
+    # The index on the envelope is defined in DatabaseIndexes.py.
+    meta = {'auto_create_index': False}
+
     # Name of the Trail
     name = StringField()
 
@@ -27,6 +30,28 @@ class Trail(Document):
     # Amount of trackpoints in the dataset
     t_points = IntField()
 
+    # Total distance of the route in meters
+    total_distance = FloatField()
+
+    # Total time, in seconds, between the signals of which the speed is known
+    moving_time = FloatField()
+
+    # Highest speed between two signals, in meters per second
+    max_speed = FloatField()
+
+    # Average speed of the route, in meters per second
+    average_speed = FloatField()
+
+    # Bounding box of the route [min_lon, min_lat, max_lon, max_lat]
+    bbox = ListField(FloatField())
+
+    # Convex hull of the route, used to find the trails in a map viewport
+    envelope = PolygonField()
+
+    # Lowest and highest altitude of the route
+    min_alt = FloatField()
+    max_alt = FloatField()
+
 class Geometry(EmbeddedDocument):
 
     # coordinates of signal coord=[1,2]
@@ -35,13 +60,89 @@ class Geometry(EmbeddedDocument):
     # altitude of signal
     alt = FloatField()
 
+class Motion(EmbeddedDocument):
+
+    # The values below are calculated from the previous signal of the trail
+    # by MotionMetrics.py.
+
+    # Heading from the previous signal, in degrees (0 = north)
+    heading = FloatField()
+
+    # Distance from the previous signal, in meters
+    step_distance = FloatField()
+
+    # Time since the previous signal, in seconds
+    time_delta = FloatField()
+
+    # Speed since the previous signal, in meters per second
+    speed = FloatField()
+
+    # Distance from the first signal, in meters
+    cumulative_distance = FloatField()
+
+    # Change of the heading compared to the previous step, in degrees
+    turning_angle = FloatField()
+
 class Signal(Document):
 
+    # The indexes of this collection are defined in DatabaseIndexes.py.
+    # MongoEngine should not create its own index on the PointField.
+    meta = {'auto_create_index': False}
+
     # Timestamp of signal
     time = DateTimeField()
 
+    # Position of the signal in the route of the trail, starting at 0
+    seq = IntField()
+
     # Geometry of signal
     geometry = EmbeddedDocumentField(Geometry)
 
+    # Motion metrics of signal
+    motion = EmbeddedDocumentField(Motion)
+
     # Reference to the route of signal
     trail = ReferenceField(Trail)
+
+class SignalLevel(Document):
+
+    # Reference to the trail the simplified track belongs to
+    trail = ReferenceField(Trail)
+
+    # Zoom level for which the track is simplified
+    zoom = IntField()
+
+    # Tolerance, in degrees, used to simplify the track
+    tolerance = FloatField()
+
+    # Coordinates of the simplified track coords=[[1,2],[3,4]]
+    coords = ListField(ListField(FloatField()))
+
+    # Altitudes of the points in the simplified track
+    alt = ListField(FloatField())
+
+    # Times of the points in the simplified track
+    time = ListField(DateTimeField())
+
+    # Amount of points in the simplified track
+    points = IntField()
+
+class SignalBucket(Document):
+
+    # Reference to the trail the signals belong to
+    trail = ReferenceField(Trail)
+
+    # Start of the period (hour) of the bucket
+    start = DateTimeField()
+
+    # Time of the last signal in the bucket
+    end = DateTimeField()
+
+    # Amount of signals in the bucket
+    count = IntField()
+
+    # The values of the signals in the bucket. The values at the same
+    # position in the lists belong to the same signal.
+    time = ListField(DateTimeField())
+    coords = ListField(ListField(FloatField()))
+    alt = ListField(FloatField())
@@ -0,0 +1,35 @@
+# Psycopg2 is used to connect to the World Port Index database in PostgreSQL.
+import psycopg2
+
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+#                                                                             #
+#             CONNECTING TO THE WORLD PORT INDEX DATABASE                     #
+#                                                                             #
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+# The World Port Index is imported in PostgreSQL by the file:
+# world-port-index-import.py, and used by the file: nearest-port-join.py.
+# Both files read the connection parameters from this file, so they only have
+# to be changed in one place.
+# Note: the Flask-API settings WPI_HOST, WPI_DATABASE, WPI_USER and WPI_PASS
+# must have the same values.
+
+# The connection parameters of the World Port Index database.
+WPI_PARAMETERS = {"host": "localhost",
+                  "dbname": "World_Port_Index_Database",
+                  "user": "postgres",
+                  "password": "geostack",
+                  "port": 5432}
+
+# Here we create a function called: "connect_wpi".
+# The function returns a new connection to the World Port Index database.
+def connect_wpi():
+    return psycopg2.connect(**WPI_PARAMETERS)
+
+# Here we create a function called: "command_options".
+# The function returns the options which are passed to the PostgreSQL command
+# line tools (Ex.: createdb and psql), with the password as the environment
+# variable PGPASSWORD.
+def command_options():
+    return ('PGPASSWORD="' + WPI_PARAMETERS["password"] + '"',
+            '-h ' + WPI_PARAMETERS["host"] + ' -p ' + str(WPI_PARAMETERS["port"]) +
+            ' -U ' + WPI_PARAMETERS["user"])
@@ -5,6 +5,89 @@ import pandas as pd
 # Here we import the CraneModel Python file.
 import CraneModel
 
+# Here we import the LevelOfDetail Python file, which is used to create the
+# simplified copies of a track.
+import LevelOfDetail
+
+# Here we import the DatabaseIndexes Python file, which defines the indexes
+# of the Crane database.
+import DatabaseIndexes
+
+# Here we import the BucketStorage Python file, which is used to store the
+# transmissions in buckets.
+import BucketStorage
+
+# Here we import the BulkLoader Python file, which is used to insert the
+# transmissions in chunks.
+import BulkLoader
+
+# Here we import the ChunkedReader Python file, which is used to read large
+# datasets in chunks.
+import ChunkedReader
+
+# Here we import the ParallelImport Python file, which is used to import
+# multiple datasets at the same time.
+import ParallelImport
+
+# Here we import the ParquetStorage Python file, which is used to read the
+# converted datasets.
+import ParquetStorage
+
+# Here we import the SourceProfiles Python file, which describes the columns
+# of the datasets of each country.
+import SourceProfiles
+
+# Here we import the MotionMetrics Python file, which is used to calculate the
+# distance, heading and speed of every transmission.
+import MotionMetrics
+
+# Here we import the TrackSummary Python file, which is used to calculate the
+# bounding box, envelope and altitude range of a track.
+import TrackSummary
+
+# Here we import the DatasetVersion Python file, which is used to tell the
+# Flask-API that the data has changed.
+import DatasetVersion
+
+# The layout in which the transmissions are stored. Use "documents" to store
+# every transmission as a separate document, or "buckets" to store the
+# transmissions of a tracker in one document per day.
+# Note: the Flask-API setting CRANE_STORAGE_LAYOUT must have the same value.
+STORAGE_LAYOUT = "documents"
+
+# The way the datasets are read. Use "memory" to read a dataset at once, or
+# "chunked" to read and insert it in chunks of rows. The chunked mode is used
+# for large datasets which do not fit in memory.
+INGEST_MODE = "memory"
+
+# The amount of datasets which are imported at the same time. Every dataset is
+# imported in a separate worker process, so this should not be higher than the
+# amount of CPU cores.
+IMPORT_WORKERS = 4
+
+# Set to True to add only the new transmissions of a dataset to a tracker that
+# is already in the database, instead of creating a new tracker. This is used
+# to refresh the database with the latest Movebank data.
+INCREMENTAL_IMPORT = False
+
+# The format of the converted datasets, which are created by the
+# dataset-convert Python file. Use "parquet" or "json".
+# Note: the OUTPUT_FORMAT setting in dataset-convert must have the same value.
+DATASET_FORMAT = "parquet"
+
+# The folders containing the converted datasets of each format.
+DATASET_FOLDERS = {
+    "parquet": '~/Geostack/datasets/Parquet/Crane_Parquet/',
+    "json": '~/Geostack/datasets/JSON/Crane_JSON/',
+}
+
+# Here we create a function called: "dataset_columns".
+# The function returns the columns which are read from a Parquet dataset.
+# The heading column of the dataset is not used, so it is not read.
+def dataset_columns(country):
+    return [column for column in SourceProfiles.get_profile(country)["usecols"]
+            if column != 'heading']
+
 
 def load_data(df,name,country):
 
@@ -20,59 +103,376 @@ def load_data(df,name,country):
                     name = name,
                     transmission_Count = transmission_Count).save()
 
-    transmissions = []
+    alt_column = altitude_column(country)
 
-    print('Start appending transmissions to list from: ' + str(name) )
+    print('Bulk inserting: '+ str(transmission_Count) + ' transmissions from: ' + str(name) )
 
-    for index,row in df.iterrows():
+    # Calculate the motion metrics of the whole track at once.
+    motion = MotionMetrics.compute_metrics(df['location-long'],
+                                           df['location-lat'],
+                                           df['timestamp'])
 
+    inserted = insert_transmissions(tracker, df, alt_column, motion)
 
-       if country == "sw":
-            geometry = CraneModel.Geometry(coord = [row['location-long'],row['location-lat']],
-                                alt = row['height-above-ellipsoid'])
-       else:
-            geometry = CraneModel.Geometry(coord = [row['location-long'],row['location-lat']],
-                                alt = row['height-above-msl'])
+    # Transmissions of which the event id is already in the database are
+    # skipped, so a dataset which was imported before doesn't create a second
+    # tracker without transmissions.
+    if inserted == 0:
+        tracker.delete()
+        print("The transmissions of: " + str(name) + " are already in the database")
+        return 0
 
-       metadata = CraneModel.TransmissionMetadata(visible = row['visible'],
-                           sensor_type = row['sensor-type'],
-                           tag_voltage = row['tag-voltage'])
+    # Store the amount of transmissions which were inserted and the totals of
+    # the track on the tracker.
+    totals = MotionMetrics.update_totals(MotionMetrics.new_totals(), motion)
+    tracker.update(transmission_Count = inserted,
+                   **MotionMetrics.rollup_fields(totals))
 
-       speed = CraneModel.Speed(ground_speed = row['ground-speed'])
+    print("Done inserting "+ str(inserted) + " transmissions")
 
-       transmissions.append(CraneModel.Transmission(event_id = row['event-id'],
-                                          timestamp = row['timestamp'],
-                                          geometry = geometry,
-                                          speed = speed,
-                                          metadata = metadata,
-                                          tracker = tracker))
+    # Store the extent of the track on the tracker.
+    extent = TrackSummary.update_extent(TrackSummary.new_extent(),
+                                        df['location-long'],
+                                        df['location-lat'],
+                                        df[alt_column])
+    tracker.update(**TrackSummary.summary_fields(extent))
 
-    print('Bulk inserting: '+ str(transmission_Count) + ' transmissions from: ' + str(name) )
+    LevelOfDetail.create_transmission_levels(tracker,
+                                             df['location-long'],
+                                             df['location-lat'],
+                                             df[alt_column],
+                                             pd.to_datetime(df['timestamp']).dt.to_pydatetime())
+
+    return inserted
+
+
+# Here we create a function called: "altitude_column".
+# The function returns the name of the altitude column of the datasets of a
+# country, which is defined in the profile of the country.
+def altitude_column(country):
+    return SourceProfiles.get_profile(country)["altitude"]
+
+
+# Here we create a function called: "insert_transmissions".
+# The function inserts the transmissions of a dataframe (a complete dataset or
+# a chunk of a dataset) in the layout defined by STORAGE_LAYOUT, and returns
+# the amount of transmissions which were inserted. The sequence number of the
+# first transmission of the dataframe is passed as "first_seq". The motion
+# metrics and sequence numbers are not stored in the bucket layout.
+def insert_transmissions(tracker, df, alt_column, motion=None, first_seq=0):
+
+    if STORAGE_LAYOUT == "buckets":
+
+        # Transmissions of which the event id is already in a bucket, or
+        # which occur earlier in the dataframe, are skipped, in the same way
+        # as the unique index skips them in the documents layout.
+        duplicate = BulkLoader.duplicate_rows(CraneModel.TransmissionBucket._get_collection(),
+                                              'event_id', df['event-id'])
+        df = df[~duplicate].reset_index(drop=True)
+
+        if df.empty:
+            return 0
+
+        BucketStorage.create_transmission_buckets(tracker,
+                                                  df['event-id'],
+                                                  df['timestamp'],
+                                                  df['location-long'],
+                                                  df['location-lat'],
+                                                  df[alt_column],
+                                                  df['ground-speed'],
+                                                  df['visible'],
+                                                  df['sensor-type'],
+                                                  df['tag-voltage'])
+
+        return len(df.index)
+    else:
+
+        return BulkLoader.insert_transmissions(tracker,
+                                        df['event-id'],
+                                        df['timestamp'],
+                                        df['location-long'],
+                                        df['location-lat'],
+                                        df[alt_column],
+                                        df['ground-speed'],
+                                        df['visible'],
+                                        df['sensor-type'],
+                                        df['tag-voltage'],
+                                        motion,
+                                        first_seq)
+
+
+# Here we create a function called: "load_data_chunked".
+# The function imports a dataset chunk by chunk, so only one chunk is in
+# memory at a time. The tracker is created from the first chunk, and its start
+# date, end date and amount of transmissions are updated after every chunk.
+# The levels of detail are created from the reduced chunks at the end.
+def load_data_chunked(location,name,country):
+
+    alt_column = altitude_column(country)
+
+    tracker = None
+    summary = ChunkedReader.new_summary()
+    reduced_chunks = []
+
+    # The last transmission of the previous chunk, the totals of the motion
+    # metrics and the extent of the track.
+    previous = None
+    totals = MotionMetrics.new_totals()
+    extent = TrackSummary.new_extent()
+
+    # The sequence number of the first transmission of the next chunk, and
+    # the amount of transmissions which were inserted.
+    first_seq = 0
+    inserted = 0
+
+    for number, df in enumerate(ChunkedReader.read_chunks(location, dataset_columns(country))):
+
+        timestamps = pd.to_datetime(df['timestamp'])
+        ChunkedReader.update_summary(summary, timestamps)
+
+        if tracker is None:
+            tracker = CraneModel.Tracker(study_name = df.at[0,'study-name'],
+                            individual_taxon_canonical_name  = df.at[0,'individual-taxon-canonical-name'],
+                            individual_local_identifier = df.at[0,'individual-local-identifier'],
+                            name = name,
+                            transmission_Count = 0).save()
+
+        motion = MotionMetrics.compute_metrics(df['location-long'],
+                                               df['location-lat'],
+                                               timestamps, previous)
+        previous = MotionMetrics.next_state(df['location-long'],
+                                            df['location-lat'],
+                                            timestamps, motion, previous)
+        MotionMetrics.update_totals(totals, motion)
+        TrackSummary.update_extent(extent, df['location-long'],
+                                   df['location-lat'], df[alt_column])
+
+        inserted += insert_transmissions(tracker, df, alt_column, motion, first_seq)
+        first_seq += len(df.index)
+
+        tracker.update(start_date = summary["start"],
+                       end_date = summary["end"],
+                       transmission_Count = inserted,
+                       **MotionMetrics.rollup_fields(totals),
+                       **TrackSummary.summary_fields(extent))
+
+        reduced_chunks.append(LevelOfDetail.reduce_chunk(df['location-long'],
+                                                         df['location-lat'],
+                                                         df[alt_column],
+                                                         timestamps.dt.to_pydatetime()))
+
+        ChunkedReader.print_progress(name, number, len(df.index), summary)
+
+    if tracker is None:
+        print("The dataset: " + location + " does not contain any transmissions")
+        return 0
 
-    CraneModel.Transmission.objects.insert(transmissions,load_bulk=True)
+    # A dataset which was imported before doesn't create a second tracker.
+    if inserted == 0:
+        tracker.delete()
+        print("The transmissions of: " + str(name) + " are already in the database")
+        return 0
 
+    print("Done inserting "+ str(inserted) + " transmissions")
 
-    print("Done inserting "+ str(len(df.index)) + " transmissions")
+    LevelOfDetail.create_transmission_levels(tracker,
+                                             *LevelOfDetail.combine_chunks(reduced_chunks))
+
+    return inserted
+
+
+# Here we create a function called: "find_tracker".
+# The function returns the tracker of a dataset if it is already in the
+# database, or None if it isn't. The tracker is found by the name of the study
+# and the identifier of the crane in the first transmission of the dataset.
+def find_tracker(location):
+
+    first = ChunkedReader.read_first_record(location)
+
+    if first is None:
+        return None
+
+    return CraneModel.Tracker.objects(
+        study_name = first['study-name'],
+        individual_local_identifier = int(first['individual-local-identifier'])).first()
+
+
+# Here we create a function called: "append_data".
+# The function adds the transmissions of a dataset which are newer than the
+# end date of the tracker. The dataset is read in chunks, so a complete
+# dataset can be passed without using a lot of memory. Transmissions of which
+# the event id is already in the database (or earlier in the dataset) are
+# skipped before they are inserted, so the sequence numbers have no gaps.
+# The end date and the amount of transmissions of the tracker are updated in
+# place, and the levels of detail are recreated from the stored most detailed
+# level and the new transmissions.
+def append_data(tracker,location,name,country):
+
+    alt_column = altitude_column(country)
+
+    # Only transmissions after this date are added.
+    cutoff = tracker.end_date
+    end_date = tracker.end_date
+    inserted = 0
+
+    reduced_chunks = LevelOfDetail.stored_transmission_track(tracker)
+
+    # The motion metrics of the new transmissions continue from the last
+    # transmission of the tracker which is already in the database. In the
+    # bucket layout this is the newest transmission of the newest bucket.
+    if STORAGE_LAYOUT == "buckets":
+        bucket = CraneModel.TransmissionBucket.objects(tracker = tracker,
+                                                       start__ne = None) \
+                                              .order_by('-start').first()
+        previous = MotionMetrics.bucket_state(bucket, 'timestamp',
+                                              tracker.total_distance)
+        last = None
+    else:
+        last = CraneModel.Transmission.objects(tracker = tracker) \
+                                      .order_by('-timestamp').first()
+        previous = MotionMetrics.stored_state(last, 'timestamp')
+
+    totals = MotionMetrics.new_totals(tracker.total_distance,
+                                      tracker.moving_time,
+                                      tracker.max_speed)
+    extent = TrackSummary.stored_extent(tracker)
+
+    # The sequence numbers of the new transmissions continue after the last
+    # transmission of the tracker. They are not stored in the bucket layout.
+    first_seq = BulkLoader.next_seq(last, tracker.transmission_Count)
+
+    for df in ChunkedReader.read_chunks(location, dataset_columns(country)):
+
+        timestamps = pd.to_datetime(df['timestamp'])
+
+        if cutoff is not None:
+            new = (timestamps > cutoff).to_numpy()
+            df = df[new].reset_index(drop=True)
+            timestamps = timestamps[new].reset_index(drop=True)
+
+        # Remove the transmissions which are already in the database, or
+        # which occur earlier in the dataset. In the bucket layout this is
+        # done by insert_transmissions().
+        if STORAGE_LAYOUT != "buckets":
+            duplicate = BulkLoader.duplicate_rows(CraneModel.Transmission._get_collection(),
+                                                  'event_id', df['event-id'])
+            df = df[~duplicate].reset_index(drop=True)
+            timestamps = timestamps[~duplicate].reset_index(drop=True)
+
+        if df.empty:
+            continue
+
+        motion = MotionMetrics.compute_metrics(df['location-long'],
+                                               df['location-lat'],
+                                               timestamps, previous)
+        previous = MotionMetrics.next_state(df['location-long'],
+                                            df['location-lat'],
+                                            timestamps, motion, previous)
+        MotionMetrics.update_totals(totals, motion)
+        TrackSummary.update_extent(extent, df['location-long'],
+                                   df['location-lat'], df[alt_column])
+
+        count = insert_transmissions(tracker, df, alt_column, motion, first_seq)
+        first_seq += len(df.index)
+        inserted += count
+
+        if end_date is None or timestamps.max() > end_date:
+            end_date = timestamps.max().to_pydatetime()
+
+        # Update the tracker in place.
+        tracker.update(set__end_date = end_date,
+                       inc__transmission_Count = count,
+                       **MotionMetrics.rollup_fields(totals),
+                       **TrackSummary.summary_fields(extent))
+
+        reduced_chunks.append(LevelOfDetail.reduce_chunk(df['location-long'],
+                                                         df['location-lat'],
+                                                         df[alt_column],
+                                                         timestamps.dt.to_pydatetime()))
+
+    print("Added " + str(inserted) + " new transmissions to: " + str(name))
+
+    if inserted > 0:
+        LevelOfDetail.create_transmission_levels(tracker,
+                                                 *LevelOfDetail.combine_chunks(reduced_chunks))
+
+    return inserted
+
+
+# Here we create a function called: "load_dataset".
+# The function imports the dataset at the location passed as parameter, using
+# the mode defined by INGEST_MODE, and returns the amount of transmissions.
+# The location is the name of the file without the folder and the extension,
+# the folder and extension are added depending on DATASET_FORMAT.
+def load_dataset(location,name,country):
+
+    location = DATASET_FOLDERS[DATASET_FORMAT] + location + '.' + DATASET_FORMAT
+
+    # Add the new transmissions to the tracker if it already exists.
+    if INCREMENTAL_IMPORT:
+        tracker = find_tracker(location)
+
+        if tracker is not None:
+            return append_data(tracker,location,name,country)
+
+    if INGEST_MODE == "chunked":
+        return load_data_chunked(location,name,country)
+    else:
+        return load_data(read_dataset(location,country),name,country)
+
+
+# Here we create a function called: "read_dataset".
+# The function reads a complete dataset. Only the columns which are used are
+# read from a Parquet dataset, through memory mapping.
+def read_dataset(location,country):
+
+    if ChunkedReader.is_parquet(location):
+        return ParquetStorage.read_parquet(location, dataset_columns(country))
+
+    return pd.read_json(location)
+
+
+# The datasets which are imported. Each dataset contains the name of the
+# converted file, the name of the crane and the country of the dataset.
+DATASETS = [
+    ('Agnetha-SW',"Agnetha","sw"),
+    ('Frida-SW',"Frida","sw"),
+    ('Cajsa-SW',"Cajsa","sw"),
+
+    #('Nena-GE',"Nena","ge"),
+    #('Lotta-GE',"Lotta","ge"),
+
+    ('Lita-LT',"Lita","lt"),
+]
 
 
 def import_data():
-    connect('Crane_Database')
 
     print("Starting import of Crane datasets")
 
-    load_data(pd.read_json('~/Geostack/datasets/JSON/Crane_JSON/Agnetha-SW.json'),"Agnetha","sw")
-    load_data(pd.read_json('~/Geostack/datasets/JSON/Crane_JSON/Frida-SW.json'),"Frida","sw")
-    load_data(pd.read_json('~/Geostack/datasets/JSON/Crane_JSON/Cajsa-SW.json'),"Cajsa","sw")
+    # The unique indexes have to exist before the transmissions are inserted. The
+    # other indexes are built once, after all the datasets are imported. The
+    # connection is closed before the worker processes are started, since a
+    # connection can't be shared between processes.
+    connect('Crane_Database')
+    DatabaseIndexes.prepare_indexes(DatabaseIndexes.CRANE_INDEXES)
+    disconnect()
 
-    #load_data(pd.read_json('~/Geostack/datasets/JSON/Crane_JSON/Nena-GE.json'),"Nena","ge")
-    #load_data(pd.read_json('~/Geostack/datasets/JSON/Crane_JSON/Lotta-GE.json'),"Lotta","ge")
+    # Import the datasets in IMPORT_WORKERS processes at the same time.
+    ParallelImport.import_datasets('Crane_Database', load_dataset,
+                                   DATASETS, IMPORT_WORKERS)
 
-    load_data(pd.read_json('~/Geostack/datasets/JSON/Crane_JSON/Lita-LT.json'),"Lita","lt")
     print("Finished import")
 
-    CraneModel.Transmission.create_index(("tracker"))
-    CraneModel.Transmission.create_index(("timestamp"))
-    CraneModel.Transmission.create_index(("geometry.coord"))
+    # Build the other indexes, now all the datasets are imported.
+    connect('Crane_Database')
+    DatabaseIndexes.update_indexes(DatabaseIndexes.CRANE_INDEXES)
+
+    # The cached results of the Flask-API are no longer valid.
+    DatasetVersion.bump_version()
 
 
-import_data()
+# The import only starts when this file is run as a script. This is required
+# since the worker processes may import this file to find load_dataset().
+if __name__ == '__main__':
+    import_data()
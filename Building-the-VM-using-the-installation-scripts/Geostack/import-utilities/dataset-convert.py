@@ -1,39 +1,52 @@
 
-import gpxpy
+# Here we import the GpxReader Python file, which is used to read GPX files.
+import GpxReader
+# Here we import the ChunkedReader Python file, which is used to convert large
+# CSV files in chunks.
+import ChunkedReader
+# Here we import the ParquetStorage Python file, which is used to write the
+# converted datasets as Parquet files.
+import ParquetStorage
+# Here we import the SourceProfiles Python file, which describes the CSV files
+# of each data source.
+import SourceProfiles
 import datetime
-import pandas as pd
 import os
 
-input_location_gpx = '/home/geostack/Geostack/datasets/GPX/'
-output_location_gpx = '/home/geostack/Geostack/datasets/JSON/Trail_JSON/'
+# The format of the converted datasets. Use "parquet" (smaller and faster to
+# import) or "json".
+# Note: the DATASET_FORMAT setting in the crane-datasets-import and
+# trail-datasets-import Python files must have the same value.
+OUTPUT_FORMAT = "parquet"
 
+input_location_gpx = '/home/geostack/Geostack/datasets/GPX/'
 input_location_csv = '/home/geostack/Geostack/datasets/CSV/'
-output_location_csv = '/home/geostack/Geostack/datasets/JSON/Crane_JSON/'
-
-
-
-def create_df(data):
-
-    df = pd.DataFrame(columns=['lon', 'lat', 'alt', 'time'])
 
-    for point in data:
-        df = df.append({'lon': point.longitude,
-                        'lat' : point.latitude,
-                        'alt' : point.elevation,
-                        'time' : point.time}, ignore_index=True)
-    return df
+if OUTPUT_FORMAT == "parquet":
+    output_location_gpx = '/home/geostack/Geostack/datasets/Parquet/Trail_Parquet/'
+    output_location_csv = '/home/geostack/Geostack/datasets/Parquet/Crane_Parquet/'
+else:
+    output_location_gpx = '/home/geostack/Geostack/datasets/JSON/Trail_JSON/'
+    output_location_csv = '/home/geostack/Geostack/datasets/JSON/Crane_JSON/'
 
 def parse_transform_GPX(input_file,output_file):
 
     input_location = input_location_gpx + input_file
 
-    output_location = output_location_gpx + output_file
+    output_file = output_file + '.' + OUTPUT_FORMAT
 
-    parsed_file =  gpxpy.parse(open(input_location, 'r'))
+    output_location = output_location_gpx + output_file
 
-    df = create_df(parsed_file.tracks[0].segments[0].points)
+    # Read the trackpoints of all tracks and segments in the GPX file.
+    df = GpxReader.read_gpx(input_location)
 
-    df.to_json(output_location,orient='records')
+    if OUTPUT_FORMAT == "parquet":
+        # Store the time as the amount of milliseconds since 1970-01-01, in
+        # the same way as the JSON files.
+        df['time'] = GpxReader.time_in_milliseconds(df)
+        ParquetStorage.write_parquet(df, output_location)
+    else:
+        df.to_json(output_location,orient='records')
 
     print("transformed: "+input_file+" to: " + output_file)
 
@@ -42,46 +55,31 @@ def filter_transform_CSV(input_file,output_file,country):
 
     input_location = input_location_csv+input_file
 
+    output_file = output_file + '.' + OUTPUT_FORMAT
+
     output_location = output_location_csv+output_file
 
-    df = pd.read_csv(input_location,dtype='unicode')
-
-    print(df)
-
-    if country == "sw":
-        columns_to_filter = ['event-id', 'study-name',
-                     'timestamp','visible',
-                     'ground-speed','heading',
-                     'location-long','location-lat',
-                     'height-above-ellipsoid',
-                     'individual-taxon-canonical-name',
-                     'sensor-type','tag-voltage',
-                     'individual-local-identifier']
-    elif country == "ge":
-        columns_to_filter = ['event-id', 'study-name',
-                     'timestamp','visible',
-                     'ground-speed','heading',
-                     'location-long','location-lat',
-                     'height-above-msl',
-                     'individual-taxon-canonical-name',
-                     'sensor-type','tag-voltage',
-                     'individual-local-identifier']
-
-    elif country == "lt":
-        columns_to_filter = ['event-id', 'study-name',
-                     'timestamp','visible',
-                     'ground-speed','heading',
-                     'location-long','location-lat',
-                     'height-above-msl',
-                     'individual-taxon-canonical-name',
-                     'sensor-type','tag-voltage',
-                     'individual-local-identifier']
+    # Get the profile of the data source, which describes the columns which
+    # are read and their types.
+    try:
+        profile = SourceProfiles.get_profile(country)
+    except ValueError as error:
+        print(error)
+        return
+
+    # Read the CSV file in chunks, so large datasets don't have to fit in
+    # memory. Only the columns of the profile are read, and each chunk is
+    # appended to the output file before the next chunk is read.
+    chunks = SourceProfiles.read_csv_chunks(input_location, profile,
+                                            ChunkedReader.READ_CHUNK_ROWS)
+
+    if OUTPUT_FORMAT == "parquet":
+        ParquetStorage.write_parquet_chunks(
+            (SourceProfiles.without_categories(chunk, profile) for chunk in chunks),
+            output_location,
+            SourceProfiles.parquet_schema(profile))
     else:
-        print("invalid country")
-
-    filtered_df = df[columns_to_filter]
-
-    filtered_df.to_json(output_location,orient='records')
+        ChunkedReader.write_json_chunks(chunks, output_location)
 
     print("transformed: "+input_file+" to: " + output_file)
 
@@ -94,21 +92,21 @@ os.system('cp -r /home/geostack/GeoStack-Course/Course-Datasets/GPX /home/geosta
 os.system('cp -r /home/geostack/GeoStack-Course/Course-Datasets/CSV /home/geostack/Geostack/datasets/')
 
 
-os.system('mkdir -p /home/geostack/Geostack/datasets/JSON/Trail_JSON')
-parse_transform_GPX("JAN-16-11 172053 Zeeland MNV.gpx",'Trail_ZeelandMNV.json')
-parse_transform_GPX("SEP-26-09 64311 Biesbosch.gpx",'Trail_Biesbosch.json')
-parse_transform_GPX("JUN-03-11 151845 BiesboschLibellen.gpx",'Trail-Biesbosch-Libellen.json')
-parse_transform_GPX("SEP-25-09 182235 Hamert.gpx",'Trail-Hamert-Hike.json')
-parse_transform_GPX("OKT-25-09 164243 Hamert Fiets.gpx",'Trail-Hamert-Bike.json')
+os.system('mkdir -p ' + output_location_gpx)
+parse_transform_GPX("JAN-16-11 172053 Zeeland MNV.gpx",'Trail_ZeelandMNV')
+parse_transform_GPX("SEP-26-09 64311 Biesbosch.gpx",'Trail_Biesbosch')
+parse_transform_GPX("JUN-03-11 151845 BiesboschLibellen.gpx",'Trail-Biesbosch-Libellen')
+parse_transform_GPX("SEP-25-09 182235 Hamert.gpx",'Trail-Hamert-Hike')
+parse_transform_GPX("OKT-25-09 164243 Hamert Fiets.gpx",'Trail-Hamert-Bike')
 
 
-os.system('mkdir -p /home/geostack/Geostack/datasets/JSON/Crane_JSON')
-filter_transform_CSV('20200103_Dataset_LT_TrackerID_16121_Crane_Lita.csv','Lita-LT.json',"lt")
-filter_transform_CSV('20181003_Dataset_SV_TrackerID_9381_ColorCode_RRW-BuGBk_Crane_Frida.csv','Frida-SW.json',"sw")
-filter_transform_CSV('20181003_Dataset_SV_TrackerID_9407_ColorCode_RRW-BuGY_Crane_Agnetha.csv','Agnetha-SW.json',"sw")
-filter_transform_CSV('20181003_Dataset_SV_TrackerID_9472_ColorCode_RRW-BuGR_Crane_Cajsa.csv','Cajsa-SW.json',"sw")
-#filter_transform_CSV('20191103_Dataset_DE_GPS_Crane_181528_iCora_Crane_15_BuBuBr-WYW_Lotta.csv','Lotta-GE.json',"ge")
-#filter_transform_CSV('20180928_Dataset_DE_GPS_Crane_181527_iCora_Crane_13_BuBuBr-YBuBk.csv','Nena-GE.json',"ge")
+os.system('mkdir -p ' + output_location_csv)
+filter_transform_CSV('20200103_Dataset_LT_TrackerID_16121_Crane_Lita.csv','Lita-LT',"lt")
+filter_transform_CSV('20181003_Dataset_SV_TrackerID_9381_ColorCode_RRW-BuGBk_Crane_Frida.csv','Frida-SW',"sw")
+filter_transform_CSV('20181003_Dataset_SV_TrackerID_9407_ColorCode_RRW-BuGY_Crane_Agnetha.csv','Agnetha-SW',"sw")
+filter_transform_CSV('20181003_Dataset_SV_TrackerID_9472_ColorCode_RRW-BuGR_Crane_Cajsa.csv','Cajsa-SW',"sw")
+#filter_transform_CSV('20191103_Dataset_DE_GPS_Crane_181528_iCora_Crane_15_BuBuBr-WYW_Lotta.csv','Lotta-GE',"ge")
+#filter_transform_CSV('20180928_Dataset_DE_GPS_Crane_181527_iCora_Crane_13_BuBuBr-YBuBk.csv','Nena-GE',"ge")
 
 # Create the Shapefile directory
 os.system('mkdir -p /home/geostack/Geostack/datasets/SHP')
@@ -6,38 +6,83 @@ from mongoengine import *
 from datetime import datetime
 # Pandas is used to create dataframe's and check the intergrity of the datasets.
 import pandas as pd
-# The tkinter module is used to create a GUI.
-import tkinter
-# The filedialog module is used to show a file selection GUI.
-from tkinter import filedialog
-# The gpxpy module is used to import GPX datasets
-import gpxpy
-
-# Here we create a new instance of a Tkinter GUI.
-GUI = tkinter.Tk()
-# This line makes sure the GUI is instantiated in the background.
-GUI.withdraw()
+# The json and os modules are used to read the manifest in the batch mode.
+import json
+import os
+# The argparse module is used to read the command line arguments.
+import argparse
+# Here we import the GpxReader Python file, which is used to import GPX
+# datasets.
+import GpxReader
+
+# The Tkinter GUI is only created when a file has to be selected by the user.
+# This way the script can also run without a display, for example in the batch
+# mode (see the bottom of this file).
+GUI = None
+
+# Here we create a function called: "ask_file".
+# The function shows a file selection GUI and returns the selected file.
+# The following parameters are passed to the GUI:
+# - parent = the instance of the Tkinter GUI
+# - mode = specifies if the file shoulde be loaded or selected.
+# - filetypes = specifies the extensions which are allowed to be selected,
+#               for example: only CSV files if the user chose CSV.
+# - title = the text displayed at the top of the GUI.
+def ask_file(file_type, extension, mode='r'):
+    global GUI
+
+    # The tkinter module is used to create a GUI and the filedialog module is
+    # used to show a file selection GUI.
+    import tkinter
+    from tkinter import filedialog
+
+    # Here we create a new instance of a Tkinter GUI, the first time a file
+    # is selected. GUI.withdraw() makes sure the GUI is instantiated in the
+    # background.
+    if GUI is None:
+        GUI = tkinter.Tk()
+        GUI.withdraw()
+
+    return filedialog.askopenfile(parent=GUI,mode=mode,
+                                  filetypes=[(file_type+' file','*.'+extension)],
+                                  title='Choose an '+file_type+' file')
+
+# Here we create a function called: "read_dataset".
+# The function reads a CSV, JSON or GPX dataset into a dataframe. The dataset
+# can be the location of a file or an opened file. The times of GPX datasets
+# are converted to the amount of milliseconds since 1970-01-01, which is the
+# same format as the GPS-Route JSON datasets.
+def read_dataset(dataset, format):
+
+    if format == 'csv':
+        return pd.read_csv(dataset)
+
+    elif format == 'json':
+        return pd.read_json(dataset)
+
+    elif format == 'gpx':
+        # Here we use the GpxReader to read the trackpoints of all tracks and
+        # segments in the GPX file at once into a dataframe.
+        df = GpxReader.read_gpx(dataset)
+        df['time'] = GpxReader.time_in_milliseconds(df)
+        return df
+
+    raise ValueError("Unknown file format: " + str(format))
 
 # Here we create a function called: "csv_import"
 def csv_import():
 
-    # Here we add the code logic required to open the selection GUI.
-    # The following parameters are passed in this code:
-    # - parent = the instance of the Tkinter GUI
-    # - mode = specifies if the file shoulde be loaded or selected.
-    # - filetypes = specifies the extensions which are allowed to be selected
-    #               since the user chose CSV, we are only allowing CSV.
-    # - title = the text displayed at the top of the GUI.
-    input_file = filedialog.askopenfile(
-    parent=GUI,mode='r',filetypes=[('CSV file','*.csv')],title='Choose an CSV file')
+    # Here we show the file selection GUI, in which only CSV files can be
+    # selected.
+    input_file = ask_file('CSV','csv')
 
     # Here we check if the selected file is not equal to None.
     # If this is the case the following code is executed.
     if input_file != None:
 
-        # Here we read the JSON file using pandas. We assign the dataframe
+        # Here we read the CSV file using pandas. We assign the dataframe
         # to a variable called: "df".
-        df = pd.read_csv(input_file)
+        df = read_dataset(input_file,'csv')
 
         # Here we call the function:"transform_data" in which we pass the
         # dataframe as parameter.
@@ -46,10 +91,9 @@ def csv_import():
 # Here we create a function called: "json_import"
 def json_import():
 
-    # Here we add the code logic required to open the selection GUI.
-    # Here we pass JSON as the filetypes parameter.
-    input_file = filedialog.askopenfile(
-    parent=GUI,mode='r',filetypes=[('JSON file','*.json')],title='Choose an JSON file')
+    # Here we show the file selection GUI, in which only JSON files can be
+    # selected.
+    input_file = ask_file('JSON','json')
 
     # Here we check if the selected file is not equal to None.
     # If this is the case the following code is executed.
@@ -57,57 +101,27 @@ def json_import():
 
         # Here we read the JSON file using pandas. We assign the dataframe
         # to a variable called: "df".
-        df = pd.read_json(input_file)
+        df = read_dataset(input_file,'json')
 
         # Here we call the function:"transform_data" in which we pass the
         # dataframe as parameter.
         transform_data(df)
 
-# Here we create a function called: "create_dataframe".
-# The function takes raw GPX data as input.
-def create_dataframe(data):
-
-    # Here we create a new dataframe with the input columns
-    # as columns.
-    df = pd.DataFrame(columns=['lon', 'lat', 'alt', 'time'])
-
-    # Here we loop through all the points in the list of data
-    # which was passed as parameter in this function.
-    for point in data:
-        # We append the lon,lat,alt and time values to the
-        # correct columns in the dataframe which was created earlier.
-        df = df.append({'lon': point.longitude,
-                        'lat' : point.latitude,
-                        'alt' : point.elevation,
-                        # Here we convert the datetime to a timestamp.
-                        # This is required since we want to remove the timezone
-                        # info from the timestamp.
-                        'time' : datetime.timestamp(point.time)}, ignore_index=True)
-
-    # Here we return the DataFrame
-    return df
-
 # Here we create a function called:"gpx_import".
 def gpx_import():
 
-    # Here we add the code logic required to open the selection GUI.
-    # Here we pass GPX as the filetypes parameter.
-    input_file = filedialog.askopenfile(
-    parent=GUI,mode='r',filetypes=[('GPX file','*.gpx')],title='Choose an GPX file')
+    # Here we show the file selection GUI, in which only GPX files can be
+    # selected. The GPX file is opened in binary mode.
+    input_file = ask_file('GPX','gpx','rb')
 
-    # Here we use GPXPY to parse the RAW GPX data.
-    # We pass the input_file as parameter.
-    parsed_file = gpxpy.parse(input_file)
-
-    # Here we obtain the datapoints of the GPX dataset and assing it to a
-    # variable called: "data".
-    data = parsed_file.tracks[0].segments[0].points
+    # Here we check if the selected file is not equal to None.
+    if input_file != None:
 
-    # Here we pass the data to the function:"create_dataframe".
-    df = create_dataframe(data)
+        # Here we read the GPX file into a dataframe.
+        df = read_dataset(input_file,'gpx')
 
-    # Here we pass the newly created dataframe to the transform_data function.
-    transform_data(df)
+        # Here we pass the newly created dataframe to the transform_data function.
+        transform_data(df)
 
 # Here we create a function called: "check_dataframe".
 # The function takes a Pandas dataframe as input.
@@ -233,10 +247,9 @@ def transform_data(df):
             transform_data(df)
     # If the dataframe is Invalid the following code will be executed.
     else:
-        #Print that the dataframe is Invalid.
+        #Print that the dataframe is Invalid. The user can select another
+        # dataset in the import tool.
         print("Invalid dataframe, please check if the dataset is valid!")
-        # Rerun the function.
-        transform_data(df)
 
 # Below we create the main function. This function is triggered when the Python
 # script is called.
@@ -294,14 +307,79 @@ def import_tool():
 # Here we import the CraneModel Python file.
 import CraneModel
 
-def load_crane_data(df,columns,dbname):
+# Here we import the LevelOfDetail Python file, which is used to create the
+# simplified copies of a track for the map viewers.
+import LevelOfDetail
+
+# Here we import the DatabaseIndexes Python file, which defines the indexes
+# of the Crane and Trail databases.
+import DatabaseIndexes
+
+# Here we import the BucketStorage Python file, which is used to store the
+# transmissions and signals in buckets.
+import BucketStorage
+
+# Here we import the BulkLoader Python file, which is used to insert the
+# transmissions and signals in chunks.
+import BulkLoader
+
+# Here we import the MotionMetrics Python file, which is used to calculate the
+# distance, heading and speed of every transmission and signal.
+import MotionMetrics
+
+# Here we import the TrackSummary Python file, which is used to calculate the
+# bounding box, envelope and altitude range of a track.
+import TrackSummary
+
+# Here we import the DatasetVersion Python file, which is used to tell the
+# Flask-API that the data has changed.
+import DatasetVersion
+
+# The layout in which the transmissions and signals are stored. Use
+# "documents" to store every transmission or signal as a separate document, or
+# "buckets" to store them in one document per day (Crane) or hour (Trail).
+# Note: the Flask-API settings CRANE_STORAGE_LAYOUT and TRAIL_STORAGE_LAYOUT
+# must have the same value.
+STORAGE_LAYOUT = "documents"
+
+# The name of the database to which MongoEngine is connected.
+CONNECTED_DATABASE = None
+
+# Here we create a function called: "use_database".
+# The function connects MongoEngine to the database passed as parameter. The
+# connection is reused when the same database is used again, and closed when
+# another database is used.
+def use_database(dbname):
+    global CONNECTED_DATABASE
+
+    if CONNECTED_DATABASE == str(dbname):
+        return
+
+    if CONNECTED_DATABASE is not None:
+        disconnect()
+
+    connect(str(dbname))
+    CONNECTED_DATABASE = str(dbname)
+
+# The function: "load_crane_data" expects the following parameters:
+# 1) The dataframe containing the dataset
+# 2) The list of selected columns (latitude, longitude, altitude, timestamp)
+# 3) The name of the database
+# 4) The name of the Crane. If no name is passed, the user is asked for it.
+# 5) Whether the indexes have to be updated after the import. The batch mode
+#    updates the indexes once, after all the datasets are imported.
+def load_crane_data(df,columns,dbname,name=None,update_indexes=True):
 
     # Ask the user what the name of the Crane has to be.
-    name = input('What is the name of the item you want to import?\n')
+    if name is None:
+        name = input('What is the name of the item you want to import?\n')
 
     # Here we connect to the database that is passed as parameter (dbname)
     # when the function: "load_crane_data" is triggered.
-    connect(str(dbname))
+    use_database(dbname)
+
+    # The unique indexes have to exist before the transmissions are inserted.
+    DatabaseIndexes.prepare_indexes(DatabaseIndexes.CRANE_INDEXES)
 
     # Create metadata for the tracker.
     # We use the value at the 3rd index of the list of columns which was passed
@@ -324,70 +402,103 @@ def load_crane_data(df,columns,dbname):
               name = name,
               transmission_Count = transmission_Count).save()
 
-    # Create an empty list of transmissions to which will append the new
-    # transmissions after they have been created. This list will be passed to
-    # the mongodb bulk insert feature.
-    transmissions = []
-
-    # Print when list appending process starts.
-    print('Start appending transmissions to list from: ' + str(name) )
-
-    # For each row in the dataframe the following code is executed.
-    for index,row in df.iterrows():
-        # Here we create geometry document.
-        # We use the value at the 1st index of the list of columns which was passed
-        # as parameter in this function. This index contains the value of the column
-        # representing the longitude (which was defined by the user input in the
-        # function:"selected_columns()"). We do the same for the latitude column
-        # name at index 0 of the Selected columns list and the altitude column
-        # name at index 2 of the selected columns list.
-        geometry = CraneModel.Geometry(coord = [row[columns[1]],row[columns[0]]],
-                            alt = row[columns[2]])
-
-        # Here we create the metadata document in which we pass te required values.
-        metadata = CraneModel.TransmissionMetadata(visible = row['visible'],
-                           sensor_type = row['sensor-type'],
-                           tag_voltage = row['tag-voltage'])
-
-        # Here we create speed document in which we pass te required values.
-        speed = CraneModel.Speed(ground_speed = row['ground-speed'])
-
-        # Here we create a transmission document and append it to the
-        # transmissions list. We use the value at the 3rd index of the column
-        # list, passed in this function, as column name for the timestamp
-        # column in the dataframe.
-        transmissions.append(CraneModel.Transmission(event_id = row['event-id'],
-                                          timestamp = row[columns[3]],
-                                          geometry = geometry,
-                                          speed = speed,
-                                          metadata = metadata,
-                                          tracker = tracker))
-
-    # Print when list appending is done.
-    print('Bulk inserting: '+str(transmission_Count)+' transmissions from: '+str(name))
-
-    # Bulk insert, the populated transmissions list, in the database.
-    CraneModel.Transmission.objects.insert(transmissions,load_bulk=True)
+    # Here we check in which layout the transmissions have to be stored.
+    if STORAGE_LAYOUT == "buckets":
+
+        # Skip the transmissions of which the event id is already in a
+        # bucket, or which occur earlier in the dataset.
+        df = df[~BulkLoader.duplicate_rows(CraneModel.TransmissionBucket._get_collection(),
+                                           'event_id', df['event-id'])].reset_index(drop=True)
+
+        if df.empty:
+            tracker.delete()
+            print("The transmissions of: " + str(name) + " are already in the database")
+            return
+
+        transmission_Count = len(df.index)
+        tracker.update(transmission_Count = transmission_Count)
+
+        # Store the transmissions of the tracker in one document per day.
+        # We pass the columns selected by the user and the remaining columns
+        # of the Crane dataset.
+        BucketStorage.create_transmission_buckets(tracker,
+                                                  df['event-id'],
+                                                  df[columns[3]],
+                                                  df[columns[1]],
+                                                  df[columns[0]],
+                                                  df[columns[2]],
+                                                  df['ground-speed'],
+                                                  df['visible'],
+                                                  df['sensor-type'],
+                                                  df['tag-voltage'])
+    else:
+        # Print when the bulk insert starts.
+        print('Bulk inserting: '+str(transmission_Count)+' transmissions from: '+str(name))
+
+        # Calculate the distance, heading and speed of every transmission.
+        motion = MotionMetrics.compute_metrics(df[columns[1]],
+                                               df[columns[0]],
+                                               df[columns[3]])
+
+        # Store every transmission as a separate document. The BulkLoader
+        # converts the columns to the correct types at once and inserts the
+        # transmissions in chunks.
+        inserted = BulkLoader.insert_transmissions(tracker,
+                                        df['event-id'],
+                                        df[columns[3]],
+                                        df[columns[1]],
+                                        df[columns[0]],
+                                        df[columns[2]],
+                                        df['ground-speed'],
+                                        df['visible'],
+                                        df['sensor-type'],
+                                        df['tag-voltage'],
+                                        motion)
+
+        # Transmissions of which the event id is already in the database are
+        # skipped, so a dataset which was imported before doesn't create a
+        # second tracker without transmissions.
+        if inserted == 0:
+            tracker.delete()
+            print("The transmissions of: " + str(name) + " are already in the database")
+            return
+
+        # Store the amount of transmissions which were inserted and the total
+        # distance and speeds of the track on the tracker.
+        totals = MotionMetrics.update_totals(MotionMetrics.new_totals(), motion)
+        tracker.update(transmission_Count = inserted,
+                       **MotionMetrics.rollup_fields(totals))
+        transmission_Count = inserted
 
     # Print if the insert process is succesfull.
-    print("Done inserting "+ str(len(df.index)) + " transmissions")
-
-    # Print that the indexing process has started.
-    print("Creating indexes on database ")
-
-    # Create and index on the tracker field in the Transmissions documents.
-    CraneModel.Transmission.create_index(("tracker"))
-
-    # Create and index on the timestamp field in the Transmissions documents.
-    CraneModel.Transmission.create_index(("timestamp"))
-
-    # Create and index on the coordinates field in the Transmissions documents.
-    CraneModel.Transmission.create_index(("geometry.coord"))
+    print("Done inserting "+ str(transmission_Count) + " transmissions")
+
+    # Store the bounding box, envelope and altitude range of the track on the
+    # tracker.
+    extent = TrackSummary.update_extent(TrackSummary.new_extent(),
+                                        df[columns[1]],
+                                        df[columns[0]],
+                                        df[columns[2]])
+    tracker.update(**TrackSummary.summary_fields(extent))
+
+    # Create the simplified copies of the track. We pass the longitude,
+    # latitude, altitude and timestamp columns selected by the user.
+    LevelOfDetail.create_transmission_levels(tracker,
+                                             df[columns[1]],
+                                             df[columns[0]],
+                                             df[columns[2]],
+                                             pd.to_datetime(df[columns[3]]).dt.to_pydatetime())
+
+    # Create the indexes defined in the DatabaseIndexes Python file and drop
+    # the indexes which are no longer used.
+    if update_indexes:
+        DatabaseIndexes.update_indexes(DatabaseIndexes.CRANE_INDEXES)
+
+    # The cached results of the Flask-API are no longer valid.
+    DatasetVersion.bump_version()
 
     print("Done importing the dataset!")
 
-    import_tool()
-
 
 # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
 #                                                                             #
@@ -397,20 +508,30 @@ def load_crane_data(df,columns,dbname):
 # Here we import the TrailModel Python file.
 import TrailModel
 
-def load_trail_data(df,columns,dbname):
+# The function: "load_trail_data" expects the same parameters as the function:
+# "load_crane_data", and the abbreviation and the type of the Route. The user
+# is asked for the values which are not passed.
+def load_trail_data(df,columns,dbname,name=None,abreviation=None,type=None,
+                    update_indexes=True):
 
     # Here we ask the user what the name of the Route should be.
-    name = input('What is the name of the item you want to import?\n')
+    if name is None:
+        name = input('What is the name of the item you want to import?\n')
 
     # Here we ask the user what the abreviation of the Route should be.
-    abreviation = input('What do you want the abbreviation to be?\n')
+    if abreviation is None:
+        abreviation = input('What do you want the abbreviation to be?\n')
 
     # Here we ask the user what the type of the Route should be.
-    type = input('What type of route is it (e.g. Hike, Bike, Car)?\n')
+    if type is None:
+        type = input('What type of route is it (e.g. Hike, Bike, Car)?\n')
 
     # Here we connect to the database which was passed as input in this
     # function.
-    connect(str(dbname))
+    use_database(dbname)
+
+    # The unique indexes have to exist before the signals are inserted.
+    DatabaseIndexes.prepare_indexes(DatabaseIndexes.TRAIL_INDEXES)
 
     # Below we create metadata for the Route.
 
@@ -443,58 +564,247 @@ def load_trail_data(df,columns,dbname):
                   r_type = type,
                   t_points = t_points).save()
 
-    # Create an empty list of signals to which we will append all the signal
-    # documents after they have been created. We will pass the list to the
-    # mongodb bulk insert feature.
-    signals = []
-
-    # Here we itterate through all the rows in the dataframe.
-    # For each row in the dataframe the following code is executed.
-    for index,row in df.iterrows():
-
-        # Convert the datetime to a valid format by removing the timezone info.
-        # We use the value at the 3rd index of the list of columns which was
-        # passed as parameter in this function.
-        time = datetime.fromtimestamp(row[columns[3]]/1000)
-
-        # Here we create the geometry document.
-        # We use the value at the 1st index of the list of columns which was passed
-        # as parameter in this function. This index contains the value of the column
-        # representing the longitude (which was defined by the user input in the
-        # function:"selected_columns()"). We do the same for the latitude column
-        # name at index 0 of the Selected columns list and the altitude column
-        # name at index 2 of the selected columns list.
-        geometry = TrailModel.Geometry(coord = [row[columns[1]],row[columns[0]]],
-                            alt = row[columns[2]])
-
-        # Here we create a signal document in which we pass the required values.
-        signal = TrailModel.Signal(time = time,
-                        geometry = geometry,
-                        trail = trail)
-
-        # Here we append the created document to the signals list.
-        signals.append(signal)
-
-    # Bulk insert, the populated signals list, in the database.
-    TrailModel.Signal.objects.insert(signals,load_bulk=True)
+    # Convert the times to a valid format by removing the timezone info.
+    # We use the value at the 3rd index of the list of columns which was
+    # passed as parameter in this function.
+    times = BulkLoader.milliseconds_to_datetimes(df[columns[3]])
+
+    # Here we check in which layout the signals have to be stored.
+    if STORAGE_LAYOUT == "buckets":
+
+        # Store the signals of the trail in one document per hour.
+        BucketStorage.create_signal_buckets(trail,
+                                            times,
+                                            df[columns[1]],
+                                            df[columns[0]],
+                                            df[columns[2]])
+    else:
+        # Calculate the distance, heading and speed of every signal.
+        motion = MotionMetrics.compute_metrics(df[columns[1]],
+                                               df[columns[0]],
+                                               times)
+
+        # Store every signal as a separate document. The BulkLoader converts
+        # the columns to the correct types at once and inserts the signals in
+        # chunks.
+        BulkLoader.insert_signals(trail,
+                                  times,
+                                  df[columns[1]],
+                                  df[columns[0]],
+                                  df[columns[2]],
+                                  motion)
+
+        # Store the total distance and speeds of the route on the trail.
+        totals = MotionMetrics.update_totals(MotionMetrics.new_totals(), motion)
+        trail.update(**MotionMetrics.rollup_fields(totals))
 
     # Print if the insert process is succesfull.
     print("Inserted " + str(len(df.index))+" trackpoints from dataset: " + str(name))
 
-    # Print when starting the indexing process.
-    print("Creating indexes on database ")
+    # Store the bounding box, envelope and altitude range of the route on the
+    # trail.
+    extent = TrackSummary.update_extent(TrackSummary.new_extent(),
+                                        df[columns[1]],
+                                        df[columns[0]],
+                                        df[columns[2]])
+    trail.update(**TrackSummary.summary_fields(extent))
+
+    # Create the simplified copies of the track.
+    LevelOfDetail.create_signal_levels(trail,
+                                       df[columns[1]],
+                                       df[columns[0]],
+                                       df[columns[2]],
+                                       times)
+
+    # Create the indexes defined in the DatabaseIndexes Python file and drop
+    # the indexes which are no longer used.
+    if update_indexes:
+        DatabaseIndexes.update_indexes(DatabaseIndexes.TRAIL_INDEXES)
+
+    # The cached results of the Flask-API are no longer valid.
+    DatasetVersion.bump_version()
+
+    print("Done importing the dataset!")
+
 
-    # Create and index on the trail field in the Signal documents.
-    TrailModel.Signal.create_index(("trail"))
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+#                                                                             #
+#                  IMPORTING DATASETS WITHOUT USER INPUT                      #
+#                                                                             #
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+# Besides the interactive import tool, this script has a batch mode which can
+# run without a display or user input (for example in a cron job or a Docker
+# container). The datasets are listed in a manifest, which is a JSON file (or a
+# YAML file, if PyYAML is installed) with the following structure:
+#
+# {
+#     "database": "Crane_Database",
+#     "datasets": [
+#         {"file": "~/datasets/Agnetha.csv",
+#          "type": "crane",
+#          "name": "Agnetha"},
+#         {"file": "~/datasets/Hamert.gpx",
+#          "type": "trail",
+#          "database": "Trail_Database",
+#          "name": "Hamert Hike",
+#          "abbreviation": "HH",
+#          "route_type": "Hike",
+#          "columns": {"lat": "lat", "lon": "lon", "alt": "alt", "time": "time"}}
+#     ]
+# }
+#
+# The "format" of a dataset is taken from the extension of the file if it is
+# not in the manifest. The "columns" are detected using the names of the
+# columns if they are not in the manifest. The "database" of a dataset
+# overrides the "database" at the top of the manifest.
+#
+# The batch mode is started with: python3 mongo-data-import.py --manifest <file>
+
+# The names which are used to detect the latitude, longitude, altitude and
+# time columns, in order of preference.
+COLUMN_NAMES = {
+    "lat": ['lat', 'latitude', 'location-lat', 'y'],
+    "lon": ['lon', 'lng', 'long', 'longitude', 'location-long', 'x'],
+    "alt": ['alt', 'altitude', 'ele', 'elevation', 'height-above-msl',
+            'height-above-ellipsoid', 'height'],
+    "time": ['time', 'timestamp', 'datetime', 'date', 'dtg'],
+}
+
+# Here we create a function called: "normalize_column".
+# The function makes the name of a column lowercase and replaces spaces and
+# underscores by dashes, so "Location_Lat" and "location-lat" are the same.
+def normalize_column(column):
+    return str(column).strip().lower().replace('_', '-').replace(' ', '-')
+
+# Here we create a function called: "detect_columns".
+# The function returns the list of columns (latitude, longitude, altitude,
+# timestamp), in the same order as the function: "column_selection". A column
+# which is passed in the "mapping" is used as is. The other columns are
+# detected by comparing the names of the columns with COLUMN_NAMES. First the
+# exact names are compared, after that the names which end with one of the
+# COLUMN_NAMES (Ex.: "gps-latitude").
+def detect_columns(df, mapping=None):
+
+    mapping = mapping or {}
+    normalized = {normalize_column(column): column for column in df.columns}
+    columns = []
+
+    for key in ['lat', 'lon', 'alt', 'time']:
+
+        if key in mapping:
+            columns.append(mapping[key])
+            continue
+
+        candidates = COLUMN_NAMES[key]
+        found = next((normalized[name] for name in candidates
+                      if name in normalized), None)
+
+        if found is None:
+            found = next((column for name in candidates
+                          for normal, column in normalized.items()
+                          if normal.endswith('-' + name)), None)
+
+        if found is None:
+            raise ValueError("Could not detect the " + key + " column, please "
+                             "add it to the columns of the dataset in the manifest")
+
+        columns.append(found)
+
+    return columns
+
+# Here we create a function called: "read_manifest".
+# The function reads a JSON or YAML manifest and returns it as a dictionary.
+def read_manifest(location):
+
+    with open(os.path.expanduser(location), 'r') as manifest_file:
+
+        if location.endswith(('.yml', '.yaml')):
+            # PyYAML is only required when a YAML manifest is used.
+            import yaml
+            return yaml.safe_load(manifest_file)
+
+        return json.load(manifest_file)
+
+# Here we create a function called: "import_manifest".
+# The function imports all the datasets in a manifest. The datasets are
+# grouped per database, so the connection to a database is created once and
+# the indexes of a database are updated once, after all its datasets are
+# imported. A dataset which can't be imported is reported and skipped, so the
+# other datasets are still imported.
+def import_manifest(location):
+
+    manifest = read_manifest(location)
+
+    # Group the datasets per database, in the order of the manifest.
+    databases = {}
+    for dataset in manifest['datasets']:
+        dbname = dataset.get('database', manifest.get('database'))
+        databases.setdefault(dbname, []).append(dataset)
+
+    failed = []
+
+    for dbname, datasets in databases.items():
+
+        types = set()
+
+        for dataset in datasets:
+
+            file = os.path.expanduser(dataset['file'])
+            format = dataset.get('format', os.path.splitext(file)[1][1:]).lower()
+            type = dataset['type'].lower()
+            name = dataset.get('name', os.path.splitext(os.path.basename(file))[0])
+
+            print("--->> Importing: " + file + " in: " + str(dbname) + " <<---")
+
+            try:
+                df = read_dataset(file, format)
+                columns = detect_columns(df, dataset.get('columns'))
 
-    # Create and index on the time field in the Signal documents.
-    TrailModel.Signal.create_index(("time"))
+                if not check_dataframe(df) or not check_columns(df, columns):
+                    raise ValueError("The dataset or the columns are invalid")
 
-    # Create and index on the coordinates field in the Signal documents.
-    TrailModel.Signal.create_index(("geometry.coord"))
+                if type == 'crane':
+                    load_crane_data(df, columns, dbname, name,
+                                    update_indexes=False)
+                elif type == 'trail':
+                    load_trail_data(df, columns, dbname, name,
+                                    dataset.get('abbreviation', name[:2].upper()),
+                                    dataset.get('route_type', ''),
+                                    update_indexes=False)
+                else:
+                    raise ValueError("Unknown dataset type: " + type)
 
-    print("Done importing the dataset!")
+                types.add(type)
+
+            except Exception as error:
+                print("Could not import: " + file + " (" + str(error) + ")")
+                failed.append(file)
 
-    import_tool()
+        # Update the indexes of the database once.
+        if 'crane' in types:
+            DatabaseIndexes.update_indexes(DatabaseIndexes.CRANE_INDEXES)
+        if 'trail' in types:
+            DatabaseIndexes.update_indexes(DatabaseIndexes.TRAIL_INDEXES)
 
-import_tool()
+    print("Imported " + str(len(manifest['datasets']) - len(failed)) + " of "
+          + str(len(manifest['datasets'])) + " datasets")
+
+    return failed
+
+
+# When a manifest is passed on the command line, the datasets in the manifest
+# are imported. Otherwise the interactive import tool is started, which asks
+# for the next dataset after every import.
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description='Import datasets in MongoDB.')
+    parser.add_argument('--manifest',
+                        help='import the datasets in this JSON or YAML manifest')
+    arguments = parser.parse_args()
+
+    if arguments.manifest:
+        if import_manifest(arguments.manifest):
+            raise SystemExit(1)
+    else:
+        while True:
+            import_tool()
@@ -0,0 +1,258 @@
+# The pymongo module is used to read the coordinates of the transmissions and
+# to write the nearest port back to MongoDB.
+import pymongo
+from pymongo import UpdateOne
+
+# The ObjectId class is used to convert the MongoIDs, which are copied to
+# PostgreSQL as text, back to MongoIDs.
+from bson.objectid import ObjectId
+
+# Here we import the WorldPortIndexDatabase Python file, which is used to
+# connect to the World Port Index database in PostgreSQL.
+import WorldPortIndexDatabase
+
+# The math module is used to skip coordinates which are not a number.
+import math
+
+# The io module is used to create the tab separated text which is sent to
+# PostgreSQL by COPY, without writing a file to disk.
+import io
+
+# The time module is used to measure how long the join takes.
+import time
+
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+#                                                                             #
+#             FINDING THE NEAREST PORT OF EVERY CRANE TRANSMISSION            #
+#                                                                             #
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+# This script stores the nearest port of the World Port Index on every
+# transmission of the crane database. Instead of calculating the distance of
+# every transmission to every port in Python, the coordinates are sent to
+# PostGIS, which uses the GiST index of the ports to find the nearest ports:
+#
+# 1) The coordinates of a batch of transmissions are copied to a temporary
+#    table with COPY, which is a lot faster than an INSERT per row.
+# 2) A LATERAL join finds the nearest ports of every transmission with the
+#    KNN operator "<->", which walks the GiST index created by shp2pgsql.
+#    The "<->" operator compares distances in degrees, so the nearest
+#    KNN_CANDIDATES ports are compared again by their distance in meters.
+# 3) The id of the nearest port (the "gid" column of the wpi table) and the
+#    distance in meters are written back to MongoDB with one bulk_write().
+#
+# The World Port Index has to be imported first, see the file:
+# world-port-index-import.py. This script can be run again after new data is
+# imported, the nearest port of every transmission is overwritten.
+
+# The layout in which the transmissions are stored. Use "documents" if every
+# transmission is a separate document, or "buckets" if the transmissions of a
+# tracker are stored in one document per day.
+# Note: this must be the same value as STORAGE_LAYOUT in the file:
+# crane-datasets-import.py
+STORAGE_LAYOUT = "documents"
+
+# The amount of transmissions which are joined at once.
+JOIN_BATCH_SIZE = 200000
+
+# The amount of ports which are found with the "<->" operator, of which the
+# port with the shortest distance in meters is kept.
+KNN_CANDIDATES = 5
+
+# The temporary table which contains the coordinates of a batch. The "id" is
+# the MongoID of the transmission or bucket, the "index" is the position of
+# the transmission in a bucket (always 0 for the "documents" layout).
+CREATE_FIXES_TABLE = """
+    CREATE TEMPORARY TABLE fixes (id text, index integer,
+                                  lon double precision, lat double precision)
+"""
+
+# The spatial join. The point of the transmission is created once in the
+# LATERAL subquery, so the "<->" operator compares the ports with a constant
+# and PostgreSQL can use the index.
+NEAREST_PORT_QUERY = """
+    SELECT fixes.id, fixes.index, nearest.gid, nearest.distance
+    FROM fixes
+    CROSS JOIN LATERAL (
+        SELECT candidates.gid,
+               ST_Distance(candidates.geom::geography, candidates.point::geography) AS distance
+        FROM (
+            SELECT wpi.gid, wpi.geom, point.geom AS point
+            FROM (SELECT ST_SetSRID(ST_MakePoint(fixes.lon, fixes.lat), 4326) AS geom) AS point,
+                 wpi
+            ORDER BY wpi.geom <-> point.geom
+            LIMIT %s
+        ) AS candidates
+        ORDER BY distance
+        LIMIT 1
+    ) AS nearest
+"""
+
+# Here we create a function called: "copy_fixes".
+# The function copies the rows (id, index, lon, lat) of a batch to the
+# temporary table.
+def copy_fixes(cursor, rows):
+
+    text = io.StringIO()
+
+    for row in rows:
+        text.write('%s\t%d\t%r\t%r\n' % row)
+
+    text.seek(0)
+
+    cursor.execute("TRUNCATE fixes")
+    cursor.copy_from(text, 'fixes', columns=('id', 'index', 'lon', 'lat'))
+
+# Here we create a function called: "join_batch".
+# The function copies a batch to PostgreSQL and returns the nearest port of
+# every row as (id, index, port id, distance).
+def join_batch(cursor, rows):
+
+    copy_fixes(cursor, rows)
+
+    cursor.execute(NEAREST_PORT_QUERY, (KNN_CANDIDATES,))
+
+    return cursor.fetchall()
+
+# Here we create a function called: "valid_coordinates".
+# The function checks if a longitude and latitude are both finite numbers, so
+# no NaN or infinite points are copied to PostgreSQL.
+def valid_coordinates(lon, lat):
+    return (lon is not None and lat is not None and
+            math.isfinite(lon) and math.isfinite(lat))
+
+# Here we create a function called: "document_fixes".
+# The function returns the MongoID and coordinates of every transmission
+# document. Transmissions without (valid) coordinates are skipped.
+def document_fixes(db):
+
+    cursor = db.transmission.find({"geometry.coord": {"$ne": None}},
+                                  {"geometry.coord": 1}).batch_size(JOIN_BATCH_SIZE)
+
+    for document in cursor:
+        lon, lat = document["geometry"]["coord"]["coordinates"]
+        if valid_coordinates(lon, lat):
+            yield (str(document["_id"]), 0, lon, lat)
+
+# Here we create a function called: "bucket_fixes".
+# The function returns the MongoID of the bucket, the position in the bucket
+# and the coordinates of every transmission in the buckets. Transmissions
+# without (valid) coordinates are skipped.
+def bucket_fixes(db):
+
+    cursor = db.transmission_bucket.find({}, {"coords": 1}).batch_size(1000)
+
+    for bucket in cursor:
+        for index, coord in enumerate(bucket["coords"]):
+            if coord and valid_coordinates(coord[0], coord[1]):
+                yield (str(bucket["_id"]), index, coord[0], coord[1])
+
+# Here we create a function called: "document_updates".
+# The function returns the updates which store the nearest port on the
+# transmission documents.
+def document_updates(db, results):
+
+    return [UpdateOne({"_id": ObjectId(id)},
+                      {"$set": {"nearest_port": {"id": gid, "distance": distance}}})
+            for id, index, gid, distance in results]
+
+# Here we create a function called: "bucket_updates".
+# The function returns the updates which store the nearest port of every
+# transmission in a bucket, as two lists next to the other lists of the
+# bucket. Transmissions without coordinates get the value None.
+def bucket_updates(db, results):
+
+    ports = {}
+
+    for id, index, gid, distance in results:
+        ports.setdefault(id, []).append((index, gid, distance))
+
+    # The amount of transmissions in each of the buckets.
+    counts = {str(bucket["_id"]): bucket["count"] for bucket in
+              db.transmission_bucket.find({"_id": {"$in": [ObjectId(id) for id in ports]}},
+                                          {"count": 1})}
+
+    updates = []
+
+    for id, values in ports.items():
+        count = counts[id]
+
+        port_id = [None] * count
+        port_distance = [None] * count
+
+        for index, gid, distance in values:
+            port_id[index] = gid
+            port_distance[index] = distance
+
+        updates.append(UpdateOne({"_id": ObjectId(id)},
+                                 {"$set": {"port_id": port_id,
+                                           "port_distance": port_distance}}))
+
+    return updates
+
+# Here we create a function called: "batches".
+# The function groups the rows in lists of JOIN_BATCH_SIZE rows. For the
+# "buckets" layout a batch always contains complete buckets, since the lists
+# of a bucket are written at once.
+def batches(rows):
+
+    batch = []
+
+    for row in rows:
+
+        if len(batch) >= JOIN_BATCH_SIZE and row[0] != batch[-1][0]:
+            yield batch
+            batch = []
+
+        batch.append(row)
+
+    if batch:
+        yield batch
+
+# Here we create a function called: "join_nearest_ports".
+# The function stores the nearest port of every transmission and returns the
+# amount of transmissions which were joined.
+def join_nearest_ports(db, conn):
+
+    if STORAGE_LAYOUT == "buckets":
+        rows, create_updates, collection = bucket_fixes(db), bucket_updates, db.transmission_bucket
+    else:
+        rows, create_updates, collection = document_fixes(db), document_updates, db.transmission
+
+    cursor = conn.cursor()
+    cursor.execute(CREATE_FIXES_TABLE)
+
+    total = 0
+
+    for batch in batches(rows):
+
+        results = join_batch(cursor, batch)
+
+        updates = create_updates(db, results)
+        if updates:
+            collection.bulk_write(updates, ordered=False)
+
+        total += len(results)
+        print("Joined " + str(total) + " transmissions with the nearest port")
+
+    cursor.close()
+
+    return total
+
+if __name__ == '__main__':
+
+    print("Starting the nearest port join of the Crane transmissions")
+
+    start = time.perf_counter()
+
+    client = pymongo.MongoClient('localhost', 27017)
+    conn = WorldPortIndexDatabase.connect_wpi()
+
+    try:
+        total = join_nearest_ports(client['Crane_Database'], conn)
+    finally:
+        conn.close()
+
+    seconds = time.perf_counter() - start
+
+    print("Finished the join of " + str(total) + " transmissions in "
+          + str(round(seconds, 1)) + " seconds")
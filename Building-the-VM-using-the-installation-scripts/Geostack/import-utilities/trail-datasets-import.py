@@ -5,6 +5,82 @@ import pandas as pd
 # Here we import the TrailModel Python file.
 import TrailModel
 
+# Here we import the LevelOfDetail Python file, which is used to create the
+# simplified copies of a track.
+import LevelOfDetail
+
+# Here we import the DatabaseIndexes Python file, which defines the indexes
+# of the Trail database.
+import DatabaseIndexes
+
+# Here we import the BucketStorage Python file, which is used to store the
+# signals in buckets.
+import BucketStorage
+
+# Here we import the BulkLoader Python file, which is used to insert the
+# signals in chunks.
+import BulkLoader
+
+# Here we import the ChunkedReader Python file, which is used to read large
+# datasets in chunks.
+import ChunkedReader
+
+# Here we import the ParallelImport Python file, which is used to import
+# multiple datasets at the same time.
+import ParallelImport
+
+# Here we import the ParquetStorage Python file, which is used to read the
+# converted datasets.
+import ParquetStorage
+
+# Here we import the MotionMetrics Python file, which is used to calculate the
+# distance, heading and speed of every signal.
+import MotionMetrics
+
+# Here we import the TrackSummary Python file, which is used to calculate the
+# bounding box, envelope and altitude range of a track.
+import TrackSummary
+
+# Here we import the DatasetVersion Python file, which is used to tell the
+# Flask-API that the data has changed.
+import DatasetVersion
+
+# The layout in which the signals are stored. Use "documents" to store every
+# signal as a separate document, or "buckets" to store the signals of a trail
+# in one document per hour.
+# Note: the Flask-API setting TRAIL_STORAGE_LAYOUT must have the same value.
+STORAGE_LAYOUT = "documents"
+
+# The way the datasets are read. Use "memory" to read a dataset at once, or
+# "chunked" to read and insert it in chunks of rows. The chunked mode is used
+# for large datasets which do not fit in memory.
+INGEST_MODE = "memory"
+
+# The amount of datasets which are imported at the same time. Every dataset is
+# imported in a separate worker process, so this should not be higher than the
+# amount of CPU cores.
+IMPORT_WORKERS = 4
+
+# Set to True to add only the new signals of a dataset to a trail that is
+# already in the database, instead of creating a new trail.
+INCREMENTAL_IMPORT = False
+
+# The format of the converted datasets, which are created by the
+# dataset-convert Python file. Use "parquet" or "json".
+# Note: the OUTPUT_FORMAT setting in dataset-convert must have the same value.
+DATASET_FORMAT = "parquet"
+
+# The folders containing the converted datasets of each format.
+DATASET_FOLDERS = {
+    "parquet": '~/Geostack/datasets/Parquet/Trail_Parquet/',
+    "json": '~/Geostack/datasets/JSON/Trail_JSON/',
+}
+
+# The columns which are read from a Parquet dataset. The number of the track
+# and segment of a signal are used to start the motion metrics again at every
+# track and segment of the GPX file.
+DATASET_COLUMNS = ['lon', 'lat', 'alt', 'time', 'track', 'segment']
+
 
 # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
 #                                                                             #
@@ -28,24 +104,235 @@ def load_data(df,name,abreviation,type):
                   t_points = t_points)
     trail.save()
 
-    signals = []
+    times = BulkLoader.milliseconds_to_datetimes(df['time'])
+
+    # Calculate the motion metrics of the whole track at once. The metrics
+    # start again at every track and segment of the GPX file.
+    motion = MotionMetrics.compute_metrics(df['lon'], df['lat'], times,
+                                           part=MotionMetrics.part_numbers(df.get('track'),
+                                                                           df.get('segment')))
+
+    t_points = insert_signals(trail, df, times, motion)
+
+    # Store the amount of signals which were inserted and the totals of the
+    # route on the trail.
+    totals = MotionMetrics.update_totals(MotionMetrics.new_totals(), motion)
+    trail.update(t_points = t_points, **MotionMetrics.rollup_fields(totals))
+
+    print("Inserted " + str(t_points)+" trackpoints from dataset: " + str(name))
+
+    # Store the extent of the route on the trail.
+    extent = TrackSummary.update_extent(TrackSummary.new_extent(),
+                                        df['lon'], df['lat'], df['alt'])
+    trail.update(**TrackSummary.summary_fields(extent))
+
+    LevelOfDetail.create_signal_levels(trail,
+                                       df['lon'],
+                                       df['lat'],
+                                       df['alt'],
+                                       times)
+
+    return t_points
+
+
+# Here we create a function called: "insert_signals".
+# The function inserts the signals of a dataframe (a complete dataset or a
+# chunk of a dataset) in the layout defined by STORAGE_LAYOUT, and returns the
+# amount of signals which were inserted. The sequence number of the first
+# signal of the dataframe is passed as "first_seq". The motion metrics and
+# sequence numbers are not stored in the bucket layout.
+def insert_signals(trail, df, times, motion=None, first_seq=0):
+
+    if STORAGE_LAYOUT == "buckets":
+
+        BucketStorage.create_signal_buckets(trail,
+                                            times,
+                                            df['lon'],
+                                            df['lat'],
+                                            df['alt'])
+
+        return len(df.index)
+    else:
+        return BulkLoader.insert_signals(trail,
+                                  times,
+                                  df['lon'],
+                                  df['lat'],
+                                  df['alt'],
+                                  motion,
+                                  first_seq)
+
+
+# Here we create a function called: "load_data_chunked".
+# The function imports a dataset chunk by chunk, so only one chunk is in
+# memory at a time. The trail is created before the first chunk, and its start
+# date, end date and amount of trackpoints are updated after every chunk.
+# The levels of detail are created from the reduced chunks at the end.
+def load_data_chunked(location,name,abreviation,type):
+
+    trail = TrailModel.Trail(name = name,
+                  abr = abreviation,
+                  r_type = type,
+                  t_points = 0)
+    trail.save()
+
+    summary = ChunkedReader.new_summary()
+    reduced_chunks = []
+
+    # The last signal of the previous chunk, the totals of the motion metrics
+    # and the extent of the route.
+    previous = None
+    totals = MotionMetrics.new_totals()
+    extent = TrackSummary.new_extent()
 
-    for index,row in df.iterrows():
+    # The sequence number of the first signal of the next chunk.
+    first_seq = 0
 
-        time = datetime.fromtimestamp(row['time']/1000)
+    for number, df in enumerate(ChunkedReader.read_chunks(location, DATASET_COLUMNS)):
 
-        geometry = TrailModel.Geometry(coord = [row['lon'],row['lat']],
-                            alt = row['alt'])
+        times = BulkLoader.milliseconds_to_datetimes(df['time'])
+        ChunkedReader.update_summary(summary, pd.to_datetime(pd.Series(times)))
 
-        singal = TrailModel.Signal(time = time,
-                        geometry = geometry,
-                        trail = trail)
+        part = MotionMetrics.part_numbers(df.get('track'), df.get('segment'))
+        motion = MotionMetrics.compute_metrics(df['lon'], df['lat'], times, previous, part)
+        previous = MotionMetrics.next_state(df['lon'], df['lat'], times, motion, previous, part)
+        MotionMetrics.update_totals(totals, motion)
+        TrackSummary.update_extent(extent, df['lon'], df['lat'], df['alt'])
 
-        signals.append(singal)
+        insert_signals(trail, df, times, motion, first_seq)
+        first_seq += len(df.index)
 
-    TrailModel.Signal.objects.insert(signals,load_bulk=True)
+        trail.update(s_date = summary["start"],
+                     e_date = summary["end"],
+                     t_points = summary["count"],
+                     **MotionMetrics.rollup_fields(totals),
+                     **TrackSummary.summary_fields(extent))
 
-    print("Inserted " + str(len(df.index))+" trackpoints from dataset: " + str(name))
+        reduced_chunks.append(LevelOfDetail.reduce_chunk(df['lon'],
+                                                         df['lat'],
+                                                         df['alt'],
+                                                         times))
+
+        ChunkedReader.print_progress(name, number, len(df.index), summary)
+
+    print("Inserted " + str(summary["count"])+" trackpoints from dataset: " + str(name))
+
+    LevelOfDetail.create_signal_levels(trail,
+                                       *LevelOfDetail.combine_chunks(reduced_chunks))
+
+    return summary["count"]
+
+
+# Here we create a function called: "append_data".
+# The function adds the signals of a dataset which are newer than the end date
+# of the trail. The dataset is read in chunks. The end date and the amount of
+# trackpoints of the trail are updated in place, and the levels of detail are
+# recreated from the stored most detailed level and the new signals.
+def append_data(trail,location,name):
+
+    # Only signals after this date are added.
+    cutoff = trail.e_date
+    e_date = trail.e_date
+    inserted = 0
+
+    reduced_chunks = LevelOfDetail.stored_signal_track(trail)
+
+    # The motion metrics of the new signals continue from the last signal of
+    # the trail which is already in the database. In the bucket layout this is
+    # the newest signal of the newest bucket.
+    if STORAGE_LAYOUT == "buckets":
+        bucket = TrailModel.SignalBucket.objects(trail = trail, start__ne = None) \
+                                        .order_by('-start').first()
+        previous = MotionMetrics.bucket_state(bucket, 'time', trail.total_distance)
+        last = None
+    else:
+        last = TrailModel.Signal.objects(trail = trail).order_by('-time').first()
+        previous = MotionMetrics.stored_state(last, 'time')
+    totals = MotionMetrics.new_totals(trail.total_distance,
+                                      trail.moving_time,
+                                      trail.max_speed)
+    extent = TrackSummary.stored_extent(trail)
+
+    # The sequence numbers of the new signals continue after the last signal
+    # of the trail. They are not stored in the bucket layout.
+    first_seq = BulkLoader.next_seq(last, trail.t_points)
+
+    for df in ChunkedReader.read_chunks(location, DATASET_COLUMNS):
+
+        times = BulkLoader.milliseconds_to_datetimes(df['time'])
+
+        if cutoff is not None:
+            new = (pd.to_datetime(pd.Series(times)) > cutoff).to_numpy()
+            df = df[new].reset_index(drop=True)
+            times = times[new]
+
+        if df.empty:
+            continue
+
+        part = MotionMetrics.part_numbers(df.get('track'), df.get('segment'))
+        motion = MotionMetrics.compute_metrics(df['lon'], df['lat'], times, previous, part)
+        previous = MotionMetrics.next_state(df['lon'], df['lat'], times, motion, previous, part)
+        MotionMetrics.update_totals(totals, motion)
+        TrackSummary.update_extent(extent, df['lon'], df['lat'], df['alt'])
+
+        count = insert_signals(trail, df, times, motion, first_seq)
+        first_seq += len(df.index)
+        inserted += count
+
+        latest = pd.to_datetime(pd.Series(times)).max()
+        if pd.notnull(latest) and (e_date is None or latest > e_date):
+            e_date = latest.to_pydatetime()
+
+        # Update the trail in place.
+        trail.update(set__e_date = e_date,
+                     inc__t_points = count,
+                     **MotionMetrics.rollup_fields(totals),
+                     **TrackSummary.summary_fields(extent))
+
+        reduced_chunks.append(LevelOfDetail.reduce_chunk(df['lon'],
+                                                         df['lat'],
+                                                         df['alt'],
+                                                         times))
+
+    print("Added " + str(inserted) + " new trackpoints to: " + str(name))
+
+    if inserted > 0:
+        LevelOfDetail.create_signal_levels(trail,
+                                           *LevelOfDetail.combine_chunks(reduced_chunks))
+
+    return inserted
+
+
+# Here we create a function called: "load_dataset".
+# The function imports the dataset at the location passed as parameter, using
+# the mode defined by INGEST_MODE, and returns the amount of signals.
+# The location is the name of the file without the folder and the extension,
+# the folder and extension are added depending on DATASET_FORMAT.
+def load_dataset(location,name,abreviation,type):
+
+    location = DATASET_FOLDERS[DATASET_FORMAT] + location + '.' + DATASET_FORMAT
+
+    # Add the new signals to the trail if a trail with the same name exists.
+    if INCREMENTAL_IMPORT:
+        trail = TrailModel.Trail.objects(name = name).first()
+
+        if trail is not None:
+            return append_data(trail,location,name)
+
+    if INGEST_MODE == "chunked":
+        return load_data_chunked(location,name,abreviation,type)
+    else:
+        return load_data(read_dataset(location),name,abreviation,type)
+
+
+# Here we create a function called: "read_dataset".
+# The function reads a complete dataset. Only the columns which are used are
+# read from a Parquet dataset, through memory mapping.
+def read_dataset(location):
+
+    if ChunkedReader.is_parquet(location):
+        return ParquetStorage.read_parquet(location, DATASET_COLUMNS)
+
+    return pd.read_json(location)
 
 
 # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
@@ -54,22 +341,42 @@ def load_data(df,name,abreviation,type):
 #                                                                             #
 # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
 
+# The datasets which are imported. Each dataset contains the name of the
+# converted file, the name, the abbreviation and the type of the route.
+DATASETS = [
+    ('Trail_Biesbosch','Biesbosch','B','Boat & Hike'),
+    ('Trail_ZeelandMNV',"Zeeland Camper",'ZC',"Car"),
+    ('Trail-Biesbosch-Libellen',"Biesbosch Libellen",'BL',"Hike"),
+    ('Trail-Hamert-Hike',"Hamert Hike",'HH',"Hike"),
+    ('Trail-Hamert-Bike',"Hamert Bike",'HB',"Bike"),
+]
+
 def import_data():
-    connect('Trail_Database')
 
     print("Starting import")
 
-    load_data(pd.read_json('~/Geostack/datasets/JSON/Trail_JSON/Trail_Biesbosch.json'),'Biesbosch','B','Boat & Hike')
-    load_data(pd.read_json('~/Geostack/datasets/JSON/Trail_JSON/Trail_ZeelandMNV.json'),"Zeeland Camper",'ZC',"Car")
-    load_data(pd.read_json('~/Geostack/datasets/JSON/Trail_JSON/Trail-Biesbosch-Libellen.json'),"Biesbosch Libellen",'BL',"Hike")
-    load_data(pd.read_json('~/Geostack/datasets/JSON/Trail_JSON/Trail-Hamert-Hike.json'),"Hamert Hike",'HH',"Hike")
-    load_data(pd.read_json('~/Geostack/datasets/JSON/Trail_JSON/Trail-Hamert-Bike.json'),"Hamert Bike",'HB',"Bike")
+    # The unique indexes have to exist before the signals are inserted. The
+    # other indexes are built once, after all the datasets are imported. The
+    # connection is closed before the worker processes are started, since a
+    # connection can't be shared between processes.
+    connect('Trail_Database')
+    DatabaseIndexes.prepare_indexes(DatabaseIndexes.TRAIL_INDEXES)
+    disconnect()
+
+    # Import the datasets in IMPORT_WORKERS processes at the same time.
+    ParallelImport.import_datasets('Trail_Database', load_dataset,
+                                   DATASETS, IMPORT_WORKERS)
 
+    # Build the other indexes, now all the datasets are imported.
+    connect('Trail_Database')
+    DatabaseIndexes.update_indexes(DatabaseIndexes.TRAIL_INDEXES)
 
-    TrailModel.Signal.create_index(("trail"))
-    TrailModel.Signal.create_index(("time"))
-    TrailModel.Signal.create_index(("geometry.coord"))
+    # The cached results of the Flask-API are no longer valid.
+    DatasetVersion.bump_version()
 
     print('Done importing')
 
-import_data()
+# The import only starts when this file is run as a script. This is required
+# since the worker processes may import this file to find load_dataset().
+if __name__ == '__main__':
+    import_data()
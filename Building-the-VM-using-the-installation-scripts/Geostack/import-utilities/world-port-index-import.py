@@ -1,13 +1,15 @@
-import psycopg2
 import os
 
-os.system('PGPASSWORD="geostack" createdb "World_Port_Index_Database" -h localhost -p 5432 -U postgres')
+# Here we import the WorldPortIndexDatabase Python file, which contains the
+# connection parameters of the World Port Index database.
+import WorldPortIndexDatabase
+from WorldPortIndexDatabase import WPI_PARAMETERS
 
-conn = psycopg2.connect(host='localhost',
-                        dbname='World_Port_Index_Database',
-                        user='postgres',
-                        password='geostack',
-                        port=5432)
+password, options = WorldPortIndexDatabase.command_options()
+
+os.system(password + ' createdb "' + WPI_PARAMETERS["dbname"] + '" ' + options)
+
+conn = WorldPortIndexDatabase.connect_wpi()
 
 cursor = conn.cursor()
 
@@ -17,4 +19,4 @@ conn.commit()
 conn.close()
 
 
-os.system('shp2pgsql -I -s 4326 "/home/geostack/Geostack/datasets/SHP/World-Port-Index/WPI.shp" WPI | PGPASSWORD="geostack" psql -h localhost -p 5432 -U postgres -d World_Port_Index_Database')
+os.system('shp2pgsql -I -s 4326 "/home/geostack/Geostack/datasets/SHP/World-Port-Index/WPI.shp" WPI | ' + password + ' psql ' + options + ' -d ' + WPI_PARAMETERS["dbname"])
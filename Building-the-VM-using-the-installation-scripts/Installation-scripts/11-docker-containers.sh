@@ -39,6 +39,13 @@ sleep 2
 # Run the Python script used to import the World Port Index dataset.
 python3 ~/Geostack/import-utilities/world-port-index-import.py
 
+
+echo "-------------->>>> Joining the Crane transmissions with the nearest port <<<<--------------"
+sleep 2
+
+# Run the Python script used to store the nearest port on every Crane transmission.
+python3 ~/Geostack/import-utilities/nearest-port-join.py
+
 echo "-------------->>>> Importing the OSM Base map shapefiles <<<<--------------"
 sleep 2
 # Importing the OSM Base map shapefiles from openstreetmap-carto by calling the get-external-data.py script in the Running Docker container
@@ -43,5 +43,10 @@ sleep 2
 # Install GPXPY geopy and numpy
 pip3 install gpxpy geopy numpy
 
+echo "-------------->>>> Installing PyArrow <<<<--------------"
+sleep 2
+# Install PyArrow, which is used to store the converted datasets as Parquet
+pip3 install pyarrow
+
 echo "-------------->>>> DONE <<<<--------------"
 sleep 2
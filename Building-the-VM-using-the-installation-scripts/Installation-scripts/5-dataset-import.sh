@@ -28,4 +28,11 @@ sleep 2
 python3 ~/Geostack/import-utilities/world-port-index-import.py
 
 
+echo "-------------->>>> Joining the Crane transmissions with the nearest port <<<<--------------"
+sleep 2
+
+# Run the Python script used to store the nearest port on every Crane transmission.
+python3 ~/Geostack/import-utilities/nearest-port-join.py
+
+
 echo "-------------->>>> DONE <<<<--------------"
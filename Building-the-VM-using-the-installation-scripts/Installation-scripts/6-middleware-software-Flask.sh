@@ -25,4 +25,10 @@ sleep 2
 # Install Flask-pymongo using python pip 3
 pip3 install flask-pymongo
 
+echo "-------------->>>> Installing Mapbox Vector Tile <<<<--------------"
+sleep 2
+# Install mapbox-vector-tile, which is used to create the vector tiles of the
+# crane and trail data.
+pip3 install mapbox-vector-tile
+
 echo "-------------->>>> DONE <<<<--------------"